@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the BM25 engine in core.py against the original full-scan implementation
+on a synthetic CSV (default 100k rows).
+
+Usage: python bench_bm25.py [--rows 100000] [--queries 50] [--legacy-queries 5] [--seed 1]
+"""
+
+import argparse
+import csv
+import itertools
+import random
+import tempfile
+import time
+from collections import defaultdict
+from math import log
+from pathlib import Path
+
+import core
+
+
+class LegacyBM25:
+    """The original implementation: per-query full corpus scan, per-document tf rebuild, full sort"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.corpus = []
+        self.doc_lengths = []
+        self.avgdl = 0
+        self.idf = {}
+        self.doc_freqs = defaultdict(int)
+        self.N = 0
+
+    tokenize = core.BM25.tokenize
+
+    def fit(self, documents):
+        self.corpus = [self.tokenize(doc) for doc in documents]
+        self.N = len(self.corpus)
+        if self.N == 0:
+            return
+        self.doc_lengths = [len(doc) for doc in self.corpus]
+        self.avgdl = sum(self.doc_lengths) / self.N
+        for doc in self.corpus:
+            for word in set(doc):
+                self.doc_freqs[word] += 1
+        for word, freq in self.doc_freqs.items():
+            self.idf[word] = log((self.N - freq + 0.5) / (freq + 0.5) + 1)
+
+    def score(self, query):
+        query_tokens = self.tokenize(query)
+        scores = []
+        for idx, doc in enumerate(self.corpus):
+            score = 0
+            doc_len = self.doc_lengths[idx]
+            term_freqs = defaultdict(int)
+            for word in doc:
+                term_freqs[word] += 1
+            for token in query_tokens:
+                if token in self.idf:
+                    tf = term_freqs[token]
+                    idf = self.idf[token]
+                    numerator = tf * (self.k1 + 1)
+                    denominator = tf + self.k1 * (1 - self.b + self.b * doc_len / self.avgdl)
+                    score += idf * numerator / denominator
+            scores.append((idx, score))
+        return sorted(scores, key=lambda x: x[1], reverse=True)
+
+
+def make_vocab(rng, size):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def write_csv(path, rows, rng):
+    """Zipf-like term distribution so common terms have long postings lists, like real style guides"""
+    vocab = make_vocab(rng, 20000)
+    cum_weights = list(itertools.accumulate(1 / (i + 1) for i in range(len(vocab))))
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, ["Name", "Keywords", "Description", "Notes"])
+        writer.writeheader()
+        for i in range(rows):
+            writer.writerow({
+                "Name": f"Item {i}",
+                "Keywords": ", ".join(rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(3, 8))),
+                "Description": " ".join(rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(10, 30))),
+                "Notes": " ".join(rng.choices(vocab, cum_weights=cum_weights, k=5)),
+            })
+    return vocab, cum_weights
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def per_query(fn, queries):
+    start = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def fmt(seconds):
+    return f"{seconds * 1000:10.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--legacy-queries", type=int, default=5, help="Queries for the (slow) original scorer")
+    parser.add_argument("--k", type=int, default=core.MAX_RESULTS)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    search_cols = ["Name", "Keywords", "Description"]
+    with tempfile.TemporaryDirectory() as tmp:
+        core.CACHE_DIR = Path(tmp) / "cache"
+        path = Path(tmp) / "synthetic.csv"
+        vocab, cum_weights = write_csv(path, args.rows, rng)
+        # Mix of frequent and rare terms, 2-4 per query
+        queries = [" ".join(rng.choices(vocab[:2000], cum_weights=cum_weights[:2000], k=rng.randint(2, 4))) for _ in range(args.queries)]
+        documents = [" ".join(row.get(c, "") for c in search_cols) for row in core._load_csv(path)]
+        print(f"{args.rows} rows, {len(queries)} queries, k={args.k}, numpy={'yes' if core._get_numpy() else 'no'}\n")
+
+        legacy = LegacyBM25()
+        t_fit, _ = timed(lambda: legacy.fit(documents))
+        print(f"legacy fit                 {fmt(t_fit)}")
+        t_q, legacy_results = per_query(lambda q: legacy.score(q)[:args.k], queries[:args.legacy_queries])
+        print(f"legacy score + sort        {fmt(t_q)} / query")
+
+        bm25 = core.BM25()
+        t_fit, _ = timed(lambda: bm25.fit(documents))
+        print(f"postings fit               {fmt(t_fit)}")
+
+        threshold = core.NUMPY_MIN_POSTINGS
+        core.NUMPY_MIN_POSTINGS = float("inf")
+        t_q, python_results = per_query(lambda q: bm25.top_k(q, args.k), queries)
+        print(f"postings top-k (python)    {fmt(t_q)} / query")
+        core.NUMPY_MIN_POSTINGS = threshold
+        np = core._get_numpy()
+        if np:
+            t_q, numpy_results = per_query(lambda q: bm25._top_k_numpy(np, bm25._query_terms(q), args.k), queries)
+            print(f"postings top-k (numpy)     {fmt(t_q)} / query")
+            assert [[i for i, _ in r] for r in numpy_results] == [[i for i, _ in r] for r in python_results], "numpy/python mismatch"
+
+        for old, new in zip(legacy_results, python_results):
+            assert [(i, s) for i, s in old if s > 0] == new, "legacy/postings ranking mismatch"
+        print("rankings match the original implementation\n")
+
+        core._INDEXES.clear()
+        t_build, _ = timed(lambda: core._load_index(path, search_cols))
+        print(f"_load_index: CSV + fit     {fmt(t_build)}")
+        core._INDEXES.clear()
+        t_disk, _ = timed(lambda: core._load_index(path, search_cols))
+        print(f"_load_index: disk cache    {fmt(t_disk)}")
+        t_mem, _ = timed(lambda: core._load_index(path, search_cols), repeat=100)
+        print(f"_load_index: in memory     {fmt(t_mem)}")
+
+
+if __name__ == "__main__":
+    main()
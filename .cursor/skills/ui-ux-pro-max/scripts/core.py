@@ -5,14 +5,26 @@ UI/UX Pro Max Core - BM25 search engine for UI/UX style guides
 """
 
 import csv
+import hashlib
+import heapq
+import os
+import pickle
 import re
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from math import log
-from collections import defaultdict
+from collections import Counter, defaultdict
 
 # ============ CONFIGURATION ============
 DATA_DIR = Path(__file__).parent.parent / "data"
+# Pre-built BM25 indexes, one pickle per CSV, invalidated by file mtime + size
+CACHE_DIR = Path(os.environ.get("UIPRO_CACHE_DIR") or Path(__file__).parent.parent / ".index-cache")
+INDEX_VERSION = 3
 MAX_RESULTS = 3
+# Use the NumPy scoring path once a query touches this many postings (and NumPy is installed)
+NUMPY_MIN_POSTINGS = 5000
+_numpy = None
 
 CSV_CONFIG = {
     "style": {
@@ -93,18 +105,37 @@ AVAILABLE_STACKS = list(STACK_CONFIG.keys())
 
 
 # ============ BM25 IMPLEMENTATION ============
+def _get_numpy():
+    """NumPy is optional and imported only when a large query needs it (keeps CLI startup fast)"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy
+
+
 class BM25:
-    """BM25 ranking algorithm for text search"""
+    """BM25 ranking algorithm for text search.
+
+    Inverted index: term -> (doc ids, numerators, denominators) of the document's BM25 term-frequency
+    component tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)), precomputed at fit time. A query is then
+    idf * numerator / denominator accumulated term-at-a-time over the postings of its terms, followed by a
+    top-k heap. Each term is evaluated with exactly the original per-document expression and added in query
+    order, so scores (and therefore the order of tied documents) are bit-identical to a full scan.
+    """
 
     def __init__(self, k1=1.5, b=0.75):
         self.k1 = k1
         self.b = b
-        self.corpus = []
+        self.postings = {}
         self.doc_lengths = []
         self.avgdl = 0
         self.idf = {}
-        self.doc_freqs = defaultdict(int)
         self.N = 0
+        self._np_postings = {}
 
     def tokenize(self, text):
         """Lowercase, split, remove punctuation, filter short words"""
@@ -112,47 +143,94 @@ class BM25:
         return [w for w in text.split() if len(w) > 2]
 
     def fit(self, documents):
-        """Build BM25 index from documents"""
-        self.corpus = [self.tokenize(doc) for doc in documents]
-        self.N = len(self.corpus)
+        """Build BM25 index from documents: postings with precomputed term weights, doc lengths, IDF"""
+        doc_term_freqs = []
+        self.doc_lengths = []
+        for doc in documents:
+            tokens = self.tokenize(doc)
+            self.doc_lengths.append(len(tokens))
+            doc_term_freqs.append(Counter(tokens))
+
+        self.N = len(self.doc_lengths)
+        self.postings = {}
+        self.idf = {}
+        self._np_postings = {}
         if self.N == 0:
             return
-        self.doc_lengths = [len(doc) for doc in self.corpus]
         self.avgdl = sum(self.doc_lengths) / self.N
 
-        for doc in self.corpus:
-            seen = set()
-            for word in doc:
-                if word not in seen:
-                    self.doc_freqs[word] += 1
-                    seen.add(word)
-
-        for word, freq in self.doc_freqs.items():
+        k1, b, avgdl = self.k1, self.b, self.avgdl
+        postings = defaultdict(lambda: ([], [], []))
+        for idx, term_freqs in enumerate(doc_term_freqs):
+            norm = k1 * (1 - b + b * self.doc_lengths[idx] / avgdl)
+            for word, tf in term_freqs.items():
+                doc_ids, numerators, denominators = postings[word]
+                doc_ids.append(idx)
+                numerators.append(tf * (k1 + 1))
+                denominators.append(tf + norm)
+
+        # Compact typed arrays: small pickles, and zero-copy views for the NumPy path
+        for word, (doc_ids, numerators, denominators) in postings.items():
+            self.postings[word] = (array('i', doc_ids), array('d', numerators), array('d', denominators))
+            freq = len(doc_ids)
             self.idf[word] = log((self.N - freq + 0.5) / (freq + 0.5) + 1)
 
-    def score(self, query):
-        """Score all documents against query"""
-        query_tokens = self.tokenize(query)
-        scores = []
-
-        for idx, doc in enumerate(self.corpus):
-            score = 0
-            doc_len = self.doc_lengths[idx]
-            term_freqs = defaultdict(int)
-            for word in doc:
-                term_freqs[word] += 1
-
-            for token in query_tokens:
-                if token in self.idf:
-                    tf = term_freqs[token]
-                    idf = self.idf[token]
-                    numerator = tf * (self.k1 + 1)
-                    denominator = tf + self.k1 * (1 - self.b + self.b * doc_len / self.avgdl)
-                    score += idf * numerator / denominator
+    def _query_terms(self, query):
+        return [(token, self.postings[token], self.idf[token]) for token in self.tokenize(query) if token in self.postings]
+
+    def _accumulate(self, terms):
+        scores = {}
+        get = scores.get
+        for _, (doc_ids, numerators, denominators), idf in terms:
+            for idx, numerator, denominator in zip(doc_ids, numerators, denominators):
+                scores[idx] = get(idx, 0.0) + idf * numerator / denominator
+        return scores
+
+    def _top_k_numpy(self, np, terms, k):
+        scores = np.zeros(self.N)
+        for token, (doc_ids, numerators, denominators), idf in terms:
+            arrays = self._np_postings.get(token)
+            if arrays is None:
+                arrays = self._np_postings[token] = (np.frombuffer(doc_ids, dtype=np.intc), np.frombuffer(numerators),
+                                                     np.frombuffer(denominators))
+            # doc ids are unique within a postings list, so fancy-index += is safe
+            scores[arrays[0]] += idf * arrays[1] / arrays[2]
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            # keep everything tied with the k-th score so ties still resolve by doc index
+            kth = np.partition(scores[candidates], len(candidates) - k)[len(candidates) - k]
+            candidates = candidates[scores[candidates] >= kth]
+        order = np.lexsort((candidates, -scores[candidates]))[:k]
+        return [(int(candidates[i]), float(scores[candidates[i]])) for i in order]
 
-            scores.append((idx, score))
-
-        return sorted(scores, key=lambda x: x[1], reverse=True)
+    def score(self, query):
+        """Score all documents matching at least one query term, best first (score-0 documents are omitted)"""
+        scores = self._accumulate(self._query_terms(query))
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+    def top_k(self, query, k):
+        """Best k (doc index, score) pairs, ties broken by doc index"""
+        terms = self._query_terms(query)
+        if not terms or k <= 0:
+            return []
+        if sum(len(t[1][0]) for t in terms) >= NUMPY_MIN_POSTINGS:
+            np = _get_numpy()
+            if np:
+                return self._top_k_numpy(np, terms, k)
+        scores = self._accumulate(terms)
+        return heapq.nsmallest(k, scores.items(), key=lambda x: (-x[1], x[0]))
+
+    def to_state(self):
+        """Plain-data snapshot for the on-disk cache"""
+        return {"k1": self.k1, "b": self.b, "postings": self.postings, "doc_lengths": self.doc_lengths,
+                "avgdl": self.avgdl, "idf": self.idf, "N": self.N}
+
+    @classmethod
+    def from_state(cls, state):
+        bm25 = cls(state["k1"], state["b"])
+        for key in ("postings", "doc_lengths", "avgdl", "idf", "N"):
+            setattr(bm25, key, state[key])
+        return bm25
 
 
 # ============ SEARCH FUNCTIONS ============
@@ -162,24 +240,82 @@ def _load_csv(filepath):
         return list(csv.DictReader(f))
 
 
+# In-process indexes: (filepath, search_cols) -> (signature, rows, bm25)
+_INDEXES = {}
+
+
+def _index_cache_path(filepath, search_cols):
+    key = hashlib.sha1(f"{filepath.resolve()}|{'|'.join(search_cols)}".encode("utf-8")).hexdigest()[:16]
+    return CACHE_DIR / f"{filepath.stem}-{key}.pickle"
+
+
+def _read_index_cache(cache_path, signature):
+    try:
+        with open(cache_path, 'rb') as f:
+            state = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(state, dict) or state.get("version") != INDEX_VERSION or state.get("signature") != signature:
+        return None
+    return state["rows"], BM25.from_state(state["bm25"])
+
+
+def _write_index_cache(cache_path, signature, rows, bm25):
+    """Best effort: a read-only skill directory just means no disk cache"""
+    tmp = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(tmp, 'wb') as f:
+            pickle.dump({"version": INDEX_VERSION, "signature": signature, "rows": rows, "bm25": bm25.to_state()},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def _load_index(filepath, search_cols):
+    """Return (rows, bm25) for a CSV, built once and reused from memory or the disk cache
+    until the file's mtime or size changes"""
+    st = filepath.stat()
+    signature = (st.st_mtime_ns, st.st_size)
+    key = (str(filepath), tuple(search_cols))
+
+    cached = _INDEXES.get(key)
+    if cached and cached[0] == signature:
+        return cached[1], cached[2]
+
+    cache_path = _index_cache_path(filepath, search_cols)
+    loaded = _read_index_cache(cache_path, signature)
+    if loaded:
+        rows, bm25 = loaded
+    else:
+        rows = _load_csv(filepath)
+        # Build documents from search columns
+        documents = [" ".join(str(row.get(col, "")) for col in search_cols) for row in rows]
+        bm25 = BM25()
+        bm25.fit(documents)
+        _write_index_cache(cache_path, signature, rows, bm25)
+
+    _INDEXES[key] = (signature, rows, bm25)
+    return rows, bm25
+
+
 def _search_csv(filepath, search_cols, output_cols, query, max_results):
     """Core search function using BM25"""
     if not filepath.exists():
         return []
 
-    data = _load_csv(filepath)
-
-    # Build documents from search columns
-    documents = [" ".join(str(row.get(col, "")) for col in search_cols) for row in data]
+    data, bm25 = _load_index(filepath, search_cols)
 
     # BM25 search
-    bm25 = BM25()
-    bm25.fit(documents)
-    ranked = bm25.score(query)
+    ranked = bm25.top_k(query, max_results)
 
     # Get top results with score > 0
     results = []
-    for idx, score in ranked[:max_results]:
+    for idx, score in ranked:
         if score > 0:
             row = data[idx]
             results.append({col: row.get(col, "") for col in output_cols if col in row})
@@ -187,6 +323,18 @@ def _search_csv(filepath, search_cols, output_cols, query, max_results):
     return results
 
 
+def warm_indexes():
+    """Load every domain and stack index into memory (search daemon startup); returns how many were loaded"""
+    sources = [(DATA_DIR / c["file"], c["search_cols"]) for c in CSV_CONFIG.values()]
+    sources += [(DATA_DIR / c["file"], _STACK_COLS["search_cols"]) for c in STACK_CONFIG.values()]
+    loaded = 0
+    for filepath, search_cols in sources:
+        if filepath.exists():
+            _load_index(filepath, search_cols)
+            loaded += 1
+    return loaded
+
+
 def detect_domain(query):
     """Auto-detect the most relevant domain from query"""
     query_lower = query.lower()
@@ -251,3 +399,67 @@ def search_stack(query, stack, max_results=MAX_RESULTS):
         "count": len(results),
         "results": results
     }
+
+
+# ============ BATCH SEARCH ============
+def _batch_item_error(item):
+    """Why a batch item cannot be run, or None if it is well-formed"""
+    if not isinstance(item, dict):
+        return "Batch item must be a JSON object"
+    query = item.get("query")
+    if not isinstance(query, str) or not query.strip():
+        return "Missing query"
+    for key in ("domain", "stack"):
+        if item.get(key) is not None and not isinstance(item[key], str):
+            return f"{key} must be a string"
+    max_results = item.get("max_results")
+    if max_results is not None and (isinstance(max_results, bool) or not isinstance(max_results, int) or max_results < 1):
+        return "max_results must be a positive integer"
+    return None
+
+
+def _index_source(item):
+    """(filepath, search_cols) of the index a batch item will search, or None"""
+    if _batch_item_error(item):
+        return None
+    if item.get("stack"):
+        config = STACK_CONFIG.get(item["stack"])
+        return (DATA_DIR / config["file"], _STACK_COLS["search_cols"]) if config else None
+    domain = item.get("domain") or detect_domain(item["query"])
+    config = CSV_CONFIG.get(domain, CSV_CONFIG["style"])
+    return DATA_DIR / config["file"], config["search_cols"]
+
+
+def search_one(item):
+    """Run one batch item: {"query": ..., "domain" or "stack": ..., "max_results": ...}"""
+    error = _batch_item_error(item)
+    if error:
+        return {"error": error}
+    query = item["query"]
+    max_results = item.get("max_results") or MAX_RESULTS
+    if item.get("stack"):
+        return search_stack(query, item["stack"], max_results)
+    return search(query, item.get("domain"), max_results)
+
+
+def search_many(queries, workers=1):
+    """Run many searches against one shared set of indexes, yielding results in input order.
+
+    Each CSV is indexed (or loaded from the disk cache) once for the whole batch. With workers > 1,
+    the distinct indexes are loaded concurrently and the queries run in a thread pool.
+    """
+    queries = list(queries)
+    if workers <= 1:
+        for item in queries:
+            yield search_one(item)
+        return
+
+    sources = {}
+    for item in queries:
+        source = _index_source(item)
+        if source and source[0].exists():
+            sources[(str(source[0]), tuple(source[1]))] = source
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Load every distinct index first so that concurrent queries never build the same one twice
+        list(pool.map(lambda source: _load_index(*source), sources.values()))
+        yield from pool.map(search_one, queries)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UI/UX Pro Max Search Daemon - keeps every domain and stack index resident and answers
+JSON-lines requests over a Unix socket (or stdin/stdout)
+
+Start:    python search.py --serve [--socket PATH]        (or: python search.py --serve --stdio)
+Requests: {"query": "glassmorphism dark", "domain": "style", "max_results": 3}
+          {"query": "form validation", "stack": "react"}
+          {"op": "ping"}
+Replies:  one JSON line per request, same shape as core.search / core.search_stack
+
+search.py uses a running daemon automatically and falls back to in-process search when
+none is reachable (UIPRO_DAEMON=0 always searches in-process).
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from core import search_one, warm_indexes
+
+_USER = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "user")
+SOCKET_PATH = Path(os.environ.get("UIPRO_SOCKET") or Path(tempfile.gettempdir()) / f"ui-ux-pro-max-{_USER}.sock")
+CLIENT_TIMEOUT = 10
+
+
+# ============ SERVER ============
+def handle_request(payload):
+    """Answer one decoded request"""
+    if isinstance(payload, dict) and payload.get("op") == "ping":
+        return {"ok": True, "pid": os.getpid()}
+    return search_one(payload)
+
+
+def _respond(line):
+    try:
+        result = handle_request(json.loads(line))
+    except Exception as e:  # bad JSON or a failing lookup must not take the daemon down
+        result = {"error": f"{type(e).__name__}: {e}"}
+    return json.dumps(result, ensure_ascii=False) + "\n"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode("utf-8").strip()
+            if line:
+                self.wfile.write(_respond(line).encode("utf-8"))
+
+
+def _warm():
+    start = time.perf_counter()
+    loaded = warm_indexes()
+    print(f"Loaded {loaded} indexes in {(time.perf_counter() - start) * 1000:.0f} ms", file=sys.stderr)
+
+
+def serve_stdio():
+    """Serve JSON lines on stdin/stdout until EOF"""
+    _warm()
+    for line in sys.stdin:
+        line = line.strip()
+        if line:
+            sys.stdout.write(_respond(line))
+            sys.stdout.flush()
+
+
+def serve_unix(path=SOCKET_PATH):
+    """Serve JSON lines on a Unix socket until interrupted"""
+    if not hasattr(socket, "AF_UNIX"):
+        sys.exit("Unix sockets are not available on this platform; use --serve --stdio")
+    path = Path(path)
+    if path.exists():
+        if request({"op": "ping"}, path):
+            sys.exit(f"A search daemon is already running on {path}")
+        path.unlink()  # stale socket from a daemon that did not exit cleanly
+
+    _warm()
+    server = socketserver.ThreadingUnixStreamServer(str(path), _Handler)
+    server.daemon_threads = True
+    os.chmod(path, 0o600)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # clean up the socket on kill too
+    print(f"Listening on {path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+
+
+# ============ CLIENT ============
+def request(payload, path=SOCKET_PATH, timeout=CLIENT_TIMEOUT):
+    """Send one request to a running daemon. Returns None when no daemon is reachable,
+    so the caller can search in-process instead."""
+    replies = request_many([payload], path, timeout)
+    return replies[0] if replies else None
+
+
+def _send_all(sock, data):
+    try:
+        sock.sendall(data)
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass  # the reader sees the short reply stream and reports the daemon as unreachable
+
+
+def request_many(payloads, path=SOCKET_PATH, timeout=CLIENT_TIMEOUT):
+    """Pipeline several requests over one connection; replies come back in order.
+    Returns None when no daemon is reachable."""
+    if os.environ.get("UIPRO_DAEMON") == "0" or not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            data = "".join(json.dumps(p, ensure_ascii=False) + "\n" for p in payloads).encode("utf-8")
+            # Send from a separate thread while replies are read here: once a batch outgrows the
+            # socket buffers, the daemon blocks on replies that nobody would read until sending ended
+            writer = threading.Thread(target=_send_all, args=(sock, data), daemon=True)
+            writer.start()
+            with sock.makefile("rb") as f:
+                replies = [json.loads(line) for line in f]
+            writer.join()
+        return replies if len(replies) == len(payloads) else None
+    except (OSError, ValueError):
+        return None
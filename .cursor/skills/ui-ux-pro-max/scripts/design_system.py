@@ -16,6 +16,8 @@ Usage:
 import csv
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from core import search, DATA_DIR
@@ -33,11 +35,39 @@ SEARCH_CONFIG = {
 }
 
 
+# ============ SEARCH SESSION ============
+class SearchSession:
+    """Searches for one generation run: independent domains run concurrently, and identical
+    (query, domain, max_results) lookups share one result. The BM25 indexes themselves are
+    loaded once per process by core and shared by every session."""
+
+    def __init__(self, max_workers: int = len(SEARCH_CONFIG)):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def submit(self, query: str, domain: str, max_results: int):
+        """Start a search (or join an identical one already started); returns a Future."""
+        key = (query, domain, max_results)
+        with self._lock:
+            future = self._memo.get(key)
+            if future is None:
+                future = self._memo[key] = self._pool.submit(search, query, domain, max_results)
+        return future
+
+    def search(self, query: str, domain: str, max_results: int) -> dict:
+        return self.submit(query, domain, max_results).result()
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+
 # ============ DESIGN SYSTEM GENERATOR ============
 class DesignSystemGenerator:
     """Generates design system recommendations from aggregated searches."""
 
-    def __init__(self):
+    def __init__(self, session: SearchSession = None):
+        self.session = session or SearchSession()
         self.reasoning_data = self._load_reasoning()
 
     def _load_reasoning(self) -> list:
@@ -49,17 +79,17 @@ class DesignSystemGenerator:
             return list(csv.DictReader(f))
 
     def _multi_domain_search(self, query: str, style_priority: list = None) -> dict:
-        """Execute searches across multiple domains."""
-        results = {}
+        """Execute searches across multiple domains concurrently."""
+        futures = {}
         for domain, config in SEARCH_CONFIG.items():
             if domain == "style" and style_priority:
                 # For style, also search with priority keywords
                 priority_query = " ".join(style_priority[:2]) if style_priority else query
                 combined_query = f"{query} {priority_query}"
-                results[domain] = search(combined_query, domain, config["max_results"])
+                futures[domain] = self.session.submit(combined_query, domain, config["max_results"])
             else:
-                results[domain] = search(query, domain, config["max_results"])
-        return results
+                futures[domain] = self.session.submit(query, domain, config["max_results"])
+        return {domain: future.result() for domain, future in futures.items()}
 
     def _find_reasoning_rule(self, category: str) -> dict:
         """Find matching reasoning rule for a category."""
@@ -162,8 +192,12 @@ class DesignSystemGenerator:
 
     def generate(self, query: str, project_name: str = None) -> dict:
         """Generate complete design system recommendation."""
-        # Step 1: First search product to get category
-        product_result = search(query, "product", 1)
+        # Step 1: Search product to get category. Domains that don't depend on it start right away;
+        # _multi_domain_search picks up the same lookups from the session.
+        for domain, config in SEARCH_CONFIG.items():
+            if domain != "style":
+                self.session.submit(query, domain, config["max_results"])
+        product_result = self.session.search(query, "product", SEARCH_CONFIG["product"]["max_results"])
         product_results = product_result.get("results", [])
         category = "General"
         if product_results:
@@ -475,12 +509,16 @@ def generate_design_system(query: str, project_name: str = None, output_format:
     Returns:
         Formatted design system string
     """
-    generator = DesignSystemGenerator()
-    design_system = generator.generate(query, project_name)
-    
-    # Persist to files if requested
-    if persist:
-        persist_design_system(design_system, page, output_dir, query)
+    session = SearchSession()
+    try:
+        generator = DesignSystemGenerator(session)
+        design_system = generator.generate(query, project_name)
+
+        # Persist to files if requested
+        if persist:
+            persist_design_system(design_system, page, output_dir, query, session=session)
+    finally:
+        session.close()
 
     if output_format == "markdown":
         return format_markdown(design_system)
@@ -488,7 +526,8 @@ def generate_design_system(query: str, project_name: str = None, output_format:
 
 
 # ============ PERSISTENCE FUNCTIONS ============
-def persist_design_system(design_system: dict, page: str = None, output_dir: str = None, page_query: str = None) -> dict:
+def persist_design_system(design_system: dict, page: str = None, output_dir: str = None, page_query: str = None,
+                          session: SearchSession = None) -> dict:
     """
     Persist design system to design-system/<project>/ folder using Master + Overrides pattern.
     
@@ -497,6 +536,7 @@ def persist_design_system(design_system: dict, page: str = None, output_dir: str
         page: Optional page name for page-specific override file
         output_dir: Optional output directory (defaults to current working directory)
         page_query: Optional query string for intelligent page override generation
+        session: Optional SearchSession to reuse for page override searches
     
     Returns:
         dict with created file paths and status
@@ -527,7 +567,7 @@ def persist_design_system(design_system: dict, page: str = None, output_dir: str
     # If page is specified, create page override file with intelligent content
     if page:
         page_file = pages_dir / f"{page.lower().replace(' ', '-')}.md"
-        page_content = format_page_override_md(design_system, page, page_query)
+        page_content = format_page_override_md(design_system, page, page_query, session)
         with open(page_file, 'w', encoding='utf-8') as f:
             f.write(page_content)
         created_files.append(str(page_file))
@@ -802,14 +842,15 @@ def format_master_md(design_system: dict) -> str:
     return "\n".join(lines)
 
 
-def format_page_override_md(design_system: dict, page_name: str, page_query: str = None) -> str:
+def format_page_override_md(design_system: dict, page_name: str, page_query: str = None,
+                            session: SearchSession = None) -> str:
     """Format a page-specific override file with intelligent AI-generated content."""
     project = design_system.get("project_name", "PROJECT")
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     page_title = page_name.replace("-", " ").replace("_", " ").title()
     
     # Detect page type and generate intelligent overrides
-    page_overrides = _generate_intelligent_overrides(page_name, page_query, design_system)
+    page_overrides = _generate_intelligent_overrides(page_name, page_query, design_system, session)
     
     lines = []
     
@@ -911,23 +952,32 @@ def format_page_override_md(design_system: dict, page_name: str, page_query: str
     return "\n".join(lines)
 
 
-def _generate_intelligent_overrides(page_name: str, page_query: str, design_system: dict) -> dict:
+def _generate_intelligent_overrides(page_name: str, page_query: str, design_system: dict,
+                                   session: SearchSession = None) -> dict:
     """
     Generate intelligent overrides based on page type using layered search.
     
     Uses the existing search infrastructure to find relevant style, UX, and layout
     data instead of hardcoded page types.
     """
-    from core import search
-    
     page_lower = page_name.lower()
     query_lower = (page_query or "").lower()
     combined_context = f"{page_lower} {query_lower}"
     
-    # Search across multiple domains for page-specific guidance
-    style_search = search(combined_context, "style", max_results=1)
-    ux_search = search(combined_context, "ux", max_results=3)
-    landing_search = search(combined_context, "landing", max_results=1)
+    # Search across multiple domains for page-specific guidance (concurrently)
+    own_session = session is None
+    if own_session:
+        session = SearchSession()
+    try:
+        style_future = session.submit(combined_context, "style", 1)
+        ux_future = session.submit(combined_context, "ux", 3)
+        landing_future = session.submit(combined_context, "landing", 1)
+        style_search = style_future.result()
+        ux_search = ux_future.result()
+        landing_search = landing_future.result()
+    finally:
+        if own_session:
+            session.close()
     
     # Extract results from search response
     style_results = style_search.get("results", [])
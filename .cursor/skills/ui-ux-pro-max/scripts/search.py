@@ -5,6 +5,8 @@ UI/UX Pro Max Search - BM25 search engine for UI/UX style guides
 Usage: python search.py "<query>" [--domain <domain>] [--stack <stack>] [--max-results 3]
        python search.py "<query>" --design-system [-p "Project Name"]
        python search.py "<query>" --design-system --persist [-p "Project Name"] [--page "dashboard"]
+       python search.py --serve [--socket PATH | --stdio]
+       python search.py --batch queries.jsonl [--workers 4]     (JSONL in, JSONL out; "-" reads stdin)
 
 Domains: style, prompt, color, chart, landing, product, ux, typography
 Stacks: html-tailwind, react, nextjs
@@ -12,13 +14,18 @@ Stacks: html-tailwind, react, nextjs
 Persistence (Master + Overrides pattern):
   --persist    Save design system to design-system/MASTER.md
   --page       Also create a page-specific override file in design-system/pages/
+
+Daemon (warm indexes, see daemon.py):
+  --serve      Keep all indexes loaded and answer JSON-lines queries on a Unix socket (or --stdio)
+               Domain and stack searches use a running daemon automatically (--no-daemon to skip)
 """
 
 import argparse
 import sys
 import io
-from core import CSV_CONFIG, AVAILABLE_STACKS, MAX_RESULTS, search, search_stack
-from design_system import generate_design_system, persist_design_system
+import json
+from core import CSV_CONFIG, AVAILABLE_STACKS, MAX_RESULTS, search_one, search_many
+import daemon
 
 # Force UTF-8 for stdout/stderr to handle emojis on Windows (cp1252 default)
 if sys.stdout.encoding and sys.stdout.encoding.lower() != 'utf-8':
@@ -53,9 +60,44 @@ def format_output(result):
     return "\n".join(output)
 
 
+def run_search(args):
+    """Domain or stack search: ask a running daemon first, fall back to searching in-process"""
+    payload = {"query": args.query, "max_results": args.max_results}
+    if args.stack:
+        payload["stack"] = args.stack
+    elif args.domain:
+        payload["domain"] = args.domain
+    result = None if args.no_daemon else daemon.request(payload, args.socket)
+    if result is None:
+        result = search_one(payload)  # same validation as the daemon, whichever side answers
+    return result
+
+
+def run_batch(args):
+    """Read {query, domain|stack, max_results} JSON lines and write one JSON result line per input line"""
+    source = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    with source:
+        items = []
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(line)  # answered with an error in its slot, keeping output aligned with input
+
+    results = None if args.no_daemon else daemon.request_many(items, args.socket)
+    if results is None:
+        results = search_many(items, args.workers)
+    for result in results:
+        sys.stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="UI Pro Max Search")
-    parser.add_argument("query", help="Search query")
+    parser.add_argument("query", nargs="?", help="Search query")
     parser.add_argument("--domain", "-d", choices=list(CSV_CONFIG.keys()), help="Search domain")
     parser.add_argument("--stack", "-s", choices=AVAILABLE_STACKS, help="Stack-specific search (html-tailwind, react, nextjs)")
     parser.add_argument("--max-results", "-n", type=int, default=MAX_RESULTS, help="Max results (default: 3)")
@@ -68,11 +110,33 @@ if __name__ == "__main__":
     parser.add_argument("--persist", action="store_true", help="Save design system to design-system/MASTER.md (creates hierarchical structure)")
     parser.add_argument("--page", type=str, default=None, help="Create page-specific override file in design-system/pages/")
     parser.add_argument("--output-dir", "-o", type=str, default=None, help="Output directory for persisted files (default: current directory)")
+    # Daemon
+    parser.add_argument("--serve", action="store_true", help="Run the search daemon with all indexes kept in memory")
+    parser.add_argument("--stdio", action="store_true", help="With --serve: answer JSON lines on stdin/stdout instead of a Unix socket")
+    parser.add_argument("--socket", type=str, default=str(daemon.SOCKET_PATH), help="Daemon socket path (default: %(default)s)")
+    parser.add_argument("--no-daemon", action="store_true", help="Always search in-process")
+    # Batch
+    parser.add_argument("--batch", type=str, default=None, metavar="FILE", help="Run a JSONL file of {query, domain|stack, max_results} (\"-\" for stdin)")
+    parser.add_argument("--workers", type=int, default=1, help="With --batch: thread pool size for in-process search")
 
     args = parser.parse_args()
 
+    if args.serve:
+        if args.stdio:
+            daemon.serve_stdio()
+        else:
+            daemon.serve_unix(args.socket)
+        sys.exit(0)
+    if args.batch:
+        run_batch(args)
+        sys.exit(0)
+    if not args.query:
+        parser.error("the following arguments are required: query")
+
     # Design system takes priority
     if args.design_system:
+        # Imported lazily: plain domain/stack searches don't need the generator
+        from design_system import generate_design_system
         result = generate_design_system(
             args.query, 
             args.project_name, 
@@ -96,19 +160,10 @@ if __name__ == "__main__":
             print(f"📖 Usage: When building a page, check design-system/{project_slug}/pages/[page].md first.")
             print(f"   If exists, its rules override MASTER.md. Otherwise, use MASTER.md.")
             print("=" * 60)
-    # Stack search
-    elif args.stack:
-        result = search_stack(args.query, args.stack, args.max_results)
-        if args.json:
-            import json
-            print(json.dumps(result, indent=2, ensure_ascii=False))
-        else:
-            print(format_output(result))
-    # Domain search
+    # Stack / domain search
     else:
-        result = search(args.query, args.domain, args.max_results)
+        result = run_search(args)
         if args.json:
-            import json
             print(json.dumps(result, indent=2, ensure_ascii=False))
         else:
             print(format_output(result))
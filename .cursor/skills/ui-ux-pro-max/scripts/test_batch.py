@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch search tests: malformed items get an error slot instead of aborting the batch,
+and large batches stream through the daemon without deadlocking.
+Usage: python3 test_batch.py
+"""
+
+import csv
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+_TMP = tempfile.TemporaryDirectory()
+os.environ["UIPRO_CACHE_DIR"] = str(Path(_TMP.name) / "cache")
+sys.path.insert(0, str(Path(__file__).parent))
+
+import core  # noqa: E402
+import daemon  # noqa: E402
+
+
+def _write_csv(path, rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+GOOD = [
+    {"query": "glassmorphism", "domain": "style"},
+    {"query": "forms", "stack": "react", "max_results": 1},
+]
+MALFORMED = [
+    ({"query": "glassmorphism", "max_results": "abc"}, "max_results must be a positive integer"),
+    ({"query": "glassmorphism", "max_results": True}, "max_results must be a positive integer"),
+    ({"query": "glassmorphism", "max_results": 0}, "max_results must be a positive integer"),
+    ({"query": "forms", "stack": ["a"]}, "stack must be a string"),
+    ({"query": "glassmorphism", "domain": {"x": 1}}, "domain must be a string"),
+    ({"query": 42}, "Missing query"),
+    (["glassmorphism"], "Batch item must be a JSON object"),
+]
+
+
+def setUpModule():
+    data_dir = Path(_TMP.name) / "data"
+    _write_csv(data_dir / "styles.csv", [
+        {"Style Category": "Glassmorphism", "Keywords": "glass blur frosted", "Best For": "dashboards", "Type": "General", "AI Prompt Keywords": ""},
+        {"Style Category": "Brutalism", "Keywords": "raw bold", "Best For": "portfolios", "Type": "General", "AI Prompt Keywords": ""},
+    ])
+    _write_csv(data_dir / "stacks" / "react.csv", [
+        {"Category": "Forms", "Guideline": "Use controlled inputs", "Description": "forms state", "Do": "", "Don't": ""},
+        {"Category": "State", "Guideline": "Lift state up", "Description": "shared state", "Do": "", "Don't": ""},
+    ])
+    global _DATA_DIR
+    _DATA_DIR, core.DATA_DIR = core.DATA_DIR, data_dir
+
+
+def tearDownModule():
+    core.DATA_DIR = _DATA_DIR
+
+
+class BatchTest(unittest.TestCase):
+    def check(self, workers):
+        items = [GOOD[0]] + [item for item, _ in MALFORMED] + [GOOD[1]]
+        results = list(core.search_many(items, workers))
+        self.assertEqual(len(results), len(items))
+        self.assertEqual(results[0]["results"][0]["Style Category"], "Glassmorphism")
+        self.assertEqual(results[-1]["count"], 1)
+        for result, (_, error) in zip(results[1:-1], MALFORMED):
+            self.assertEqual(result, {"error": error})
+
+    def test_serial(self):
+        self.check(workers=1)
+
+    def test_workers(self):
+        self.check(workers=4)
+
+
+@unittest.skipUnless(hasattr(socketserver, "ThreadingUnixStreamServer"), "Unix sockets not available")
+class DaemonBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.path = Path(_TMP.name) / "daemon.sock"
+        self.server = socketserver.ThreadingUnixStreamServer(str(self.path), daemon._Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.path.unlink(missing_ok=True)
+
+    def test_batch_larger_than_socket_buffers(self):
+        # Requests and replies both far exceed the kernel socket buffers
+        items = [dict(GOOD[i % 2], tag="x" * 200) for i in range(3000)]
+        replies = daemon.request_many(items, self.path, timeout=5)
+        self.assertIsNotNone(replies)
+        self.assertEqual(replies, list(core.search_many(items)))
+
+    def test_same_validation_as_in_process(self):
+        items = [item for item, _ in MALFORMED]
+        self.assertEqual(daemon.request_many(items, self.path), list(core.search_many(items)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BM25 tests: the postings scorer (pure Python and NumPy) returns exactly the original full-scan ranking,
+including the order of tied documents.
+Usage: python3 test_bm25.py
+"""
+
+import random
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import core  # noqa: E402
+from bench_bm25 import LegacyBM25  # noqa: E402
+
+VOCAB = ["glass", "blur", "dark", "neon", "flat", "card", "grid", "bold", "soft", "mono"]
+
+
+def _corpus(rng, rows):
+    # Tiny vocabulary and short documents: many documents tie, mathematically or up to rounding
+    return [" ".join(rng.choices(VOCAB, k=rng.randint(1, 8))) for _ in range(rows)]
+
+
+class TopKTest(unittest.TestCase):
+    def setUp(self):
+        self._threshold = core.NUMPY_MIN_POSTINGS
+
+    def tearDown(self):
+        core.NUMPY_MIN_POSTINGS = self._threshold
+
+    def check(self, numpy):
+        core.NUMPY_MIN_POSTINGS = 0 if numpy else float("inf")
+        rng = random.Random(7)
+        for _ in range(20):
+            documents = _corpus(rng, 200)
+            legacy, bm25 = LegacyBM25(), core.BM25()
+            legacy.fit(documents)
+            bm25.fit(documents)
+            for _ in range(50):
+                query = " ".join(rng.choices(VOCAB, k=rng.randint(1, 4)))
+                expected = [(i, s) for i, s in legacy.score(query)[:10] if s > 0]
+                self.assertEqual(bm25.top_k(query, 10), expected, query)
+
+    def test_python_matches_original(self):
+        self.check(numpy=False)
+
+    def test_numpy_matches_original(self):
+        if not core._get_numpy():
+            self.skipTest("NumPy not installed")
+        self.check(numpy=True)
+
+    def test_identical_documents_rank_by_index(self):
+        bm25 = core.BM25()
+        bm25.fit(["dark neon", "flat card", "neon dark", "dark neon", "soft mono"])
+        self.assertEqual([i for i, _ in bm25.top_k("neon dark", 3)], [0, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
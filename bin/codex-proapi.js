@@ -16,4 +16,4 @@ if (isGlobal) {
   process.env.CODEX_DATA_DIR = dataDir;
 }
 
-import('../src/index.js');
+import('../src/index.js').then((m) => m.main());
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""分析访问日志（data/access-log/*.jsonl，含轮转文件与 .gz）：按账号（或模型）统计请求数、取消/错误数、
+总耗时与首 token 时间的 p50/p95/p99、输出速度（tokens/s）。
+
+逐行流式读取，分位数用对数分桶直方图估算（相对误差约 2%），内存占用与日志大小无关。
+
+用法：
+  python scripts/analyze_access_log.py                       # 默认读取 $CODEX_DATA_DIR/access-log 或 data/access-log
+  python scripts/analyze_access_log.py logs/ --by model      # 按模型分组（--by account,model 组合分组）
+  python scripts/analyze_access_log.py --since 2026-01-01T00:00 --until 2026-01-02 --json
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = os.path.join(os.environ.get("CODEX_DATA_DIR") or os.path.join(ROOT, "data"), "access-log")
+
+# 对数分桶：桶 i 覆盖 (GROWTH^(i-1), GROWTH^i]
+GROWTH = 1.04
+LOG_GROWTH = math.log(GROWTH)
+
+
+class Histogram:
+    """稀疏对数分桶直方图，只保存出现过的桶"""
+
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        if value is None or value < 0:
+            return
+        i = 0 if value <= 1 else math.ceil(math.log(value) / LOG_GROWTH)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen >= rank:
+                # 取桶的几何中点
+                return GROWTH ** (i - 0.5) if i > 0 else 1.0
+        return None
+
+
+class Group:
+    __slots__ = ("requests", "canceled", "errors", "prompt_tokens", "completion_tokens", "gen_seconds", "ms", "ttft", "tps")
+
+    def __init__(self):
+        self.requests = 0
+        self.canceled = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.gen_seconds = 0.0
+        self.ms = Histogram()
+        self.ttft = Histogram()
+        self.tps = Histogram()
+
+    def add(self, rec):
+        self.requests += 1
+        status = rec.get("status") or 0
+        if rec.get("canceled"):
+            self.canceled += 1
+        elif status >= 500 or (status >= 400 and status != 499):
+            self.errors += 1
+        completion = rec.get("completion_tokens") or 0
+        self.prompt_tokens += rec.get("prompt_tokens") or 0
+        self.completion_tokens += completion
+        ms = rec.get("ms")
+        ttft = rec.get("ttft_ms")
+        self.ms.add(ms)
+        self.ttft.add(ttft)
+        if ms is not None and ttft is not None and completion > 0 and ms > ttft:
+            gen = (ms - ttft) / 1000.0
+            self.gen_seconds += gen
+            self.tps.add(completion / gen)
+
+    def summary(self):
+        def pct(h):
+            return {"p50": _round(h.percentile(50)), "p95": _round(h.percentile(95)), "p99": _round(h.percentile(99))}
+
+        return {
+            "requests": self.requests,
+            "canceled": self.canceled,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "ms": pct(self.ms),
+            "ttft_ms": pct(self.ttft),
+            "tokens_per_sec": pct(self.tps),
+            # 总体输出速度：全部输出 token / 全部生成时间
+            "tokens_per_sec_overall": _round(self.completion_tokens / self.gen_seconds) if self.gen_seconds else None,
+        }
+
+
+def _round(v):
+    return None if v is None else round(v, 1)
+
+
+def iter_files(paths):
+    """展开目录：轮转文件按名称（时间）排序，当前文件 access.jsonl 最后"""
+    for path in paths:
+        if os.path.isdir(path):
+            names = [n for n in os.listdir(path) if n.endswith(".jsonl") or n.endswith(".jsonl.gz")]
+            names.sort(key=lambda n: (n.startswith("access.jsonl"), n))
+            for name in names:
+                yield os.path.join(path, name)
+        elif os.path.exists(path):
+            yield path
+        else:
+            print("跳过不存在的路径:", path, file=sys.stderr)
+
+
+def iter_records(files):
+    """逐行解析，忽略空行与写了一半的行"""
+    for file in files:
+        opener = gzip.open if file.endswith(".gz") else open
+        with opener(file, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def in_range(records, since=None, until=None):
+    # ts 为 ISO 8601（UTC，带 Z），同格式前缀可直接按字符串比较
+    for rec in records:
+        ts = rec.get("ts") or ""
+        if since and ts < since:
+            continue
+        if until and ts >= until:
+            continue
+        yield rec
+
+
+def aggregate(records, keys):
+    groups = {}
+    for rec in records:
+        key = tuple(str(rec.get(k) or "—") for k in keys)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = Group()
+        group.add(rec)
+    return groups
+
+
+def print_table(groups, keys):
+    header = keys + ["req", "cancel", "err", "ms p50", "p95", "p99", "ttft p50", "p95", "p99", "tok/s p50", "overall"]
+    rows = []
+    for key, group in sorted(groups.items(), key=lambda kv: -kv[1].requests):
+        s = group.summary()
+        rows.append(list(key) + [
+            s["requests"], s["canceled"], s["errors"],
+            s["ms"]["p50"], s["ms"]["p95"], s["ms"]["p99"],
+            s["ttft_ms"]["p50"], s["ttft_ms"]["p95"], s["ttft_ms"]["p99"],
+            s["tokens_per_sec"]["p50"], s["tokens_per_sec_overall"],
+        ])
+    cells = [[("-" if v is None else str(v)) for v in row] for row in [header] + rows]
+    widths = [max(len(r[i]) for r in cells) for i in range(len(header))]
+    for n, row in enumerate(cells):
+        print("  ".join(v.rjust(w) if i >= len(keys) else v.ljust(w) for i, (v, w) in enumerate(zip(row, widths))))
+        if n == 0:
+            print("  ".join("-" * w for w in widths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析 codex-proapi 访问日志")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_DIR], help="日志文件或目录（默认 %(default)s）")
+    parser.add_argument("--by", default="account", help="分组字段，逗号分隔：account、model、path、status")
+    parser.add_argument("--since", help="起始时间（ISO 8601，UTC，含）")
+    parser.add_argument("--until", help="结束时间（ISO 8601，UTC，不含）")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    keys = [k.strip() for k in args.by.split(",") if k.strip()]
+    groups = aggregate(in_range(iter_records(iter_files(args.paths)), args.since, args.until), keys)
+    if not groups:
+        print("没有记录")
+        return
+    if args.json:
+        out = [dict(zip(keys, key), **group.summary()) for key, group in groups.items()]
+        json.dump(out, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_table(groups, keys)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env node
+/**
+ * SSE 解析微基准：回放一份 SSE 抓包，对比旧的 split 解析与 src/sse.js 增量解析器的吞吐（MB/s）与 GC 压力。
+ *
+ * 用法：node --expose-gc scripts/bench-sse.mjs [capture.sse] [--rounds 20] [--chunk 1024]
+ * 不传抓包文件时生成一份模拟长推理输出的 SSE（约 9 MB，结束事件携带完整输出）。
+ */
+import { readFileSync } from 'fs';
+import { PerformanceObserver, performance } from 'perf_hooks';
+import { SseParser } from '../src/sse.js';
+
+const args = process.argv.slice(2);
+function opt(name, def) {
+  const i = args.indexOf(name);
+  return i === -1 ? def : Number(args[i + 1]);
+}
+const capturePath = args.find((a, i) => !a.startsWith('--') && !String(args[i - 1] || '').startsWith('--'));
+const ROUNDS = opt('--rounds', 20);
+const CHUNK = opt('--chunk', 1024);
+const TYPES = ['response.output_text.delta'];
+
+function syntheticCapture() {
+  const lines = [];
+  const emit = (obj) => lines.push(`event: ${obj.type}\ndata: ${JSON.stringify(obj)}\n\n`);
+  emit({ type: 'response.created', response: { id: 'resp_1', status: 'in_progress' } });
+  emit({ type: 'response.output_item.added', output_index: 0, item: { id: 'msg_1', type: 'message', content: [] } });
+  const words = ['the', 'quick', 'brown', 'fox', '推理', '步骤', 'jumps', 'over', 'lazy', 'dog', '\n'];
+  let text = '';
+  for (let i = 0; i < 60_000; i++) {
+    const delta = ` ${words[i % words.length]}`;
+    text += delta;
+    emit({ type: 'response.output_text.delta', item_id: 'msg_1', output_index: 0, content_index: 0, delta });
+    if (i % 500 === 0) emit({ type: 'response.reasoning_summary_text.delta', item_id: 'rs_1', delta: 'x'.repeat(64) });
+  }
+  // 与真实后端一致：结束事件携带完整输出，单行可达数百 KB
+  const item = { id: 'msg_1', type: 'message', content: [{ type: 'output_text', text }] };
+  emit({ type: 'response.output_text.done', item_id: 'msg_1', text });
+  emit({ type: 'response.output_item.done', output_index: 0, item });
+  emit({ type: 'response.completed', response: { id: 'resp_1', status: 'completed', output: [item], usage: { input_tokens: 10, output_tokens: 60000 } } });
+  lines.push('data: [DONE]\n\n');
+  return Buffer.from(lines.join(''));
+}
+
+function splitChunks(buf, size) {
+  const chunks = [];
+  for (let i = 0; i < buf.length; i += size) chunks.push(new Uint8Array(buf.subarray(i, i + size)));
+  return chunks;
+}
+
+// 旧实现：字符串累加 + 每块 split('\n') + 每行 JSON.parse
+function legacyParse(chunks) {
+  const dec = new TextDecoder();
+  let buffer = '';
+  let n = 0;
+  for (const value of chunks) {
+    buffer += dec.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() || '';
+    for (const line of lines) {
+      if (!line.startsWith('data: ')) continue;
+      const data = line.slice(6);
+      if (data === '[DONE]') continue;
+      try {
+        const event = JSON.parse(data);
+        if (event.type === 'response.output_text.delta') n++;
+      } catch (_) {}
+    }
+  }
+  return n;
+}
+
+function incrementalParse(chunks) {
+  const parser = new SseParser({ types: TYPES });
+  let n = 0;
+  for (const value of chunks) {
+    for (const event of parser.push(value)) if (event.type === 'response.output_text.delta') n++;
+  }
+  for (const event of parser.end()) if (event.type === 'response.output_text.delta') n++;
+  return n;
+}
+
+function bench(name, fn, chunks, bytes) {
+  fn(chunks); // 预热
+  if (global.gc) global.gc();
+  let gcCount = 0;
+  let gcMs = 0;
+  const obs = new PerformanceObserver((list) => {
+    for (const e of list.getEntries()) {
+      gcCount++;
+      gcMs += e.duration;
+    }
+  });
+  obs.observe({ entryTypes: ['gc'] });
+  const heapBefore = process.memoryUsage().heapUsed;
+  const t0 = performance.now();
+  let events = 0;
+  for (let r = 0; r < ROUNDS; r++) events = fn(chunks);
+  const ms = performance.now() - t0;
+  const heapAfter = process.memoryUsage().heapUsed;
+  return new Promise((resolve) => setTimeout(() => {
+    obs.disconnect();
+    const mbps = (bytes * ROUNDS) / (1024 * 1024) / (ms / 1000);
+    console.log(
+      `${name.padEnd(12)} ${mbps.toFixed(1).padStart(8)} MB/s  ${events} events  ` +
+      `gc ${gcCount}x / ${gcMs.toFixed(1)} ms  heap Δ ${((heapAfter - heapBefore) / 1024 / 1024).toFixed(1)} MB`
+    );
+    resolve();
+  }, 100));
+}
+
+const capture = capturePath ? readFileSync(capturePath) : syntheticCapture();
+const chunks = splitChunks(capture, CHUNK);
+console.log(`capture: ${capturePath || '(synthetic)'}  ${(capture.length / 1024 / 1024).toFixed(2)} MB, ${chunks.length} chunks of ${CHUNK} B, ${ROUNDS} rounds`);
+if (!global.gc) console.log('(提示：加 --expose-gc 可让 GC 统计更稳定)');
+await bench('legacy', legacyParse, chunks, capture.length);
+await bench('incremental', incrementalParse, chunks, capture.length);
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""压测代理：asyncio + httpx 按固定并发持续发送请求，统计 RPS、首 token 时间（TTFT）与 token 间隔（ITL）分位数，
+并从 /api/stats 采样代理进程的 CPU 与内存，从 /metrics 读取故障切换与后端状态码。
+
+配合本地模拟后端使用，不消耗真实额度：
+  node scripts/mock-backend.mjs --ttft-ms 300 --tps 80 --fail-accounts bench-000
+  python scripts/loadgen.py --write-accounts 4 /tmp/bench-accounts.json
+  CODEX_ACCOUNTS_FILE=/tmp/bench-accounts.json \\
+  CODEX_BACKEND_URL=http://127.0.0.1:18080/backend-api/codex/responses npm start
+  python scripts/loadgen.py --scenario mixed --concurrency 64 --duration 30
+
+场景（--scenario）：
+  stream     流式 Chat Completions
+  nonstream  非流式 Chat Completions（TTFT 即总耗时）
+  mixed      按 --stream-ratio 混合流式与非流式
+  responses  流式 Responses API（/v1/responses 直通）
+  failover   同 mixed；配合模拟后端 --fail-accounts 让部分账号始终 429，观察故障切换开销
+
+ITL 为客户端收到的相邻内容块间隔；代理会合并短时间内的 delta（chunkWriter），因此反映的是客户端实际体验。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+
+BASE_URL = os.environ.get("CODEX_PROAPI_URL", "http://localhost:1455")
+MODEL = "gpt-5.3-codex"
+PROMPTS = [
+    "用一句话解释什么是反向代理。",
+    "Write a haiku about connection pooling.",
+    "List three differences between HTTP/1.1 and HTTP/2.",
+    "把下面这句话翻译成英文：今天的压测结果很稳定。",
+]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Results:
+    def __init__(self):
+        self.ok = 0
+        self.errors = {}
+        self.ttft = []
+        self.itl = []
+        self.total = []
+        self.chunks = 0
+
+    def error(self, key):
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def write_accounts(n, path):
+    """生成 n 个假账号（bench-000 …），供代理的 CODEX_ACCOUNTS_FILE 使用"""
+    accounts = [
+        {"name": "bench-%03d" % i, "access_token": "bench-token-%03d" % i, "account_id": "bench-%03d" % i, "source": "manual"}
+        for i in range(n)
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"accounts": accounts}, f, ensure_ascii=False, indent=2)
+    print("已写入 %d 个账号: %s" % (n, path))
+
+
+def build_request(args, stream, responses_api):
+    prompt = random.choice(PROMPTS)
+    if responses_api:
+        path = "/v1/responses"
+        body = {"model": args.model, "input": prompt, "stream": stream}
+        if args.max_tokens:
+            body["max_output_tokens"] = args.max_tokens
+    else:
+        path = "/v1/chat/completions"
+        body = {"model": args.model, "messages": [{"role": "user", "content": prompt}], "stream": stream}
+        if args.max_tokens:
+            body["max_tokens"] = args.max_tokens
+    return path, body
+
+
+def is_content_line(line, responses_api):
+    if not line.startswith("data: ") or line == "data: [DONE]":
+        return False
+    if responses_api:
+        return '"response.output_text.delta"' in line
+    return '"content":"' in line or '"arguments":"' in line
+
+
+async def one_request(client, args, results, stream, responses_api):
+    path, body = build_request(args, stream, responses_api)
+    start = time.perf_counter()
+    try:
+        if not stream:
+            r = await client.post(path, json=body)
+            elapsed = time.perf_counter() - start
+            if r.status_code != 200:
+                results.error(str(r.status_code))
+                return
+            results.ok += 1
+            results.ttft.append(elapsed)
+            results.total.append(elapsed)
+            return
+        async with client.stream("POST", path, json=body) as r:
+            if r.status_code != 200:
+                await r.aread()
+                results.error(str(r.status_code))
+                return
+            last = None
+            async for line in r.aiter_lines():
+                if not is_content_line(line, responses_api):
+                    continue
+                now = time.perf_counter()
+                if last is None:
+                    results.ttft.append(now - start)
+                else:
+                    results.itl.append(now - last)
+                last = now
+                results.chunks += 1
+            results.total.append(time.perf_counter() - start)
+            results.ok += 1
+    except Exception as e:  # 网络错误、超时等
+        results.error(type(e).__name__)
+
+
+async def worker(client, args, results, deadline, counter):
+    while True:
+        if args.requests:
+            if counter[0] >= args.requests:
+                return
+            counter[0] += 1
+        elif time.perf_counter() >= deadline:
+            return
+        scenario = args.scenario
+        responses_api = scenario == "responses"
+        if scenario in ("stream", "responses"):
+            stream = True
+        elif scenario == "nonstream":
+            stream = False
+        else:
+            stream = random.random() < args.stream_ratio
+        await one_request(client, args, results, stream, responses_api)
+
+
+async def get_json(client, path):
+    try:
+        r = await client.get(path)
+        return r.json() if r.status_code == 200 else None
+    except Exception:
+        return None
+
+
+async def get_metrics(client):
+    """从 /metrics 汇总故障切换次数与后端状态码（跨账号与模型求和）"""
+    try:
+        r = await client.get("/metrics")
+        text = r.text if r.status_code == 200 else ""
+    except Exception:
+        text = ""
+    out = {"failovers_sum": 0.0, "failovers_count": 0.0, "backend": {}}
+    for line in text.splitlines():
+        if line.startswith("codex_failovers_sum"):
+            out["failovers_sum"] += float(line.rsplit(" ", 1)[1])
+        elif line.startswith("codex_failovers_count"):
+            out["failovers_count"] += float(line.rsplit(" ", 1)[1])
+        elif line.startswith("codex_backend_responses_total"):
+            m = re.search(r'status="([^"]*)"', line)
+            if m:
+                out["backend"][m.group(1)] = out["backend"].get(m.group(1), 0) + float(line.rsplit(" ", 1)[1])
+    return out
+
+
+async def sample_process(client, stop, peaks):
+    """每秒采样代理 RSS，记录峰值"""
+    while not stop.is_set():
+        stats = await get_json(client, "/api/stats")
+        if stats and "process" in stats:
+            peaks["rss"] = max(peaks.get("rss", 0), stats["process"]["rssMb"])
+        try:
+            await asyncio.wait_for(stop.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args):
+    try:
+        import httpx
+    except ImportError:
+        print("请安装: pip install httpx")
+        sys.exit(1)
+
+    headers = {"Authorization": "Bearer " + args.api_key} if args.api_key else {}
+    limits = httpx.Limits(max_connections=args.concurrency + 4, max_keepalive_connections=args.concurrency + 4)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=timeout) as client:
+        before_stats = await get_json(client, "/api/stats")
+        if before_stats is None:
+            print("无法访问 %s/api/stats，请确认代理已启动" % args.url)
+            sys.exit(1)
+        before_metrics = await get_metrics(client)
+
+        results = Results()
+        stop = asyncio.Event()
+        peaks = {}
+        sampler = asyncio.create_task(sample_process(client, stop, peaks))
+        counter = [0]
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(worker(client, args, results, deadline, counter) for _ in range(args.concurrency)))
+        wall = time.perf_counter() - start
+        stop.set()
+        await sampler
+
+        after_stats = await get_json(client, "/api/stats")
+        after_metrics = await get_metrics(client)
+
+    report = {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "seconds": round(wall, 2),
+        "ok": results.ok,
+        "errors": results.errors,
+        "rps": round(results.ok / wall, 2) if wall else None,
+    }
+    for name, values in (("ttft_ms", results.ttft), ("itl_ms", results.itl), ("total_ms", results.total)):
+        values.sort()
+        report[name] = {p: (None if percentile(values, n) is None else round(percentile(values, n) * 1000, 1))
+                        for p, n in (("p50", 50), ("p90", 90), ("p99", 99))}
+    # 代理进程 CPU（集群模式下 /api/stats 只代表处理采样请求的 worker）
+    if after_stats and "process" in before_stats and "process" in after_stats:
+        b, a = before_stats["process"], after_stats["process"]
+        if a["pid"] == b["pid"]:
+            cpu_ms = (a["cpuUserMs"] + a["cpuSystemMs"]) - (b["cpuUserMs"] + b["cpuSystemMs"])
+            report["proxy_cpu_pct"] = round(cpu_ms / (wall * 1000) * 100, 1)
+        report["proxy_rss_mb"] = a["rssMb"]
+        report["proxy_rss_peak_mb"] = peaks.get("rss", a["rssMb"])
+    count = after_metrics["failovers_count"] - before_metrics["failovers_count"]
+    if count:
+        report["failovers_per_request"] = round((after_metrics["failovers_sum"] - before_metrics["failovers_sum"]) / count, 3)
+    report["backend_status"] = {
+        k: int(v - before_metrics["backend"].get(k, 0))
+        for k, v in after_metrics["backend"].items()
+        if v - before_metrics["backend"].get(k, 0) > 0
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print("场景 %s，并发 %d，%.1f 秒" % (args.scenario, args.concurrency, wall))
+    print("  成功 %d，错误 %s，RPS %.2f" % (results.ok, results.errors or 0, report["rps"] or 0))
+    for name in ("ttft_ms", "itl_ms", "total_ms"):
+        r = report[name]
+        print("  %-9s p50 %8s  p90 %8s  p99 %8s" % (name, r["p50"], r["p90"], r["p99"]))
+    if "proxy_rss_mb" in report:
+        print("  代理 CPU %s%%，RSS %s MB（峰值 %s MB）" % (report.get("proxy_cpu_pct", "-"), report["proxy_rss_mb"], report["proxy_rss_peak_mb"]))
+    if "failovers_per_request" in report:
+        print("  平均故障切换 %.3f 次/请求" % report["failovers_per_request"])
+    if report["backend_status"]:
+        print("  后端状态码 %s" % report["backend_status"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="codex-proapi 压测")
+    parser.add_argument("--url", default=BASE_URL, help="代理地址（默认 %(default)s）")
+    parser.add_argument("--scenario", default="stream", choices=["stream", "nonstream", "mixed", "responses", "failover"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="持续秒数（与 --requests 二选一）")
+    parser.add_argument("--requests", type=int, default=0, help="总请求数，设置后忽略 --duration")
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="mixed/failover 场景中流式请求占比")
+    parser.add_argument("--max-tokens", type=int, default=0, help="每个请求的输出 token 上限（模拟后端按此输出）")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--api-key", default=os.environ.get("CODEX_PROAPI_KEY", ""))
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    parser.add_argument("--write-accounts", nargs=2, metavar=("N", "FILE"), help="生成 N 个假账号到 FILE 后退出")
+    args = parser.parse_args()
+
+    if args.write_accounts:
+        write_accounts(int(args.write_accounts[0]), args.write_accounts[1])
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
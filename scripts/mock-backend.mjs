@@ -0,0 +1,167 @@
+#!/usr/bin/env node
+/**
+ * 本地模拟 Codex 后端（/backend-api/codex/responses），用于压测与基准测试，不消耗真实额度。
+ * 输出与真实后端一致的 SSE 事件序列（response.created → output_text.delta … → response.completed 带 usage），
+ * 可配置首 token 延迟、输出速度、错误与 429 注入、指定账号始终 429（测试故障切换）。
+ *
+ * 用法：node scripts/mock-backend.mjs [--port 18080] [--ttft-ms 300] [--tps 80] [--tokens 200] [--jitter 0.2]
+ *        [--error-rate 0] [--rate-limit-rate 0] [--fail-accounts acct-a,acct-b] [--tool-call-rate 0]
+ * 代理指向模拟后端：CODEX_BACKEND_URL=http://127.0.0.1:18080/backend-api/codex/responses npm start
+ * GET /stats 返回模拟后端自身的计数。
+ */
+import http from 'http';
+
+const args = process.argv.slice(2);
+function opt(name, def) {
+  const i = args.indexOf(name);
+  if (i === -1) return def;
+  return typeof def === 'number' ? Number(args[i + 1]) : args[i + 1];
+}
+const PORT = opt('--port', 18080);
+const TTFT_MS = opt('--ttft-ms', 300);
+const TPS = Math.max(1, opt('--tps', 80));
+const TOKENS = Math.max(1, opt('--tokens', 200));
+const JITTER = Math.min(1, Math.max(0, opt('--jitter', 0.2)));
+const ERROR_RATE = opt('--error-rate', 0);
+const RATE_LIMIT_RATE = opt('--rate-limit-rate', 0);
+const TOOL_CALL_RATE = opt('--tool-call-rate', 0);
+const FAIL_ACCOUNTS = new Set(String(opt('--fail-accounts', '')).split(',').filter(Boolean));
+// 每个定时器周期最短间隔：高 tps 时一次发出多个 token，避免大量短定时器
+const MIN_TICK_MS = 10;
+
+const WORDS = ['the', ' quick', ' brown', ' fox', ' jumps', ' over', ' the', ' lazy', ' dog', '.', ' 你好', '世界', '\n'];
+const stats = { requests: 0, active: 0, completed: 0, canceled: 0, rateLimited: 0, errors: 0, tokens: 0 };
+
+function jittered(ms) {
+  return ms * (1 + (Math.random() * 2 - 1) * JITTER);
+}
+
+function sse(res, obj) {
+  return res.write(`event: ${obj.type}\ndata: ${JSON.stringify(obj)}\n\n`);
+}
+
+function reject(res, status, message) {
+  res.writeHead(status, { 'Content-Type': 'application/json' });
+  res.end(JSON.stringify({ detail: message }));
+}
+
+function streamResponse(req, res, body) {
+  const id = `resp_${Math.random().toString(36).slice(2)}`;
+  const model = body.model || 'gpt-5';
+  const wanted = Math.max(1, Number(body.max_output_tokens) || TOKENS);
+  const inputTokens = Math.ceil(JSON.stringify(body.input || '').length / 4);
+  const toolCall = Array.isArray(body.tools) && body.tools.length > 0 && Math.random() < TOOL_CALL_RATE;
+  const tps = jittered(TPS);
+  let sent = 0;
+  let text = '';
+  let timer = null;
+  let closed = false;
+
+  stats.active++;
+  res.writeHead(200, { 'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache' });
+  sse(res, { type: 'response.created', response: { id, model, status: 'in_progress' } });
+  sse(res, { type: 'response.in_progress', response: { id, model, status: 'in_progress' } });
+
+  const itemId = toolCall ? `fc_${id}` : `msg_${id}`;
+  const finish = () => {
+    let item;
+    if (toolCall) {
+      const name = body.tools[0].name || body.tools[0].function?.name || 'tool';
+      item = { id: itemId, type: 'function_call', call_id: `call_${id}`, name, arguments: text, status: 'completed' };
+      sse(res, { type: 'response.function_call_arguments.done', item_id: itemId, output_index: 0, arguments: text });
+    } else {
+      item = { id: itemId, type: 'message', role: 'assistant', status: 'completed', content: [{ type: 'output_text', text, annotations: [] }] };
+      sse(res, { type: 'response.output_text.done', item_id: itemId, output_index: 0, content_index: 0, text });
+    }
+    sse(res, { type: 'response.output_item.done', output_index: 0, item });
+    sse(res, {
+      type: 'response.completed',
+      response: { id, model, status: 'completed', output: [item], usage: { input_tokens: inputTokens, output_tokens: sent, total_tokens: inputTokens + sent } },
+    });
+    res.end();
+    stats.completed++;
+  };
+
+  const tick = () => {
+    if (closed) return;
+    const n = Math.min(wanted - sent, Math.max(1, Math.round((tps * MIN_TICK_MS) / 1000)));
+    for (let i = 0; i < n; i++) {
+      const piece = toolCall ? (sent === 0 ? '{"q":"' : 'x') : WORDS[sent % WORDS.length];
+      text += piece;
+      sse(res, toolCall
+        ? { type: 'response.function_call_arguments.delta', item_id: itemId, output_index: 0, delta: piece }
+        : { type: 'response.output_text.delta', item_id: itemId, output_index: 0, content_index: 0, delta: piece });
+      sent++;
+    }
+    stats.tokens += n;
+    if (sent >= wanted) {
+      if (toolCall) {
+        text += '"}';
+        sse(res, { type: 'response.function_call_arguments.delta', item_id: itemId, output_index: 0, delta: '"}' });
+      }
+      finish();
+      return;
+    }
+    timer = setTimeout(tick, Math.max(MIN_TICK_MS, (n * 1000) / tps));
+  };
+
+  timer = setTimeout(() => {
+    if (closed) return;
+    const item = toolCall
+      ? { id: itemId, type: 'function_call', call_id: `call_${id}`, name: body.tools[0].name || body.tools[0].function?.name || 'tool', arguments: '' }
+      : { id: itemId, type: 'message', role: 'assistant', content: [] };
+    sse(res, { type: 'response.output_item.added', output_index: 0, item });
+    if (!toolCall) sse(res, { type: 'response.content_part.added', item_id: itemId, output_index: 0, content_index: 0, part: { type: 'output_text', text: '' } });
+    tick();
+  }, jittered(TTFT_MS));
+
+  res.on('close', () => {
+    closed = true;
+    clearTimeout(timer);
+    stats.active--;
+    if (!res.writableFinished) stats.canceled++;
+  });
+}
+
+const server = http.createServer((req, res) => {
+  if (req.method === 'GET' && req.url === '/stats') {
+    res.writeHead(200, { 'Content-Type': 'application/json' });
+    res.end(JSON.stringify(stats));
+    return;
+  }
+  if (req.method !== 'POST' || !req.url.endsWith('/responses')) {
+    reject(res, 404, 'not found');
+    return;
+  }
+  const chunks = [];
+  req.on('data', (c) => chunks.push(c));
+  req.on('end', () => {
+    stats.requests++;
+    let body;
+    try {
+      body = JSON.parse(Buffer.concat(chunks).toString('utf8'));
+    } catch {
+      reject(res, 400, 'invalid json');
+      return;
+    }
+    const account = String(req.headers['chatgpt-account-id'] || '');
+    if (FAIL_ACCOUNTS.has(account) || Math.random() < RATE_LIMIT_RATE) {
+      stats.rateLimited++;
+      reject(res, 429, 'Rate limit reached (mock)');
+      return;
+    }
+    if (Math.random() < ERROR_RATE) {
+      stats.errors++;
+      reject(res, 500, 'Internal error (mock)');
+      return;
+    }
+    streamResponse(req, res, body);
+  });
+});
+
+server.keepAliveTimeout = 65_000;
+server.listen(PORT, '127.0.0.1', () => {
+  console.log(`mock Codex backend: http://127.0.0.1:${PORT}/backend-api/codex/responses`);
+  console.log(`  ttft=${TTFT_MS}ms tps=${TPS} tokens=${TOKENS} jitter=${JITTER} error=${ERROR_RATE} 429=${RATE_LIMIT_RATE}`
+    + (FAIL_ACCOUNTS.size ? ` fail-accounts=${[...FAIL_ACCOUNTS].join(',')}` : ''));
+});
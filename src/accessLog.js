@@ -0,0 +1,165 @@
+/**
+ * 持久化访问日志：每个对话请求一行 JSON，写入 data/access-log/access.jsonl，供事后分析（scripts/analyze_access_log.py）。
+ *
+ * 字段：ts（结束时间）、id（请求 id，同响应头 X-Request-Id）、path、account（账号掩码）、model、status（断开为 499）、
+ * prompt_tokens、completion_tokens、ttft_ms（无首 token 时为 null）、ms、queue_ms、failovers、canceled
+ *
+ * - 请求路径上只追加到内存队列，定时（CODEX_ACCESS_LOG_FLUSH_MS，默认 1000）批量异步追加到文件；进程退出时同步写出剩余条目
+ * - 轮转：文件超过 CODEX_ACCESS_LOG_MAX_MB（默认 64）或距上次轮转超过 CODEX_ACCESS_LOG_ROTATE_MS（默认 86400000）时，
+ *   重命名为 access-<时间>.jsonl，只保留最近 CODEX_ACCESS_LOG_KEEP（默认 14）个
+ * - CODEX_ACCESS_LOG=0 关闭
+ *
+ * 集群模式下 worker 不写文件（setAccessLogForwarder），记录交给主进程统一写入，避免多进程同时轮转同一文件
+ */
+import { appendFileSync, mkdirSync, existsSync } from 'fs';
+import { appendFile, rename, mkdir, readdir, stat, unlink } from 'fs/promises';
+import { join, dirname } from 'path';
+import { fileURLToPath } from 'url';
+
+const __dirname = dirname(fileURLToPath(import.meta.url));
+const dataDir = process.env.CODEX_DATA_DIR || join(__dirname, '..', 'data');
+const LOG_DIR = join(dataDir, 'access-log');
+const LOG_FILE = join(LOG_DIR, 'access.jsonl');
+
+export const ACCESS_LOG_ENABLED = !['0', 'false', 'off'].includes(String(process.env.CODEX_ACCESS_LOG ?? '').toLowerCase());
+const FLUSH_MS = Math.max(100, Number(process.env.CODEX_ACCESS_LOG_FLUSH_MS) || 1000);
+const MAX_BYTES = Math.max(1, Number(process.env.CODEX_ACCESS_LOG_MAX_MB) || 64) * 1024 * 1024;
+const ROTATE_MS = Math.max(60_000, Number(process.env.CODEX_ACCESS_LOG_ROTATE_MS) || 86_400_000);
+const KEEP = Math.max(1, Number(process.env.CODEX_ACCESS_LOG_KEEP) || 14);
+// 待写条目上限：磁盘持续不可写时丢弃最旧的，避免内存无限增长
+const MAX_PENDING = 10_000;
+
+let pending = [];
+let flushTimer = null;
+let flushing = null;
+let forwarder = null;
+let fileBytes = -1; // 当前文件大小，-1 表示尚未读取
+let openedAt = 0; // 当前文件开始写入的时间
+let exitHooked = false;
+const stats = { written: 0, dropped: 0, rotations: 0, lastError: null };
+
+function scheduleFlush() {
+  if (flushTimer) return;
+  flushTimer = setTimeout(() => {
+    flushTimer = null;
+    flushAccessLog().catch(() => {});
+  }, FLUSH_MS);
+  flushTimer.unref?.();
+}
+
+function stamp(date) {
+  return date.toISOString().replace(/[-:.]/g, '').replace('T', '-').slice(0, 18); // 20260101-120000123
+}
+
+async function rotate() {
+  await rename(LOG_FILE, join(LOG_DIR, `access-${stamp(new Date())}.jsonl`));
+  stats.rotations++;
+  fileBytes = 0;
+  openedAt = Date.now();
+  const rotated = (await readdir(LOG_DIR)).filter((n) => /^access-.*\.jsonl$/.test(n)).sort();
+  for (const name of rotated.slice(0, Math.max(0, rotated.length - KEEP))) {
+    await unlink(join(LOG_DIR, name)).catch(() => {});
+  }
+}
+
+/**
+ * 把待写条目追加到文件，需要时先轮转。串行执行，可随时调用
+ */
+export async function flushAccessLog() {
+  while (flushing) await flushing;
+  if (pending.length === 0) return;
+  flushing = (async () => {
+    const batch = pending;
+    pending = [];
+    try {
+      await mkdir(LOG_DIR, { recursive: true });
+      if (fileBytes < 0) {
+        const st = await stat(LOG_FILE).catch(() => null);
+        fileBytes = st ? st.size : 0;
+        openedAt = st ? st.birthtimeMs || st.mtimeMs : Date.now();
+      }
+      if (fileBytes > 0 && (fileBytes >= MAX_BYTES || Date.now() - openedAt >= ROTATE_MS)) await rotate();
+      const text = batch.join('\n') + '\n';
+      await appendFile(LOG_FILE, text, 'utf8');
+      fileBytes += Buffer.byteLength(text);
+      stats.written += batch.length;
+      stats.lastError = null;
+    } catch (e) {
+      pending = batch.concat(pending);
+      if (pending.length > MAX_PENDING) {
+        stats.dropped += pending.length - MAX_PENDING;
+        pending = pending.slice(-MAX_PENDING);
+      }
+      stats.lastError = e.message;
+    } finally {
+      flushing = null;
+    }
+  })();
+  await flushing;
+}
+
+function flushAccessLogSync() {
+  if (pending.length === 0) return;
+  try {
+    if (!existsSync(LOG_DIR)) mkdirSync(LOG_DIR, { recursive: true });
+    appendFileSync(LOG_FILE, pending.join('\n') + '\n', 'utf8');
+    stats.written += pending.length;
+    pending = [];
+  } catch (e) {
+    console.error('accessLog save failed:', e.message);
+  }
+}
+
+/**
+ * 写入一条已组装好的记录（主进程接收 worker 转发时也走这里）
+ */
+export function writeAccessRecord(record) {
+  if (!ACCESS_LOG_ENABLED) return;
+  if (forwarder) {
+    forwarder(record);
+    return;
+  }
+  if (!exitHooked) {
+    exitHooked = true;
+    process.once('exit', flushAccessLogSync);
+  }
+  pending.push(JSON.stringify(record));
+  scheduleFlush();
+}
+
+/**
+ * 请求结束时由 index.js 调用：由 metrics 的请求追踪对象生成一条记录
+ * @param {object} trace - metrics.createTrace() 的结果
+ * @param {number} status - 客户端响应状态码，断开为 499
+ * @param {string} path - 请求路径
+ */
+export function logAccess(trace, status, path) {
+  if (!ACCESS_LOG_ENABLED) return;
+  const now = Date.now();
+  writeAccessRecord({
+    ts: new Date(now).toISOString(),
+    id: trace.requestId,
+    path,
+    account: trace.accountId ? `${String(trace.accountId).slice(0, 8)}…` : null,
+    model: trace.model || null,
+    status,
+    prompt_tokens: trace.promptTokens,
+    completion_tokens: trace.completionTokens,
+    ttft_ms: trace.firstTokenAt ? trace.firstTokenAt - trace.startedAt : null,
+    ms: now - trace.startedAt,
+    queue_ms: trace.queueMs,
+    failovers: trace.failovers,
+    canceled: status === 499,
+  });
+}
+
+/**
+ * 集群 worker：记录不写本地文件，交给 fn(record) 转发主进程
+ */
+export function setAccessLogForwarder(fn) {
+  forwarder = fn;
+}
+
+export function getAccessLogStats() {
+  return { enabled: ACCESS_LOG_ENABLED, file: LOG_FILE, pending: pending.length, forwarded: !!forwarder, ...stats };
+}
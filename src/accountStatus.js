@@ -1,12 +1,44 @@
 /**
  * 记录因 401/403 被判为不可用的账号，模型页将显示其额度为 0%
+ * 值为标记时间，调度器据此在冷却期后重新探测（探测成功即恢复）
+ * 集群模式下本地变更通过 listener 同步到其他进程，远端变更经 applyAccountStatus 应用
  */
-const unavailableIds = new Set();
+const unavailableIds = new Map();
+let listener = null;
 
 export function markAccountUnavailable(accountId) {
-  if (accountId) unavailableIds.add(String(accountId));
+  if (!accountId) return;
+  const since = Date.now();
+  unavailableIds.set(String(accountId), since);
+  listener?.(String(accountId), since);
+}
+
+export function markAccountAvailable(accountId) {
+  if (accountId && unavailableIds.delete(String(accountId))) listener?.(String(accountId), 0);
 }
 
 export function isAccountUnavailable(accountId) {
   return accountId ? unavailableIds.has(String(accountId)) : false;
 }
+
+/**
+ * 返回账号被标记不可用的时间戳，未标记时为 0
+ */
+export function getAccountUnavailableSince(accountId) {
+  return (accountId && unavailableIds.get(String(accountId))) || 0;
+}
+
+/** 设置本地变更回调 (accountId, since)，since 为 0 表示恢复可用 */
+export function setAccountStatusListener(fn) {
+  listener = fn;
+}
+
+/** 应用来自其他进程的变更（不再回调 listener） */
+export function applyAccountStatus(accountId, since) {
+  if (since) unavailableIds.set(String(accountId), since);
+  else unavailableIds.delete(String(accountId));
+}
+
+export function getAccountStatusSnapshot() {
+  return Object.fromEntries(unavailableIds);
+}
@@ -1,5 +1,5 @@
-import { readFileSync, writeFileSync, mkdirSync, existsSync } from 'fs';
-import { join, dirname } from 'path';
+import { readFileSync, writeFileSync, mkdirSync, existsSync, statSync, watch } from 'fs';
+import { join, dirname, basename } from 'path';
 import { fileURLToPath } from 'url';
 import { parseAuthFromJson } from './auth.js';
 
@@ -10,50 +10,144 @@ function getAccountsPath() {
   return process.env.CODEX_ACCOUNTS_FILE || DEFAULT_ACCOUNTS_FILE;
 }
 
+function readAccountList(path) {
+  if (!existsSync(path)) return [];
+  const raw = readFileSync(path, 'utf8');
+  const data = JSON.parse(raw);
+  return Array.isArray(data) ? data : (data.accounts || []);
+}
+
+function maskAccountId(accountId) {
+  return accountId ? `${accountId.slice(0, 8)}…` : '—';
+}
+
+const CHECK_INTERVAL_MS = 1000;
+
+/**
+ * 账号注册表：accounts.json 只解析一次，按 accountId / 掩码 / 索引建内存索引。
+ * 失效条件：fs.watch 通知、文件 mtime/size 变化（最多每秒检查一次）、addAccount/deleteAccount、路径变化。
+ */
+export class AccountRegistry {
+  constructor(getPath = getAccountsPath) {
+    this.getPath = getPath;
+    this.current = null;
+    this.path = null;
+    this.fileSig = null;
+    this.checkedAt = 0;
+    this.watcher = null;
+  }
+
+  invalidate() {
+    this.current = null;
+  }
+
+  /** 当前快照：{ entries, auths, apiAccounts, byAccountId, byMask } */
+  snapshot() {
+    const path = this.getPath();
+    if (path !== this.path) {
+      this.path = path;
+      this.current = null;
+      this.unwatch();
+    }
+    const now = Date.now();
+    if (this.current && now - this.checkedAt >= CHECK_INTERVAL_MS) {
+      this.checkedAt = now;
+      if (fileSignature(path) !== this.fileSig) this.current = null;
+    }
+    if (!this.current) {
+      this.checkedAt = now;
+      this.fileSig = fileSignature(path);
+      this.current = buildSnapshot(readAccountList(path));
+      if (!this.watcher) this.watch(path);
+    }
+    return this.current;
+  }
+
+  unwatch() {
+    if (this.watcher) this.watcher.close();
+    this.watcher = null;
+  }
+
+  watch(path) {
+    try {
+      const name = basename(path);
+      this.watcher = watch(dirname(path), { persistent: false }, (_event, file) => {
+        if (!file || file === name) this.invalidate();
+      });
+      this.watcher.on('error', () => {});
+    } catch (_) {
+      // 目录尚不存在或平台不支持，退回到 mtime 检查
+    }
+  }
+
+  count() {
+    return this.snapshot().entries.length;
+  }
+
+  getByIndex(index) {
+    return this.snapshot().entries[Number(index)] || null;
+  }
+
+  getByAccountId(accountId) {
+    return this.snapshot().byAccountId.get(String(accountId)) || null;
+  }
+
+  getByMask(mask) {
+    return this.snapshot().byMask.get(mask) || null;
+  }
+}
+
+function fileSignature(path) {
+  try {
+    const st = statSync(path);
+    return `${st.mtimeMs}:${st.size}`;
+  } catch {
+    return null;
+  }
+}
+
+function buildSnapshot(list) {
+  const entries = [];
+  const auths = [];
+  const byAccountId = new Map();
+  const byMask = new Map();
+  list.forEach((item, index) => {
+    const accountId = item.account_id || item.tokens?.account_id || '';
+    const tokens = item.tokens || (item.access_token ? { access_token: item.access_token, account_id: item.account_id } : null);
+    const auth = tokens?.access_token && tokens?.account_id
+      ? { type: 'codex', accessToken: tokens.access_token, accountId: tokens.account_id, name: item.name || null }
+      : null;
+    const entry = {
+      index,
+      name: item.name || `账号 ${index + 1}`,
+      accountId,
+      accountIdMask: maskAccountId(accountId),
+      source: item.source || 'manual',
+      auth,
+    };
+    entries.push(entry);
+    if (auth) auths.push(auth);
+    if (accountId && !byAccountId.has(accountId)) byAccountId.set(accountId, entry);
+    if (!byMask.has(entry.accountIdMask)) byMask.set(entry.accountIdMask, entry);
+  });
+  const apiAccounts = entries.map(({ index, name, accountIdMask, source }) => ({ index, name, accountIdMask, source }));
+  return { entries, auths, apiAccounts, byAccountId, byMask };
+}
+
+export const accountRegistry = new AccountRegistry();
+
 /**
  * 读取账号列表（不包含 token 明文，用于 API 展示）
  */
 export function listAccountsForApi() {
-  const path = getAccountsPath();
-  if (!existsSync(path)) return { accounts: [] };
-  const raw = readFileSync(path, 'utf8');
-  const data = JSON.parse(raw);
-  const list = Array.isArray(data) ? data : (data.accounts || []);
-  return {
-    accounts: list.map((item, index) => {
-      const accountId = item.account_id || item.tokens?.account_id || '';
-      return {
-        index,
-        name: item.name || `账号 ${index + 1}`,
-        accountIdMask: accountId ? `${accountId.slice(0, 8)}…` : '—',
-        source: item.source || 'manual',
-      };
-    }),
-  };
+  return { accounts: accountRegistry.snapshot().apiAccounts };
 }
 
 /**
  * 读取完整账号列表（含 token），供代理轮询使用
  */
 export function loadAccountsForProxy() {
-  const path = getAccountsPath();
-  if (!existsSync(path)) return [];
-  const raw = readFileSync(path, 'utf8');
-  const data = JSON.parse(raw);
-  const list = Array.isArray(data) ? data : (data.accounts || []);
-  const auths = [];
-  for (const item of list) {
-    const tokens = item.tokens || (item.access_token ? { access_token: item.access_token, account_id: item.account_id } : null);
-    if (tokens?.access_token && tokens?.account_id) {
-      auths.push({
-        type: 'codex',
-        accessToken: tokens.access_token,
-        accountId: tokens.account_id,
-        name: item.name || null,
-      });
-    }
-  }
-  return auths;
+  return accountRegistry.snapshot().auths;
 }
 
 /**
@@ -85,14 +179,10 @@ export function addAccount(body) {
   }
   const dir = dirname(path);
   if (!existsSync(dir)) mkdirSync(dir, { recursive: true });
-  let list = [];
-  if (existsSync(path)) {
-    const raw = readFileSync(path, 'utf8');
-    const data = JSON.parse(raw);
-    list = Array.isArray(data) ? data : (data.accounts || []);
-  }
+  const list = readAccountList(path);
   list.push(entry);
   writeFileSync(path, JSON.stringify({ accounts: list }, null, 2), 'utf8');
+  accountRegistry.invalidate();
   return { ok: true };
 }
 
@@ -102,13 +192,12 @@ export function addAccount(body) {
 export function deleteAccount(index) {
   const path = getAccountsPath();
   if (!existsSync(path)) return;
-  const raw = readFileSync(path, 'utf8');
-  const data = JSON.parse(raw);
-  const list = Array.isArray(data) ? data : (data.accounts || []);
+  const list = readAccountList(path);
   const i = Number(index);
   if (i >= 0 && i < list.length) {
     list.splice(i, 1);
     writeFileSync(path, JSON.stringify({ accounts: list }, null, 2), 'utf8');
+    accountRegistry.invalidate();
   }
 }
 
@@ -0,0 +1,136 @@
+/**
+ * 全局准入队列：限制同时发往后端的请求数，超出的请求排队等待；
+ * 按客户端（API Key / IP）公平轮转出队，单个客户端的突发不会饿死其他客户端。
+ * 队列已满或等待超时直接返回 429 + Retry-After，而不是把请求堆到后端。
+ *
+ * 环境变量：CODEX_MAX_INFLIGHT（全局并发上限，默认 可调度账号数 × 单账号上限，见 admissionCapacity）、
+ * CODEX_QUEUE_MAX（最大排队数，默认 100）、CODEX_QUEUE_TIMEOUT_MS（最长排队时间，默认 30000）
+ */
+import { ACCOUNT_SLOTS, WORKER_COUNT, countSchedulableAccounts } from './scheduler.js';
+
+const MAX_INFLIGHT = Math.max(0, Number(process.env.CODEX_MAX_INFLIGHT) || 0);
+const QUEUE_MAX = Math.max(0, Number(process.env.CODEX_QUEUE_MAX ?? 100) || 0);
+const QUEUE_TIMEOUT_MS = Math.max(100, Number(process.env.CODEX_QUEUE_TIMEOUT_MS) || 30_000);
+
+/**
+ * 默认准入容量：设置了 CODEX_MAX_INFLIGHT 时按 worker 数均分；否则为可调度账号数 × 本进程单账号名额
+ * （冷却或不可用的账号不计入；全部不可调度时保留一个账号的名额，用于探测最早恢复的账号）
+ * @param {object[]} auths - 参与调度的账号
+ */
+export function admissionCapacity(auths) {
+  if (MAX_INFLIGHT > 0) return Math.max(1, Math.floor(MAX_INFLIGHT / WORKER_COUNT));
+  if (ACCOUNT_SLOTS === 0) return Infinity;
+  return Math.max(1, countSchedulableAccounts(auths)) * ACCOUNT_SLOTS;
+}
+
+export class AdmissionQueue {
+  /**
+   * @param {() => number} capacity - 当前允许的最大并发（动态，随账号数变化）
+   */
+  constructor(capacity, opts = {}) {
+    this.capacity = capacity;
+    this.maxQueue = opts.maxQueue ?? QUEUE_MAX;
+    this.timeoutMs = opts.timeoutMs ?? QUEUE_TIMEOUT_MS;
+    this.inflight = 0;
+    this.depth = 0;
+    this.queues = new Map(); // clientKey -> waiter[]，Map 的插入顺序即轮转顺序
+    this.counters = { admitted: 0, queued: 0, rejected: 0, timedOut: 0, canceled: 0, maxDepth: 0, waitMsTotal: 0, waitMsMax: 0 };
+  }
+
+  /**
+   * 申请一个并发名额，返回 release()；排队中 signal 中止则放弃排队
+   * 失败时抛出带 status=429 与 retryAfter（秒）的错误
+   */
+  acquire(clientKey, signal) {
+    if (this.depth === 0 && this.inflight < this.capacity()) return Promise.resolve(this.admit(0));
+    if (this.depth >= this.maxQueue) {
+      this.counters.rejected++;
+      return Promise.reject(this.busyError('请求过多，排队已满'));
+    }
+    return new Promise((resolve, reject) => {
+      const waiter = { resolve, reject, enqueuedAt: Date.now(), timer: null, clientKey };
+      const remove = () => {
+        const q = this.queues.get(clientKey);
+        const i = q ? q.indexOf(waiter) : -1;
+        if (i === -1) return false;
+        q.splice(i, 1);
+        if (q.length === 0) this.queues.delete(clientKey);
+        this.depth--;
+        clearTimeout(waiter.timer);
+        return true;
+      };
+      waiter.timer = setTimeout(() => {
+        if (!remove()) return;
+        this.counters.timedOut++;
+        reject(this.busyError('排队等待超时'));
+      }, this.timeoutMs);
+      signal?.addEventListener('abort', () => {
+        if (remove()) {
+          this.counters.canceled++;
+          reject(new Error('client closed'));
+        }
+      }, { once: true });
+      let q = this.queues.get(clientKey);
+      if (!q) {
+        q = [];
+        this.queues.set(clientKey, q);
+      }
+      q.push(waiter);
+      this.depth++;
+      this.counters.queued++;
+      if (this.depth > this.counters.maxDepth) this.counters.maxDepth = this.depth;
+      this.drain(); // 容量可能已随账号增加而变大
+    });
+  }
+
+  admit(waitMs) {
+    this.inflight++;
+    this.counters.admitted++;
+    this.counters.waitMsTotal += waitMs;
+    if (waitMs > this.counters.waitMsMax) this.counters.waitMsMax = waitMs;
+    let released = false;
+    return () => {
+      if (released) return;
+      released = true;
+      this.inflight--;
+      this.drain();
+    };
+  }
+
+  /**
+   * 有空位时按客户端轮转出队：取第一个客户端的队首，并把该客户端移到轮转末尾
+   */
+  drain() {
+    while (this.depth > 0 && this.inflight < this.capacity()) {
+      const [clientKey, q] = this.queues.entries().next().value;
+      const waiter = q.shift();
+      this.queues.delete(clientKey);
+      if (q.length) this.queues.set(clientKey, q);
+      this.depth--;
+      clearTimeout(waiter.timer);
+      waiter.resolve(this.admit(Date.now() - waiter.enqueuedAt));
+    }
+  }
+
+  busyError(message) {
+    const err = new Error(message);
+    err.status = 429;
+    // 以平均排队时间估算重试间隔，至少 1 秒
+    const avgWait = this.counters.admitted ? this.counters.waitMsTotal / this.counters.admitted : 0;
+    err.retryAfter = Math.max(1, Math.ceil(avgWait / 1000));
+    return err;
+  }
+
+  stats() {
+    const { admitted, waitMsTotal } = this.counters;
+    return {
+      capacity: this.capacity(),
+      inflight: this.inflight,
+      depth: this.depth,
+      clients: this.queues.size,
+      maxQueue: this.maxQueue,
+      ...this.counters,
+      waitMsAvg: admitted ? Math.round(waitMsTotal / admitted) : 0,
+    };
+  }
+}
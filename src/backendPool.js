@@ -0,0 +1,116 @@
+/**
+ * Codex 后端连接池：对 chatgpt.com（或 CODEX_BACKEND_URL）复用 keep-alive 连接（可选 HTTP/2 多路复用），
+ * 避免突发请求时每次都重新建立 TCP/TLS 连接。
+ *
+ * 依赖 undici 的 Pool（package.json 中的 optionalDependencies，随 npm install 安装）；安装失败或缺失时回退到全局 fetch
+ * （Node 内置连接复用，但无法调参与统计）。
+ * 环境变量：
+ * - CODEX_POOL_CONNECTIONS   每个 origin 的最大连接数（默认 32）
+ * - CODEX_POOL_KEEPALIVE_MS  空闲连接保活时长（默认 60000）
+ * - CODEX_POOL_HTTP2         设为 1/true 时启用 HTTP/2（ALPN 协商）
+ * - CODEX_POOL_WARM          启动时预热的连接数（默认 0 关闭；开启后向后端接口地址发 HEAD 请求以完成握手）
+ */
+
+const POOL_CONNECTIONS = Math.max(1, Number(process.env.CODEX_POOL_CONNECTIONS) || 32);
+const POOL_KEEPALIVE_MS = Math.max(1000, Number(process.env.CODEX_POOL_KEEPALIVE_MS) || 60_000);
+const POOL_HTTP2 = /^(1|true)$/i.test(process.env.CODEX_POOL_HTTP2 || '');
+const POOL_WARM = Math.max(0, Number(process.env.CODEX_POOL_WARM) || 0);
+
+// origin -> Promise<{ pool, fetch } | null>；ready 保存已创建完成的池，供同步读取统计
+const pools = new Map();
+const ready = new Map();
+
+async function createPool(origin) {
+  let undici;
+  try {
+    undici = await import('undici');
+  } catch {
+    console.warn('[WARN] 未安装 undici，后端请求使用全局 fetch（无连接池调参与统计）');
+    return null;
+  }
+  const pool = new undici.Pool(origin, {
+    connections: POOL_CONNECTIONS,
+    keepAliveTimeout: POOL_KEEPALIVE_MS,
+    keepAliveMaxTimeout: POOL_KEEPALIVE_MS,
+    allowH2: POOL_HTTP2,
+  });
+  return { pool, fetch: undici.fetch };
+}
+
+function getPool(origin) {
+  let p = pools.get(origin);
+  if (!p) {
+    p = createPool(origin).then((entry) => {
+      if (entry) ready.set(origin, entry);
+      return entry;
+    });
+    pools.set(origin, p);
+  }
+  return p;
+}
+
+/**
+ * 经连接池发起请求，参数与全局 fetch 一致
+ */
+export async function backendFetch(url, init = {}) {
+  const entry = await getPool(new URL(url).origin);
+  if (!entry) return fetch(url, init);
+  return entry.fetch(url, { ...init, dispatcher: entry.pool });
+}
+
+/**
+ * 预热（CODEX_POOL_WARM 开启时）：对代理实际使用的后端接口发 HEAD，提前建立 count 条连接（完成 TLS 握手），
+ * 供 startServer 调用，失败仅告警
+ */
+export async function warmBackendPool(url, count = POOL_WARM) {
+  if (count <= 0) return 0;
+  const { origin, pathname } = new URL(url);
+  const entry = await getPool(origin);
+  if (!entry) return 0;
+  const results = await Promise.allSettled(
+    Array.from({ length: Math.min(count, POOL_CONNECTIONS) }, async () => {
+      const { body } = await entry.pool.request({ method: 'HEAD', path: pathname });
+      await body.dump();
+    })
+  );
+  const ok = results.filter((r) => r.status === 'fulfilled').length;
+  if (ok < results.length) {
+    const err = results.find((r) => r.status === 'rejected').reason;
+    console.warn('[WARN] 后端连接预热失败:', err?.message || err);
+  }
+  return ok;
+}
+
+/**
+ * 连接池统计：idle 为空闲连接，active 为进行中请求，queued 为等待连接的请求
+ */
+export function getBackendPoolStats() {
+  const result = {
+    enabled: false,
+    maxConnections: POOL_CONNECTIONS,
+    keepAliveMs: POOL_KEEPALIVE_MS,
+    http2: POOL_HTTP2,
+    origins: {},
+  };
+  for (const [origin, entry] of ready) {
+    result.enabled = true;
+    const s = entry.pool.stats;
+    result.origins[origin] = {
+      connected: s.connected,
+      idle: s.free,
+      active: s.running,
+      queued: s.pending + s.queued,
+    };
+  }
+  return result;
+}
+
+/**
+ * 关闭所有连接池（优雅退出时使用）
+ */
+export async function closeBackendPools() {
+  const entries = [...ready.values()];
+  pools.clear();
+  ready.clear();
+  await Promise.allSettled(entries.map((e) => e.pool.close()));
+}
@@ -0,0 +1,86 @@
+/**
+ * 流式输出：按 OpenAI chat.completion.chunk 格式写 SSE。
+ * - 信封（id/object/created/model）只序列化一次，之后每块只拼接 delta
+ * - 时间窗口内（或累计到一定字节数）的文本 delta 合并为一次 res.write
+ * - res.write 返回 false 时等待 drain，调用方通过 ready() 暂停读取后端，避免慢客户端撑爆内存
+ *
+ * 环境变量：CODEX_STREAM_COALESCE_MS（默认 10，0 为不合并）、CODEX_STREAM_COALESCE_BYTES（默认 1024）
+ */
+
+const COALESCE_MS = Math.max(0, Number(process.env.CODEX_STREAM_COALESCE_MS ?? 10) || 0);
+const COALESCE_BYTES = Math.max(1, Number(process.env.CODEX_STREAM_COALESCE_BYTES) || 1024);
+
+export function createChunkWriter(res, model, id, opts = {}) {
+  const windowMs = opts.windowMs ?? COALESCE_MS;
+  const maxBytes = opts.maxBytes ?? COALESCE_BYTES;
+  const created = Math.floor(Date.now() / 1000);
+  const prefix = `data: {"id":${JSON.stringify(id)},"object":"chat.completion.chunk","created":${created},"model":${JSON.stringify(model)},"choices":[{"index":0,"delta":`;
+  const suffix = ',"finish_reason":null}]}\n\n';
+
+  let text = '';
+  let timer = null;
+  let draining = null;
+  let closed = false;
+
+  res.once('close', () => {
+    closed = true;
+  });
+
+  function write(str) {
+    if (closed || res.writableEnded) return;
+    if (!res.write(str) && !draining) {
+      draining = new Promise((resolve) => {
+        const done = () => {
+          res.off('drain', done);
+          res.off('close', done);
+          draining = null;
+          resolve();
+          if (text && !timer) flushText();
+        };
+        res.on('drain', done);
+        res.on('close', done);
+      });
+    }
+  }
+
+  function flushText() {
+    if (timer) {
+      clearTimeout(timer);
+      timer = null;
+    }
+    if (!text) return;
+    const s = text;
+    text = '';
+    write(`${prefix}{"content":${JSON.stringify(s)}}${suffix}`);
+  }
+
+  /** 写一个任意 delta；先把已合并的文本刷出，保证顺序 */
+  function delta(obj, finishReason = null) {
+    flushText();
+    const tail = finishReason == null ? suffix : `,"finish_reason":${JSON.stringify(finishReason)}}]}\n\n`;
+    write(`${prefix}${JSON.stringify(obj)}${tail}`);
+  }
+
+  return {
+    delta,
+    /** 追加文本 delta，按窗口/字节数合并写出 */
+    content(s) {
+      text += s;
+      if (windowMs === 0 || text.length >= maxBytes) {
+        if (!draining) flushText();
+      } else if (!timer && !draining) {
+        timer = setTimeout(flushText, windowMs);
+      }
+    },
+    /** 结束：刷出剩余文本，写 finish_reason 与 [DONE] */
+    finish(finishReason = 'stop') {
+      delta({}, finishReason);
+      write('data: [DONE]\n\n');
+    },
+    /** 背压：写缓冲已满时返回等待 drain 的 Promise，否则返回 null */
+    ready() {
+      return draining;
+    },
+    flush: flushText,
+  };
+}
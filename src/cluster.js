@@ -0,0 +1,320 @@
+/**
+ * 集群模式：主进程 fork N 个 worker 共享同一端口（node:cluster），单进程的 JSON 解析与 SSE 转换不再成为瓶颈。
+ *
+ * 主进程只做协调，不处理请求：
+ * - 用量：worker 为副本，变更发给主进程写日志持久化，再转发给其他 worker
+ * - 账号不可用标记、冷却状态：转发给其他 worker
+ * - 并发上限：worker 以 CODEX_WORKER_COUNT 启动，CODEX_MAX_INFLIGHT 与单账号上限按 worker 数均分，各 worker 只使用自己的一份
+ *   （硬上限，见 scheduler.js）；每账号进行中请求数另按 worker 汇总，向每个 worker 下发「其他 worker 的合计」，
+ *   调度时据此避开合计已满的账号（异步广播，worker 数大于单账号上限时可能短暂超出）
+ * - 新 worker 初始化完成（ready）时下发完整快照；worker 意外退出时自动补齐
+ * - 访问日志：worker 的记录由主进程统一写入与轮转
+ * - /metrics：收到请求的 worker 经主进程向所有 worker 收集指标状态后合并
+ * - SIGHUP：逐个滚动重启 worker（新 worker 开始监听后再让旧 worker 处理完进行中请求退出）
+ *
+ * 进程数：--workers N / --workers=N 或 CODEX_WORKERS，auto 为 CPU 核数；默认 1（不启用集群）
+ */
+import cluster from 'cluster';
+import { availableParallelism, cpus } from 'os';
+import {
+  setUsageReplica,
+  applyUsageEntry,
+  getUsageSnapshot,
+  loadUsageSnapshot,
+  flushUsageSync,
+} from './usageTracker.js';
+import { setAccountStatusListener, applyAccountStatus, getAccountStatusSnapshot } from './accountStatus.js';
+import { setSchedulerListener, applyRemoteLoad, applyRemoteCooldown } from './scheduler.js';
+import { getMetricsState } from './metrics.js';
+import { writeAccessRecord, setAccessLogForwarder } from './accessLog.js';
+
+// 旧 worker 断开后等待进行中请求结束的上限，超时强制结束
+const SHUTDOWN_TIMEOUT_MS = Math.max(1000, Number(process.env.CODEX_WORKER_SHUTDOWN_MS) || 30_000);
+// 收集各 worker 指标的等待上限，超时的 worker 不计入本次结果
+const METRICS_TIMEOUT_MS = 1000;
+
+let metricsSeq = 0;
+const metricsWaiters = new Map(); // rid -> resolve（worker 端等待主进程汇总结果）
+
+function cpuCount() {
+  return typeof availableParallelism === 'function' ? availableParallelism() : cpus().length;
+}
+
+/**
+ * 解析 worker 数：命令行优先，其次 CODEX_WORKERS
+ */
+export function getWorkerCount(argv = process.argv.slice(2)) {
+  let raw = process.env.CODEX_WORKERS;
+  for (let i = 0; i < argv.length; i++) {
+    if (argv[i] === '--workers') raw = argv[i + 1];
+    else if (argv[i].startsWith('--workers=')) raw = argv[i].slice('--workers='.length);
+  }
+  if (raw == null || raw === '') return 1;
+  if (String(raw).toLowerCase() === 'auto') return cpuCount();
+  return Math.max(1, Math.floor(Number(raw)) || 1);
+}
+
+/**
+ * 主进程：fork 并管理 worker，转发共享状态
+ */
+export function startPrimary(count) {
+  const loads = new Map(); // worker.id -> Map(accountId -> 进行中请求数)
+  const cooldowns = new Map(); // accountId -> { until, failures }
+  const dirty = new Set(); // 待广播进行中请求数的账号
+  let broadcastScheduled = false;
+  const metricsRounds = new Map(); // rid -> { requester, states, pending, timer }
+  let shuttingDown = false;
+  let restarting = false;
+
+  const workers = () => Object.values(cluster.workers || {}).filter((w) => w && w.isConnected());
+
+  function sendOthers(from, msg) {
+    for (const w of workers()) {
+      if (w !== from) w.send(msg);
+    }
+  }
+
+  function totalLoad(accountId) {
+    let n = 0;
+    for (const m of loads.values()) n += m.get(accountId) || 0;
+    return n;
+  }
+
+  // 同一轮事件循环内的多次变更合并为一次广播
+  function scheduleLoadBroadcast(accountId) {
+    dirty.add(accountId);
+    if (broadcastScheduled) return;
+    broadcastScheduled = true;
+    setImmediate(() => {
+      broadcastScheduled = false;
+      const ids = [...dirty];
+      dirty.clear();
+      for (const w of workers()) {
+        const own = loads.get(w.id);
+        const remote = {};
+        for (const id of ids) remote[id] = totalLoad(id) - (own?.get(id) || 0);
+        w.send({ codex: 'remoteLoad', loads: remote });
+      }
+    });
+  }
+
+  function snapshotFor(worker) {
+    const remote = {};
+    for (const [wid, m] of loads) {
+      if (wid === worker.id) continue;
+      for (const [id, n] of m) remote[id] = (remote[id] || 0) + n;
+    }
+    return {
+      codex: 'snapshot',
+      usage: getUsageSnapshot(),
+      status: getAccountStatusSnapshot(),
+      cooldowns: Object.fromEntries(cooldowns),
+      loads: remote,
+    };
+  }
+
+  function finishMetricsRound(rid) {
+    const round = metricsRounds.get(rid);
+    if (!round) return;
+    metricsRounds.delete(rid);
+    clearTimeout(round.timer);
+    if (round.requester.isConnected()) round.requester.send({ codex: 'metricsResult', rid: round.rid, states: round.states });
+  }
+
+  function onMessage(worker, msg) {
+    if (!msg || typeof msg !== 'object' || !msg.codex) return;
+    switch (msg.codex) {
+      case 'ready':
+        worker.send(snapshotFor(worker));
+        break;
+      case 'usage':
+        applyUsageEntry(msg.entry);
+        sendOthers(worker, msg);
+        break;
+      case 'status':
+        applyAccountStatus(msg.id, msg.since);
+        sendOthers(worker, msg);
+        break;
+      case 'access':
+        writeAccessRecord(msg.record);
+        break;
+      case 'cooldown':
+        if (msg.until > 0) cooldowns.set(msg.id, { until: msg.until, failures: msg.failures });
+        else cooldowns.delete(msg.id);
+        sendOthers(worker, msg);
+        break;
+      case 'metrics': {
+        // 向所有 worker（含发起者）收集指标状态
+        const rid = `${worker.id}:${msg.rid}`;
+        const targets = workers();
+        const round = { requester: worker, rid: msg.rid, states: [], pending: new Set(targets.map((w) => w.id)) };
+        round.timer = setTimeout(() => finishMetricsRound(rid), METRICS_TIMEOUT_MS);
+        metricsRounds.set(rid, round);
+        for (const w of targets) w.send({ codex: 'metricsCollect', rid });
+        break;
+      }
+      case 'metricsState': {
+        const round = metricsRounds.get(msg.rid);
+        if (!round) break;
+        round.states.push(msg.state);
+        round.pending.delete(worker.id);
+        if (round.pending.size === 0) finishMetricsRound(msg.rid);
+        break;
+      }
+      case 'load': {
+        let m = loads.get(worker.id);
+        if (!m) loads.set(worker.id, (m = new Map()));
+        const n = Math.max(0, (m.get(msg.id) || 0) + msg.delta);
+        if (n) m.set(msg.id, n);
+        else m.delete(msg.id);
+        scheduleLoadBroadcast(msg.id);
+        break;
+      }
+      default:
+        break;
+    }
+  }
+
+  function fork() {
+    const worker = cluster.fork({ CODEX_WORKER_COUNT: String(count) });
+    worker.on('message', (msg) => onMessage(worker, msg));
+    return worker;
+  }
+
+  cluster.on('exit', (worker, code, signal) => {
+    const m = loads.get(worker.id);
+    loads.delete(worker.id);
+    if (m) for (const id of m.keys()) scheduleLoadBroadcast(id);
+    if (shuttingDown || worker.exitedAfterDisconnect) return;
+    console.warn(`[WARN] worker ${worker.process.pid} 退出（${signal || code}），重新启动`);
+    fork();
+  });
+
+  // 滚动重启：每次替换一个 worker，新 worker 开始监听后再断开旧 worker
+  async function rollingRestart() {
+    if (restarting || shuttingDown) return;
+    restarting = true;
+    console.log('[OK] 收到 SIGHUP，滚动重启 worker');
+    for (const old of workers()) {
+      if (shuttingDown) break;
+      const next = fork();
+      await new Promise((resolve) => {
+        next.once('listening', resolve);
+        next.once('exit', resolve);
+      });
+      await stopWorker(old);
+    }
+    restarting = false;
+  }
+
+  function stopWorker(worker) {
+    return new Promise((resolve) => {
+      if (worker.isDead()) return resolve();
+      const timer = setTimeout(() => worker.kill(), SHUTDOWN_TIMEOUT_MS);
+      worker.once('exit', () => {
+        clearTimeout(timer);
+        resolve();
+      });
+      worker.disconnect();
+    });
+  }
+
+  process.on('SIGHUP', () => {
+    rollingRestart().catch((e) => console.error('滚动重启失败:', e.message));
+  });
+
+  // 先让所有 worker 处理完进行中请求，再退出主进程（退出时 usageTracker 刷盘）
+  for (const sig of ['SIGINT', 'SIGTERM']) {
+    process.once(sig, async () => {
+      shuttingDown = true;
+      await Promise.all(workers().map(stopWorker));
+      flushUsageSync();
+      process.exit(0);
+    });
+  }
+
+  console.log(`[OK] 集群模式：主进程 ${process.pid}，启动 ${count} 个 worker`);
+  for (let i = 0; i < count; i++) fork();
+}
+
+/**
+ * worker：用量改为副本，本地状态变更上报主进程，应用主进程转发的其他 worker 的变更
+ * @param {() => import('http').Server | null} getServer - 主进程要求退出时关闭的 HTTP 服务
+ */
+export function initWorker(getServer) {
+  const send = (msg) => {
+    if (process.connected) process.send(msg);
+  };
+  setUsageReplica((entry) => send({ codex: 'usage', entry }));
+  setAccountStatusListener((id, since) => send({ codex: 'status', id, since }));
+  setSchedulerListener((type, id, data) => send({ codex: type, id, ...data }));
+  setAccessLogForwarder((record) => send({ codex: 'access', record }));
+
+  process.on('message', (msg) => {
+    if (!msg || typeof msg !== 'object' || !msg.codex) return;
+    switch (msg.codex) {
+      case 'snapshot':
+        loadUsageSnapshot(msg.usage);
+        for (const [id, since] of Object.entries(msg.status || {})) applyAccountStatus(id, since);
+        for (const [id, c] of Object.entries(msg.cooldowns || {})) applyRemoteCooldown(id, c.until, c.failures);
+        for (const [id, n] of Object.entries(msg.loads || {})) applyRemoteLoad(id, n);
+        break;
+      case 'usage':
+        applyUsageEntry(msg.entry);
+        break;
+      case 'status':
+        applyAccountStatus(msg.id, msg.since);
+        break;
+      case 'cooldown':
+        applyRemoteCooldown(msg.id, msg.until, msg.failures);
+        break;
+      case 'remoteLoad':
+        for (const [id, n] of Object.entries(msg.loads)) applyRemoteLoad(id, n);
+        break;
+      case 'metricsCollect':
+        send({ codex: 'metricsState', rid: msg.rid, state: getMetricsState() });
+        break;
+      case 'metricsResult': {
+        const resolve = metricsWaiters.get(msg.rid);
+        metricsWaiters.delete(msg.rid);
+        resolve?.(msg.states);
+        break;
+      }
+      default:
+        break;
+    }
+  });
+
+  // 监听注册后再请求快照（worker 'online' 时模块可能尚未加载完，早到的消息会丢失）
+  send({ codex: 'ready' });
+
+  // 主进程断开（滚动重启或退出）：停止接受新连接，进行中请求结束后退出
+  process.on('disconnect', () => {
+    const server = getServer();
+    if (!server) return process.exit(0);
+    server.close(() => process.exit(0));
+    server.closeIdleConnections?.();
+  });
+
+  // 终端 Ctrl+C 会同时发给 worker：交给主进程统一断开
+  for (const sig of ['SIGINT', 'SIGTERM']) process.on(sig, () => {});
+}
+
+/**
+ * 返回需要合并的指标状态列表：集群 worker 中为所有 worker 的状态，单进程时只有本进程
+ */
+export function collectClusterMetrics() {
+  if (!cluster.isWorker || !process.connected) return Promise.resolve([getMetricsState()]);
+  const rid = ++metricsSeq;
+  return new Promise((resolve) => {
+    const timer = setTimeout(() => {
+      metricsWaiters.delete(rid);
+      resolve([getMetricsState()]);
+    }, METRICS_TIMEOUT_MS * 2);
+    metricsWaiters.set(rid, (states) => {
+      clearTimeout(timer);
+      resolve(states);
+    });
+    process.send({ codex: 'metrics', rid });
+  });
+}
@@ -1,19 +1,31 @@
 import express from 'express';
 import { join, dirname, resolve } from 'path';
 import { fileURLToPath, pathToFileURL } from 'url';
+import cluster from 'cluster';
 import { readFileSync, writeFileSync, mkdirSync, existsSync } from 'fs';
-import { loadAuth, createRoundRobinProvider } from './auth.js';
-import { handleChatCompletions } from './proxy.js';
+import { loadAuth } from './auth.js';
+import { createScheduler, getSchedulerStats } from './scheduler.js';
+import { AdmissionQueue, admissionCapacity } from './admission.js';
+import { handleChatCompletions, handleResponses, BACKEND_URL, getPrefixCacheStats } from './proxy.js';
+import { warmBackendPool, getBackendPoolStats } from './backendPool.js';
+import { getResponseCacheStats } from './responseCache.js';
+import { getSingleflightStats } from './singleflight.js';
+import { loadTokenizer, getTokenizerStats } from './tokenizer.js';
 import {
   listAccountsForApi,
   addAccount,
   deleteAccount,
   loadAccountsForProxy,
   getAccountsPath,
+  accountRegistry,
 } from './accounts.js';
 import { getAuthorizeUrl, exchangeCodeForToken } from './oauth.js';
 import { isAccountUnavailable } from './accountStatus.js';
-import { getRemainingPct, getUsedTokens, QUOTA } from './usageTracker.js';
+import { getRemainingPct, getUsedTokens, getUsageStats, QUOTA } from './usageTracker.js';
+import { getWorkerCount, startPrimary, initWorker, collectClusterMetrics } from './cluster.js';
+import { createTrace, observeRequest, renderMetrics, mergeMetricsStates } from './metrics.js';
+import { RequestLog, logMatcher } from './requestLog.js';
+import { logAccess, getAccessLogStats } from './accessLog.js';
 
 const __dirname = fileURLToPath(new URL('.', import.meta.url));
 const app = express();
@@ -66,19 +78,22 @@ async function emailInboxHasMail(serviceUrl, email) {
   }
 }
 
-// 当前使用的认证来源：function（轮询）或 string（单路径）
-let authProviderRef = { current: null };
+// 当前使用的认证来源：function（调度器）或 string（单路径）；auths 为构建调度器时的账号列表
+let authProviderRef = { current: null, auths: null };
 
-function getAuthProvider() {
+function getAuthProvider(opts) {
+  // accounts.json 被其他 worker 或手动修改后，注册表快照变化，重建调度器
+  if (authProviderRef.auths && loadAccountsForProxy() !== authProviderRef.auths) refreshAuthProvider();
   const p = authProviderRef.current;
-  if (typeof p === 'function') return p();
+  if (typeof p === 'function') return p(opts);
   return loadAuth(p);
 }
 
 function refreshAuthProvider() {
   const auths = loadAccountsForProxy();
+  authProviderRef.auths = auths;
   if (auths.length > 0) {
-    authProviderRef.current = createRoundRobinProvider(auths);
+    authProviderRef.current = createScheduler(auths);
     return auths.length;
   }
   authProviderRef.current = AUTH_PATH;
@@ -105,30 +120,32 @@ try {
 
 app.use(express.static(join(__dirname, '..', 'public')));
 
-const requestLogs = [];
-const MAX_LOGS = 200;
-const LOG_PATHS = ['/health', '/v1/models', '/v1/chat/completions', '/chat/completions', '/responses'];
+// 请求日志环形缓冲（CODEX_LOG_SIZE 条）
+const requestLog = new RequestLog();
+const LOG_PATHS = ['/health', '/v1/models', '/v1/chat/completions', '/chat/completions', '/v1/responses', '/responses'];
 
 app.use((req, res, next) => {
   if (!LOG_PATHS.includes(req.path)) return next();
   const start = Date.now();
   res._logMeta = { time: new Date().toISOString(), method: req.method, path: req.path };
-  res.on('finish', () => {
-    const status = res.statusCode;
-    const level = status >= 500 ? 'ERR' : status >= 400 ? 'WARN' : 'SUCCESS';
-    requestLogs.unshift({
+  // 正常结束记 finish；客户端中途断开（未 finish 即 close）记为已取消，状态码按惯例记 499
+  res.on('close', () => {
+    const canceled = !res.writableFinished;
+    const status = canceled ? 499 : res.statusCode;
+    const level = canceled ? 'WARN' : status >= 500 ? 'ERR' : status >= 400 ? 'WARN' : 'SUCCESS';
+    requestLog.push({
       type: 'request',
       level,
       ...res._logMeta,
       status,
+      ...(canceled ? { canceled: true } : {}),
       ms: Date.now() - start,
     });
-    if (requestLogs.length > MAX_LOGS) requestLogs.pop();
   });
   next();
 });
 
-const API_KEY_PATHS = ['/v1/models', '/v1/chat/completions', '/chat/completions', '/responses'];
+const API_KEY_PATHS = ['/v1/models', '/v1/chat/completions', '/chat/completions', '/v1/responses', '/responses'];
 app.use((req, res, next) => {
   if (!API_KEY_PATHS.includes(req.path)) return next();
   const cfg = loadConfig();
@@ -142,6 +159,50 @@ app.use((req, res, next) => {
   next();
 });
 
+// 准入队列：并发上限默认 = 可调度（健康）账号数 × 本进程单账号名额（单账号上限为 0 时不限），
+// 冷却中的账号不提供名额，多出的请求在队列中等待而不是压到仍健康的账号上。
+// 集群模式下 CODEX_MAX_INFLIGHT 与单账号上限按 worker 数均分
+const admission = new AdmissionQueue(() => admissionCapacity(loadAccountsForProxy()));
+const CHAT_PATHS = ['/v1/chat/completions', '/chat/completions', '/v1/responses', '/responses'];
+
+function clientKeyOf(req) {
+  const auth = req.headers.authorization;
+  if (auth && String(auth).startsWith('Bearer ')) return 'key:' + String(auth).slice(7).trim();
+  return 'ip:' + (req.ip || '');
+}
+
+app.use(async (req, res, next) => {
+  if (req.method !== 'POST' || !CHAT_PATHS.includes(req.path)) return next();
+  // 请求级追踪：排队时间在此记录，其余由 proxy 填充，响应关闭时写入 /metrics 与访问日志
+  const trace = createTrace();
+  res._trace = trace;
+  res.setHeader('X-Request-Id', trace.requestId);
+  res.once('close', () => {
+    const status = res.writableFinished ? res.statusCode : 499;
+    observeRequest(trace, status);
+    logAccess(trace, status, req.path);
+  });
+  const ac = new AbortController();
+  const onClose = () => ac.abort();
+  res.once('close', onClose);
+  let release;
+  try {
+    release = await admission.acquire(clientKeyOf(req), ac.signal);
+  } catch (e) {
+    res.off('close', onClose);
+    trace.queueMs = Date.now() - trace.startedAt;
+    if (e.status !== 429) return; // 客户端已断开
+    res.setHeader('Retry-After', String(e.retryAfter));
+    res.status(429).json({ error: { message: e.message, type: 'rate_limit_error', code: 'rate_limit_exceeded' } });
+    return;
+  }
+  res.off('close', onClose);
+  trace.queueMs = Date.now() - trace.startedAt;
+  if (ac.signal.aborted) return release();
+  res.once('close', release);
+  next();
+});
+
 function getOAuthRedirectUri(req) {
   if (process.env.OAUTH_REDIRECT_URI) return process.env.OAUTH_REDIRECT_URI.trim();
   const publicUrl = (process.env.PUBLIC_URL || '').trim().replace(/\/+$/, '');
@@ -207,48 +268,139 @@ app.get('/v1/models', (req, res) => {
   });
 });
 
-app.post('/v1/chat/completions', async (req, res) => {
-  const { accounts } = listAccountsForApi();
-  const accountCount = accounts.length || 1;
-  const usedAuth = await handleChatCompletions(req.body, res, getAuthProvider, accountCount);
-  if (res._logMeta && usedAuth) {
-    const mask = usedAuth.accountId ? usedAuth.accountId.slice(0, 8) + '…' : '—';
-    const found = accounts.find((a) => a.accountIdMask === mask);
-    res._logMeta.account = found ? (found.name || `账号${found.index + 1}`) : mask;
-  }
-});
-
-app.post('/chat/completions', async (req, res) => {
-  const { accounts } = listAccountsForApi();
-  const accountCount = accounts.length || 1;
-  const usedAuth = await handleChatCompletions(req.body, res, getAuthProvider, accountCount);
+/**
+ * 对话类路由：/responses 且请求体带 input（Responses API）时直通后端，其余按 Chat Completions 处理
+ */
+async function handleChatRoute(req, res) {
+  const accountCount = accountRegistry.count() || 1;
+  const body = req.body || {};
+  const isResponsesApi = req.path.endsWith('/responses') && body.input !== undefined && body.messages === undefined;
+  const handler = isResponsesApi ? handleResponses : handleChatCompletions;
+  // 请求级取消：客户端在响应结束前断开时中止后端请求与流读取
+  const ac = new AbortController();
+  res.once('close', () => {
+    if (!res.writableFinished) ac.abort();
+  });
+  const cache = !/no-cache|no-store/i.test(String(req.headers['cache-control'] || ''));
+  const usedAuth = await handler(body, res, getAuthProvider, accountCount, { signal: ac.signal, cache, trace: res._trace });
   if (res._logMeta && usedAuth) {
-    const mask = usedAuth.accountId ? usedAuth.accountId.slice(0, 8) + '…' : '—';
-    const found = accounts.find((a) => a.accountIdMask === mask);
-    res._logMeta.account = found ? (found.name || `账号${found.index + 1}`) : mask;
+    const found = usedAuth.accountId ? accountRegistry.getByAccountId(usedAuth.accountId) : null;
+    res._logMeta.account = found ? found.name : (usedAuth.accountId ? usedAuth.accountId.slice(0, 8) + '…' : '—');
   }
-});
+}
 
-// 兼容将 Base URL 设为根且请求 /responses 的客户端（如部分 ChatGPT 风格客户端）
-app.post('/responses', async (req, res) => {
-  const { accounts } = listAccountsForApi();
-  const accountCount = accounts.length || 1;
-  const usedAuth = await handleChatCompletions(req.body, res, getAuthProvider, accountCount);
-  if (res._logMeta && usedAuth) {
-    const mask = usedAuth.accountId ? usedAuth.accountId.slice(0, 8) + '…' : '—';
-    const found = accounts.find((a) => a.accountIdMask === mask);
-    res._logMeta.account = found ? (found.name || `账号${found.index + 1}`) : mask;
-  }
-});
+app.post('/v1/chat/completions', handleChatRoute);
+app.post('/chat/completions', handleChatRoute);
+// Responses API（client.responses.create）；兼容将 Base URL 设为根且请求 /responses 的客户端
+app.post('/v1/responses', handleChatRoute);
+app.post('/responses', handleChatRoute);
 
+/**
+ * 日志查询：从新到旧；?since=<id> 只返回更新的条目，?level=WARN,ERR&path=&account= 过滤，?limit= 限制条数
+ */
 app.get('/api/logs', (req, res) => {
-  res.json({ logs: requestLogs });
+  res.json(requestLog.query(req.query));
 });
 app.delete('/api/logs', (req, res) => {
-  requestLogs.length = 0;
+  requestLog.clear();
   res.json({ ok: true });
 });
 
+/**
+ * 日志实时推送（SSE）：先补发 since（或 Last-Event-ID）之后的条目，再推送新日志；过滤参数同 /api/logs。
+ * 事件：默认事件的 data 为一条日志，clear 表示日志已清空
+ */
+app.get('/api/logs/stream', (req, res) => {
+  res.set({ 'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'Connection': 'keep-alive' });
+  res.flushHeaders();
+  const match = logMatcher(req.query);
+  // 客户端读得慢（res.write 返回 false）时暂停推送，不在内存里为它堆积日志；
+  // drain 后从环形缓冲补发 lastSent 之后的条目（期间被覆盖的最旧条目即丢弃），清空事件同样延后补发
+  let paused = false;
+  let clearPending = false;
+  const write = (chunk) => {
+    if (!res.write(chunk)) paused = true;
+  };
+  // EventSource 自动重连时带 Last-Event-ID，优先于 URL 中首次连接时的 since
+  let lastSent = Number(req.get('last-event-id') ?? req.query.since ?? requestLog.lastId) || 0;
+  const send = (e) => {
+    write(`id: ${e.id}\ndata: ${JSON.stringify(e)}\n\n`);
+    lastSent = e.id;
+  };
+  const catchUp = () => {
+    paused = false;
+    if (clearPending) {
+      clearPending = false;
+      write('event: clear\ndata: {}\n\n');
+    }
+    const missed = requestLog.query({ ...req.query, since: lastSent }).logs;
+    for (let i = missed.length - 1; i >= 0 && !paused; i--) send(missed[i]);
+  };
+  catchUp();
+  res.on('drain', catchUp);
+  const ping = setInterval(() => {
+    if (!paused) write(': ping\n\n');
+  }, 25_000);
+  const stop = () => {
+    unsubscribe();
+    clearInterval(ping);
+    res.off('drain', catchUp);
+  };
+  const unsubscribe = requestLog.subscribe((e) => {
+    if (e === undefined) {
+      stop();
+      res.end();
+    } else if (e === null) {
+      if (paused) clearPending = true;
+      else write('event: clear\ndata: {}\n\n');
+    } else if (!paused && match(e)) {
+      send(e);
+    }
+  });
+  req.on('close', stop);
+});
+
+/**
+ * 本进程资源占用：CPU 为累计毫秒数，压测脚本按前后两次采样的差值计算 CPU 占用率
+ */
+function processStats() {
+  const mem = process.memoryUsage();
+  const cpu = process.cpuUsage();
+  return {
+    pid: process.pid,
+    uptimeMs: Math.round(process.uptime() * 1000),
+    cpuUserMs: Math.round(cpu.user / 1000),
+    cpuSystemMs: Math.round(cpu.system / 1000),
+    rssMb: Math.round(mem.rss / 1048576 * 10) / 10,
+    heapUsedMb: Math.round(mem.heapUsed / 1048576 * 10) / 10,
+  };
+}
+
+app.get('/api/stats', (req, res) => {
+  res.json({
+    process: processStats(),
+    pool: getBackendPoolStats(),
+    usage: getUsageStats(),
+    scheduler: getSchedulerStats(),
+    admission: admission.stats(),
+    tokenizer: getTokenizerStats(),
+    prefixCache: getPrefixCacheStats(),
+    responseCache: getResponseCacheStats(),
+    singleflight: getSingleflightStats(),
+    accessLog: getAccessLogStats(),
+  });
+});
+
+// Prometheus 指标；集群模式下合并所有 worker
+app.get('/metrics', async (req, res) => {
+  try {
+    const states = await collectClusterMetrics();
+    res.type('text/plain; version=0.0.4; charset=utf-8').send(renderMetrics(mergeMetricsStates(states)));
+  } catch (e) {
+    res.status(500).type('text/plain').send(e.message);
+  }
+});
+
 app.get('/api/usage', async (req, res) => {
   try {
     const auths = loadAccountsForProxy();
@@ -379,7 +531,7 @@ app.patch('/api/settings', (req, res) => {
 function startServer() {
   const n = refreshAuthProvider();
   if (n > 0) {
-    console.log('[OK] 已加载 ' + n + ' 个账号（轮询）');
+    console.log('[OK] 已加载 ' + n + ' 个账号（调度策略: ' + getSchedulerStats().strategy + '）');
   } else {
     try {
       loadAuth(AUTH_PATH);
@@ -388,6 +540,7 @@ function startServer() {
       console.warn('[WARN] 未配置账号，请访问配置页添加或设置 CODEX_AUTH_PATH:', e.message);
     }
   }
+  loadTokenizer().catch(() => {});
   const server = app.listen(PORT, '0.0.0.0', () => {
     const mockReq = { get: (h) => (h === 'host' ? `localhost:${PORT}` : undefined), secure: false };
     const oauthRedirect = getOAuthRedirectUri(mockReq);
@@ -398,10 +551,12 @@ function startServer() {
     console.log('   对话接口: http://localhost:' + PORT + '/v1/chat/completions');
     console.log('   建议模型: gpt-5.3-codex\n');
   });
+  warmBackendPool(BACKEND_URL).catch(() => {});
 
+  // 多账号轮询提示：只在有新日志之后追加一条，空闲时不会用重复提示挤掉请求日志
   setInterval(() => {
-    if (loadAccountsForProxy().length > 1) {
-      requestLogs.unshift({
+    if (loadAccountsForProxy().length > 1 && requestLog.latest()?.messageKey !== 'logs.poll_status') {
+      requestLog.push({
         type: 'system',
         level: 'INFO',
         time: new Date().toISOString(),
@@ -413,17 +568,42 @@ function startServer() {
         messageKey: 'logs.poll_status',
         account: '',
       });
-      if (requestLogs.length > MAX_LOGS) requestLogs.pop();
     }
   }, 5000);
   return server;
 }
 
-export { app, startServer, PORT };
+/**
+ * 命令行入口：--workers N（或 CODEX_WORKERS）大于 1 时以集群模式启动，否则单进程
+ */
+function main(argv = process.argv.slice(2)) {
+  if (cluster.isWorker) {
+    let server = null;
+    // 主进程断开时先结束日志 SSE 长连接，否则 server.close() 会一直等待
+    process.once('disconnect', () => requestLog.closeSubscribers());
+    initWorker(() => server);
+    server = startServer();
+    return server;
+  }
+  const workers = getWorkerCount(argv);
+  if (workers > 1) return startPrimary(workers);
+  const server = startServer();
+  // Ctrl+C / kill 时走 process.exit，触发 usageTracker 的退出刷盘。只在命令行入口注册：
+  // Electron 直接调用 startServer，退出流程由其自身的生命周期管理；集群 worker 由主进程统一断开
+  for (const sig of ['SIGINT', 'SIGTERM']) {
+    process.once(sig, () => {
+      server.close();
+      process.exit(0);
+    });
+  }
+  return server;
+}
+
+export { app, startServer, main, PORT };
 
 const isMain =
   process.argv[1] &&
   pathToFileURL(resolve(process.argv[1])).href === new URL(import.meta.url).href;
 if (isMain) {
-  startServer();
+  main();
 }
@@ -0,0 +1,77 @@
+/**
+ * 简单 LRU：基于 Map 的插入顺序，按条目数与（可选）字节数双重上限淘汰最久未用的条目
+ */
+export class LruCache {
+  /**
+   * @param {object} opts
+   * @param {number} [opts.maxEntries] - 最大条目数
+   * @param {number} [opts.maxBytes] - 最大总字节数（需配合 sizeOf）
+   * @param {(value: any, key: any) => number} [opts.sizeOf] - 估算条目字节数
+   * @param {number} [opts.ttlMs] - 条目存活时间，0 为不过期
+   */
+  constructor(opts = {}) {
+    this.maxEntries = opts.maxEntries ?? 1000;
+    this.maxBytes = opts.maxBytes ?? Infinity;
+    this.sizeOf = opts.sizeOf || (() => 0);
+    this.ttlMs = opts.ttlMs ?? 0;
+    this.map = new Map(); // key -> { value, size, expiresAt }
+    this.bytes = 0;
+    this.hits = 0;
+    this.misses = 0;
+  }
+
+  get(key) {
+    const entry = this.map.get(key);
+    if (!entry) {
+      this.misses++;
+      return undefined;
+    }
+    if (entry.expiresAt && entry.expiresAt <= Date.now()) {
+      this.delete(key);
+      this.misses++;
+      return undefined;
+    }
+    this.map.delete(key);
+    this.map.set(key, entry);
+    this.hits++;
+    return entry.value;
+  }
+
+  has(key) {
+    const entry = this.map.get(key);
+    return !!entry && !(entry.expiresAt && entry.expiresAt <= Date.now());
+  }
+
+  set(key, value) {
+    const size = this.sizeOf(value, key);
+    // 先删除旧值：新值放不下时也不能留下过期的旧条目
+    this.delete(key);
+    if (size > this.maxBytes) return;
+    this.map.set(key, { value, size, expiresAt: this.ttlMs ? Date.now() + this.ttlMs : 0 });
+    this.bytes += size;
+    while (this.map.size > this.maxEntries || this.bytes > this.maxBytes) {
+      this.delete(this.map.keys().next().value);
+    }
+  }
+
+  delete(key) {
+    const entry = this.map.get(key);
+    if (!entry) return false;
+    this.map.delete(key);
+    this.bytes -= entry.size;
+    return true;
+  }
+
+  clear() {
+    this.map.clear();
+    this.bytes = 0;
+  }
+
+  get size() {
+    return this.map.size;
+  }
+
+  stats() {
+    return { entries: this.map.size, bytes: this.bytes, hits: this.hits, misses: this.misses };
+  }
+}
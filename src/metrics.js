@@ -0,0 +1,207 @@
+/**
+ * Prometheus 指标（GET /metrics，文本格式 0.0.4）：按账号掩码与模型分组的延迟直方图与计数器，用于账号池容量规划。
+ *
+ * - codex_ttft_seconds：首 token 时间（请求进入到后端首个输出）
+ * - codex_request_duration_seconds：请求总耗时
+ * - codex_tokens_per_second：输出速度（completion tokens / 首 token 之后的耗时）
+ * - codex_failovers：单个请求的故障切换次数
+ * - codex_queue_wait_seconds：准入队列等待时间
+ * - codex_requests_total：客户端响应状态码（499 为客户端断开）
+ * - codex_backend_responses_total：每次后端调用的 HTTP 状态码（网络错误记为 error）
+ *
+ * 每个序列是固定桶数的 Float64Array，记录一次为 O(1)；序列数超过 CODEX_METRICS_MAX_SERIES（默认 1000）后
+ * 新的标签组合归入 other，避免客户端传入任意 model 导致无限增长。集群模式下由主进程收集各 worker 的状态合并输出。
+ */
+import { randomUUID } from 'crypto';
+
+const MAX_SERIES = Math.max(10, Number(process.env.CODEX_METRICS_MAX_SERIES) || 1000);
+const SEP = '\u0001';
+
+class Metric {
+  /**
+   * @param {string} name
+   * @param {string} help
+   * @param {'histogram'|'counter'} type
+   * @param {string[]} labelNames
+   * @param {number[]} [buckets] - 直方图上界（升序，不含 +Inf）
+   */
+  constructor(name, help, type, labelNames, buckets = []) {
+    this.name = name;
+    this.help = help;
+    this.type = type;
+    this.labelNames = labelNames;
+    this.buckets = Float64Array.from(buckets);
+    this.series = new Map(); // 标签值以 SEP 拼接 -> { counts, sum }
+  }
+
+  seriesFor(values) {
+    let key = values.join(SEP);
+    let s = this.series.get(key);
+    if (s) return s;
+    if (this.series.size >= MAX_SERIES) {
+      key = values.map(() => 'other').join(SEP);
+      s = this.series.get(key);
+      if (s) return s;
+    }
+    // 直方图：每桶计数 + 末尾 +Inf 桶；计数器只用 counts[0]
+    s = { counts: new Float64Array(this.type === 'histogram' ? this.buckets.length + 1 : 1), sum: 0 };
+    this.series.set(key, s);
+    return s;
+  }
+
+  observe(values, v) {
+    const s = this.seriesFor(values);
+    const b = this.buckets;
+    let i = 0;
+    while (i < b.length && v > b[i]) i++;
+    s.counts[i]++;
+    s.sum += v;
+  }
+
+  inc(values, n = 1) {
+    this.seriesFor(values).counts[0] += n;
+  }
+}
+
+const LABELS = ['account', 'model'];
+
+const metrics = {
+  ttft: new Metric('codex_ttft_seconds', 'Time to first backend token', 'histogram', LABELS,
+    [0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60]),
+  duration: new Metric('codex_request_duration_seconds', 'Total request duration', 'histogram', LABELS,
+    [0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600]),
+  tokensPerSec: new Metric('codex_tokens_per_second', 'Completion tokens per second after the first token', 'histogram', LABELS,
+    [1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500]),
+  failovers: new Metric('codex_failovers', 'Account failovers per request', 'histogram', LABELS,
+    [0, 1, 2, 3, 5, 10]),
+  queueWait: new Metric('codex_queue_wait_seconds', 'Time spent in the admission queue', 'histogram', LABELS,
+    [0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]),
+  requests: new Metric('codex_requests_total', 'Client responses by status code', 'counter', [...LABELS, 'status']),
+  backend: new Metric('codex_backend_responses_total', 'Backend responses by status code', 'counter', [...LABELS, 'status']),
+};
+
+function accountLabel(accountId) {
+  return accountId ? `${String(accountId).slice(0, 8)}…` : 'none';
+}
+
+function modelLabel(model) {
+  return model ? String(model) : 'unknown';
+}
+
+/**
+ * 新建请求级追踪对象，由 index.js 创建、proxy.js 填充（model、accountId、首 token、故障切换、token 数）；
+ * 同时用于 /metrics 与访问日志（accessLog.js）
+ */
+export function createTrace() {
+  return {
+    requestId: `req_${randomUUID().replace(/-/g, '')}`,
+    startedAt: Date.now(),
+    queueMs: 0,
+    firstTokenAt: 0,
+    model: '',
+    accountId: null,
+    failovers: 0,
+    promptTokens: 0,
+    completionTokens: 0,
+  };
+}
+
+/** 标记首 token（只记第一次） */
+export function markFirstToken(trace) {
+  if (trace && !trace.firstTokenAt) trace.firstTokenAt = Date.now();
+}
+
+/**
+ * 请求结束（响应关闭）时记录
+ * @param {object} trace - createTrace() 的结果
+ * @param {number} status - 客户端响应状态码，断开为 499
+ */
+export function observeRequest(trace, status) {
+  const now = Date.now();
+  const labels = [accountLabel(trace.accountId), modelLabel(trace.model)];
+  metrics.requests.inc([...labels, String(status)]);
+  metrics.duration.observe(labels, (now - trace.startedAt) / 1000);
+  metrics.queueWait.observe(labels, trace.queueMs / 1000);
+  if (status === 429 && !trace.accountId) return; // 准入队列拒绝，未发往后端
+  metrics.failovers.observe(labels, trace.failovers);
+  if (!trace.firstTokenAt) return;
+  metrics.ttft.observe(labels, (trace.firstTokenAt - trace.startedAt) / 1000);
+  const genMs = now - trace.firstTokenAt;
+  if (trace.completionTokens > 0 && genMs > 0) metrics.tokensPerSec.observe(labels, trace.completionTokens / (genMs / 1000));
+}
+
+/**
+ * 记录一次后端调用的状态码（status 为 0 表示网络错误）
+ */
+export function recordBackendStatus(accountId, model, status) {
+  metrics.backend.inc([accountLabel(accountId), modelLabel(model), status ? String(status) : 'error']);
+}
+
+/**
+ * 可序列化的指标状态（集群模式下经 IPC 发给主进程合并）：{ name: [[key, counts[], sum], ...] }
+ */
+export function getMetricsState() {
+  const state = {};
+  for (const m of Object.values(metrics)) {
+    state[m.name] = [...m.series].map(([key, s]) => [key, Array.from(s.counts), s.sum]);
+  }
+  return state;
+}
+
+/**
+ * 合并多个进程的指标状态
+ */
+export function mergeMetricsStates(states) {
+  const merged = {};
+  for (const state of states) {
+    for (const [name, series] of Object.entries(state || {})) {
+      const target = (merged[name] ||= new Map());
+      for (const [key, counts, sum] of series) {
+        const t = target.get(key);
+        if (!t) {
+          target.set(key, [key, counts.slice(), sum]);
+          continue;
+        }
+        for (let i = 0; i < counts.length; i++) t[1][i] += counts[i];
+        t[2] += sum;
+      }
+    }
+  }
+  return Object.fromEntries(Object.entries(merged).map(([name, m]) => [name, [...m.values()]]));
+}
+
+function escapeLabel(v) {
+  return String(v).replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n');
+}
+
+function formatNumber(v) {
+  return Number.isInteger(v) ? String(v) : String(Number(v.toFixed(6)));
+}
+
+/**
+ * 输出 Prometheus 文本格式；state 缺省为本进程
+ */
+export function renderMetrics(state = getMetricsState()) {
+  const lines = [];
+  for (const m of Object.values(metrics)) {
+    lines.push(`# HELP ${m.name} ${m.help}`, `# TYPE ${m.name} ${m.type}`);
+    for (const [key, counts, sum] of state[m.name] || []) {
+      const values = key.split(SEP);
+      const labels = m.labelNames.map((n, i) => `${n}="${escapeLabel(values[i] ?? '')}"`).join(',');
+      if (m.type === 'counter') {
+        lines.push(`${m.name}{${labels}} ${formatNumber(counts[0])}`);
+        continue;
+      }
+      let cumulative = 0;
+      for (let i = 0; i < m.buckets.length; i++) {
+        cumulative += counts[i];
+        lines.push(`${m.name}_bucket{${labels},le="${m.buckets[i]}"} ${cumulative}`);
+      }
+      cumulative += counts[m.buckets.length];
+      lines.push(`${m.name}_bucket{${labels},le="+Inf"} ${cumulative}`);
+      lines.push(`${m.name}_sum{${labels}} ${formatNumber(sum)}`);
+      lines.push(`${m.name}_count{${labels}} ${cumulative}`);
+    }
+  }
+  return lines.join('\n') + '\n';
+}
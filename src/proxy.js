@@ -1,9 +1,20 @@
-import { randomUUID } from 'crypto';
+import { randomUUID, createHash } from 'crypto';
 import { loadAuth } from './auth.js';
 import { markAccountUnavailable } from './accountStatus.js';
+import { beginAccountRequest, recordAccountLatency, endAccountRequest } from './scheduler.js';
 import { recordUsage, clearUsage } from './usageTracker.js';
+import { backendFetch } from './backendPool.js';
+import { readSseEvents, SseParser, SSE_DONE } from './sse.js';
+import { createChunkWriter } from './chunkWriter.js';
+import { countTokens } from './tokenizer.js';
+import { LruCache } from './lru.js';
+import { RESPONSE_CACHE_ENABLED, responseCacheKey, getCachedResponse, setCachedResponse } from './responseCache.js';
+import { acquireFlight } from './singleflight.js';
+import { ToolCallAssembler, TOOL_CALL_EVENTS, toResponsesTools, toResponsesToolChoice } from './toolCalls.js';
+import { markFirstToken, recordBackendStatus } from './metrics.js';
 
-const BACKEND_URL = 'https://chatgpt.com/backend-api/codex/responses';
+// CODEX_BACKEND_URL 可指向本地模拟后端（scripts/mock-backend.mjs）做压测
+export const BACKEND_URL = process.env.CODEX_BACKEND_URL || 'https://chatgpt.com/backend-api/codex/responses';
 
 const BROWSER_HEADERS = {
   'Accept': 'text/event-stream',
@@ -50,71 +61,223 @@ function getMessageContentParts(msg) {
   return content;
 }
 
-function messagesToInput(messages) {
-  const parts = [];
-  let hasImage = false;
-  const textLines = [];
+/**
+ * 对话前缀缓存：Agent 客户端每轮都会重发完整的 messages，
+ * 以逐条链式哈希（前缀哈希 + 本条消息）为 key 缓存“前 N 条消息”转换后的文本、图片与 token 数，
+ * 新请求只需从最长命中的前缀开始处理新增的消息。
+ * 链式哈希本身也不逐轮重算：按前两条消息找到同一对话的上一次请求，与之逐条比较（字符串直接比较），
+ * 相同的前缀沿用上次的 key，只对新增或改动的消息做序列化与哈希。
+ * 环境变量：CODEX_PREFIX_CACHE_ENTRIES（默认 256，同时是记住的对话数）、CODEX_PREFIX_CACHE_MB（默认 64，两者各自的上限）
+ */
+const prefixCache = new LruCache({
+  maxEntries: Math.max(1, Number(process.env.CODEX_PREFIX_CACHE_ENTRIES) || 256),
+  maxBytes: Math.max(1, Number(process.env.CODEX_PREFIX_CACHE_MB) || 64) * 1024 * 1024,
+  sizeOf: (state) => (state.text.length + state.itemChars) * 2 + state.images.length * 64 + 64,
+});
+// 对话起点（前两条消息的 key）-> 上一次请求的 { messages, keys, sizes }，sizes[i] 为前 i + 1 条消息的序列化长度之和
+const recentConversations = new LruCache({
+  maxEntries: Math.max(1, Number(process.env.CODEX_PREFIX_CACHE_ENTRIES) || 256),
+  maxBytes: Math.max(1, Number(process.env.CODEX_PREFIX_CACHE_MB) || 64) * 1024 * 1024,
+  sizeOf: (conv) => conv.sizes[conv.sizes.length - 1] * 2 + conv.keys.length * 64,
+});
+const keyCounters = { hashed: 0, reused: 0 };
+// 同一请求内 messagesToInput 与 estimatePromptTokens 共用一次转换结果
+const convertedByMessages = new WeakMap();
 
-  for (const msg of messages) {
-    const role = String(msg.role || 'user').toLowerCase();
-    const contentParts = getMessageContentParts(msg);
-    if (contentParts.length === 0) continue;
+// items：已封闭的输入条目（工具调用前的文本消息、function_call、function_call_output）；text/images：尚未封闭的文本消息
+const EMPTY_PREFIX = Object.freeze({ items: Object.freeze([]), itemChars: 0, text: '', images: Object.freeze([]), tokens: 0 });
 
-    const texts = contentParts.filter((p) => p.type === 'text').map((p) => p.text);
-    const images = contentParts.filter((p) => p.type === 'image_url');
+/**
+ * 第 i 条消息的链式 key 写入 keys[i]，序列化长度累加进 sizes[i]
+ */
+function hashMessage(keys, sizes, messages, i) {
+  const msg = messages[i];
+  const json = JSON.stringify([msg?.role, msg?.content, msg?.tool_calls, msg?.tool_call_id]);
+  keys[i] = createHash('sha1').update(i ? keys[i - 1] : '').update('\0').update(json).digest('base64');
+  sizes[i] = (i ? sizes[i - 1] : 0) + json.length;
+  keyCounters.hashed++;
+}
 
-    if (role === 'assistant') {
-      textLines.push(`Assistant: ${texts.join(' ')}`);
-      continue;
-    }
-    if (role === 'system') {
-      textLines.push(`System: ${texts.join(' ')}`);
-      continue;
-    }
-    // user
-    if (textLines.length) textLines.push('');
-    textLines.push(`User: ${texts.join(' ')}`);
-    for (const img of images) {
-      hasImage = true;
-      parts.push({ type: 'input_image', image_url: img.url, detail: img.detail || 'auto' });
+/** 两条消息的 key 字段是否相同；字符串 content 直接比较，不做序列化 */
+function sameMessage(a, b) {
+  if (a === b) return true;
+  if (!a || !b || a.role !== b.role || a.tool_call_id !== b.tool_call_id) return false;
+  if (a.content !== b.content && (typeof a.content === 'string' || JSON.stringify(a.content) !== JSON.stringify(b.content))) {
+    return false;
+  }
+  return a.tool_calls === b.tool_calls || JSON.stringify(a.tool_calls) === JSON.stringify(b.tool_calls);
+}
+
+/**
+ * 计算每条消息的链式 key；与同一对话上一次请求相同的前缀直接沿用其 key
+ */
+function messageKeys(messages) {
+  const n = messages.length;
+  const keys = new Array(n);
+  const sizes = new Array(n);
+  if (n === 0) return keys;
+  const anchor = Math.min(n, 2) - 1;
+  for (let i = 0; i <= anchor; i++) hashMessage(keys, sizes, messages, i);
+  const prev = recentConversations.get(keys[anchor]);
+  let i = anchor + 1;
+  if (prev) {
+    const limit = Math.min(n, prev.messages.length);
+    while (i < limit && sameMessage(messages[i], prev.messages[i])) {
+      keys[i] = prev.keys[i];
+      sizes[i] = prev.sizes[i];
+      i++;
     }
+    keyCounters.reused += i - anchor - 1;
   }
+  for (; i < n; i++) hashMessage(keys, sizes, messages, i);
+  recentConversations.set(keys[anchor], { messages, keys, sizes });
+  return keys;
+}
 
-  const fullText = textLines.join('\n').trim();
-  if (fullText) parts.unshift({ type: 'input_text', text: fullText });
-  if (parts.length === 0) return [];
-  return [{ type: 'message', role: 'user', content: parts }];
+function textMessageItem(text, images) {
+  const parts = [];
+  const fullText = text.trim();
+  if (fullText) parts.push({ type: 'input_text', text: fullText });
+  parts.push(...images);
+  return parts.length ? { type: 'message', role: 'user', content: parts } : null;
 }
 
-/** 官方标准：约 4 字符 = 1 token，用于估算 prompt_tokens */
-function estimatePromptTokens(openaiReq) {
-  let chars = 0;
-  const messages = openaiReq.messages || [];
-  for (const msg of messages) {
-    const parts = getMessageContentParts(msg);
-    for (const p of parts) {
-      if (p.type === 'text' && p.text) chars += String(p.text).length;
+/**
+ * 把未封闭的文本消息与新条目一起并入 items（工具调用与结果必须按顺序作为独立条目发给后端）
+ */
+function appendItems(state, added, tokens) {
+  const pending = textMessageItem(state.text, state.images);
+  const items = state.items.concat(pending ? [pending] : [], added);
+  const itemChars = state.itemChars + state.text.length + added.reduce((n, it) => n + (it.arguments || it.output || '').length, 0);
+  return { items, itemChars, text: '', images: EMPTY_PREFIX.images, tokens };
+}
+
+/**
+ * 在前缀状态上追加一条消息，返回新状态（缓存中的状态不可修改）
+ */
+function appendMessage(state, msg) {
+  const role = String(msg.role || 'user').toLowerCase();
+  const contentParts = getMessageContentParts(msg);
+
+  if (role === 'tool') {
+    const output = contentParts.filter((p) => p.type === 'text').map((p) => p.text).join('\n');
+    const item = { type: 'function_call_output', call_id: String(msg.tool_call_id ?? ''), output };
+    return appendItems(state, [item], state.tokens + countTokens(output));
+  }
+  if (role === 'assistant' && Array.isArray(msg.tool_calls) && msg.tool_calls.length) {
+    if (contentParts.length) state = appendMessage(state, { role: 'assistant', content: msg.content });
+    let tokens = state.tokens;
+    const calls = msg.tool_calls.map((tc) => {
+      const args = typeof tc.function?.arguments === 'string' ? tc.function.arguments : JSON.stringify(tc.function?.arguments ?? {});
+      tokens += countTokens(args);
+      return { type: 'function_call', call_id: String(tc.id ?? ''), name: tc.function?.name || '', arguments: args };
+    });
+    return appendItems(state, calls, tokens);
+  }
+  if (contentParts.length === 0) return state;
+
+  const texts = contentParts.filter((p) => p.type === 'text').map((p) => p.text);
+  const images = contentParts.filter((p) => p.type === 'image_url');
+  const tokens = state.tokens + texts.reduce((n, t) => n + countTokens(t), 0);
+
+  let line;
+  if (role === 'assistant') line = `Assistant: ${texts.join(' ')}`;
+  else if (role === 'system') line = `System: ${texts.join(' ')}`;
+  else line = `${state.text ? '\n' : ''}User: ${texts.join(' ')}`; // user 前空一行
+  const text = state.text ? `${state.text}\n${line}` : line;
+
+  const { items, itemChars } = state;
+  if (role !== 'assistant' && role !== 'system' && images.length) {
+    const added = images.map((img) => ({ type: 'input_image', image_url: img.url, detail: img.detail || 'auto' }));
+    return { items, itemChars, text, images: state.images.concat(added), tokens };
+  }
+  return { items, itemChars, text, images: state.images, tokens };
+}
+
+/**
+ * 转换整个 messages 列表：复用最长的已缓存前缀，只处理其后的消息
+ * @returns {{ items: object[], text: string, images: object[], tokens: number }}
+ */
+function convertMessages(messages) {
+  if (!Array.isArray(messages)) return EMPTY_PREFIX;
+  const memo = convertedByMessages.get(messages);
+  if (memo) return memo;
+  const keys = messageKeys(messages);
+  let state = EMPTY_PREFIX;
+  let start = 0;
+  for (let i = keys.length - 1; i >= 0; i--) {
+    if (prefixCache.has(keys[i])) {
+      state = prefixCache.get(keys[i]);
+      start = i + 1;
+      break;
     }
   }
+  for (let i = start; i < messages.length; i++) {
+    if (messages[i] != null) state = appendMessage(state, messages[i]);
+  }
+  if (start < messages.length) prefixCache.set(keys[keys.length - 1], state);
+  convertedByMessages.set(messages, state);
+  return state;
+}
+
+export function messagesToInput(messages) {
+  const { items, text, images } = convertMessages(messages);
+  const pending = textMessageItem(text, images);
+  return pending ? items.concat([pending]) : items.slice();
+}
+
+/** 用 BPE tokenizer 估算 prompt_tokens（后端未返回 usage 时使用），消息部分来自前缀缓存 */
+function estimatePromptTokens(openaiReq) {
+  let tokens = convertMessages(openaiReq.messages || []).tokens;
   const tools = openaiReq.tools;
   if (Array.isArray(tools)) {
-    chars += JSON.stringify(tools).length;
+    tokens += countTokens(JSON.stringify(tools));
   }
-  return Math.max(0, Math.ceil(chars / 4));
+  return tokens;
+}
+
+export function getPrefixCacheStats() {
+  return { ...prefixCache.stats(), conversations: recentConversations.size, keysHashed: keyCounters.hashed, keysReused: keyCounters.reused };
+}
+
+/**
+ * 后端 response.completed 中的 usage 优先，否则用本地计数
+ */
+function toChatUsage(backendUsage, promptTokens, completionTokens) {
+  const prompt = backendUsage?.input_tokens;
+  const completion = backendUsage?.output_tokens;
+  const usage = {
+    prompt_tokens: typeof prompt === 'number' ? prompt : promptTokens,
+    completion_tokens: typeof completion === 'number' ? completion : completionTokens,
+  };
+  usage.total_tokens = usage.prompt_tokens + usage.completion_tokens;
+  return usage;
 }
 
+/**
+ * 本地 completion 计数：后端已返回 output_tokens 时不再计数，否则对累计的输出文本一次性计数
+ * （逐个 delta 计数开销大，且会把跨 delta 的 token 拆开重复计算）
+ */
+function completionTokensOf(parts, backendUsage) {
+  if (typeof backendUsage?.output_tokens === 'number') return backendUsage.output_tokens;
+  return countTokens(parts.join(''), { cache: false });
+}
+
+const DEFAULT_MODEL = 'gpt-5.3-codex';
+const DEFAULT_INSTRUCTIONS = 'You are a helpful AI assistant. Provide clear, accurate, and concise responses.';
+
 /**
  * 构建发往 ChatGPT Codex 后端的请求体
  * 后端强制要求 stream 为 true，故始终传 true；是否向客户端流式由 handleChatCompletions 根据 openaiReq.stream 决定。
  */
 function buildResponsesRequest(openaiReq) {
   return {
-    model: openaiReq.model || 'gpt-5.3-codex',
-    instructions: 'You are a helpful AI assistant. Provide clear, accurate, and concise responses.',
+    model: openaiReq.model || DEFAULT_MODEL,
+    instructions: DEFAULT_INSTRUCTIONS,
     input: messagesToInput(openaiReq.messages || []),
-    tools: openaiReq.tools || [],
-    tool_choice: openaiReq.tool_choice ?? 'auto',
-    parallel_tool_calls: false,
+    tools: toResponsesTools(openaiReq.tools),
+    tool_choice: toResponsesToolChoice(openaiReq.tool_choice),
+    parallel_tool_calls: openaiReq.parallel_tool_calls === true,
     reasoning: null,
     store: false,
     stream: true,
@@ -123,99 +286,133 @@ function buildResponsesRequest(openaiReq) {
 }
 
 /**
- * 非流式：从 SSE 响应中收集完整文本后返回
+ * Responses API 请求直通：input（含 function_call / function_call_output 条目）、tools、previous_response_id 等原样转发，
+ * 仅补齐后端必需字段：字符串 input 包装为 message，缺省 instructions/model，强制 stream 与 store=false
  */
-async function parseStreamToText(stream) {
-  const reader = stream.getReader();
-  const dec = new TextDecoder();
-  let buffer = '';
+function buildPassthroughRequest(req) {
+  const input = typeof req.input === 'string'
+    ? [{ type: 'message', role: 'user', content: [{ type: 'input_text', text: req.input }] }]
+    : (req.input ?? []);
+  return {
+    ...req,
+    model: req.model || DEFAULT_MODEL,
+    instructions: req.instructions || DEFAULT_INSTRUCTIONS,
+    input,
+    store: false,
+    stream: true,
+  };
+}
+
+// 只关心文本 delta、函数调用事件与带 usage 的 response.completed，其余事件在 JSON.parse 前丢弃
+const TEXT_EVENTS = ['response.output_text.delta', 'response.completed', ...TOOL_CALL_EVENTS];
+
+/**
+ * 非流式：从 SSE 响应中收集完整文本与工具调用后返回 { text, tool_calls, usage }（usage 为后端返回的原始 usage，可能为 null）
+ * @param {object} [opts] - { tools, trace } tools 为请求中的 tools，用于推断缺失的函数名；trace 记录首 token 时间
+ */
+async function parseStreamToText(stream, opts = {}) {
   let fullText = '';
-  while (true) {
-    const { done, value } = await reader.read();
-    if (done) break;
-    buffer += dec.decode(value, { stream: true });
-    const lines = buffer.split('\n');
-    buffer = lines.pop() || '';
-    for (const line of lines) {
-      if (line.startsWith('data: ')) {
-        const data = line.slice(6);
-        if (data === '[DONE]') continue;
-        try {
-          const event = JSON.parse(data);
-          const type = event.type;
-          // 只从 delta 收集，避免与 output_item.done 重复
-          if (type === 'response.output_text.delta' && event.delta) {
-            fullText += event.delta;
-          }
-        } catch (_) {}
+  let usage = null;
+  const calls = new ToolCallAssembler({ tools: opts.tools, collect: true });
+  for await (const events of readSseEvents(stream, { types: TEXT_EVENTS })) {
+    for (const event of events) {
+      // 只从 delta 收集，避免与 output_item.done 重复
+      if (event.type === 'response.output_text.delta' && event.delta) {
+        markFirstToken(opts.trace);
+        fullText += event.delta;
+      } else if (event.type === 'response.completed') {
+        usage = event.response?.usage || null;
+      } else if (event !== SSE_DONE) {
+        if (calls.handle(event).length) markFirstToken(opts.trace);
       }
     }
   }
-  return fullText;
+  calls.flush();
+  return { text: fullText, tool_calls: calls.toolCalls(), usage };
 }
 
 /**
- * 流式：将后端 SSE 转为 OpenAI Chat Completions SSE 格式并写入 res
- * @param {object} [opts] - { onFinish(completionChars) } 流结束时回调，用于用量统计
+ * 流式：将后端 SSE 转为 OpenAI Chat Completions SSE 格式并写入 res；
+ * 工具调用参数随后端增量以 tool_calls[i].function.arguments delta 发出；客户端断开后停止读取并取消后端流
+ * @param {object} [opts] - { tools, trace, collect, onFinish({ completionTokens, usage, result }, err, canceled) } 流结束时回调，用于用量统计与账号调度；
+ *   collect 为 true 且后端正常完成时 result 为 { text, tool_calls }（与非流式结果同形，供响应缓存）
  */
 function pipeStreamToOpenAI(backendStream, res, model, id, opts = {}) {
-  const dec = new TextDecoder();
-  let buffer = '';
   let hasSentRole = false;
-  let completionChars = 0;
+  let hasToolCalls = false;
+  const output = []; // 输出文本与工具参数片段，结束时一次性计数
+  const texts = opts.collect ? [] : null;
+  let usage = null;
+  let completed = false;
   const onFinish = opts.onFinish || (() => {});
-  const sendChunk = (obj) => {
-    res.write(`data: ${JSON.stringify(obj)}\n\n`);
+  const out = createChunkWriter(res, model, id);
+  const calls = new ToolCallAssembler({ tools: opts.tools, collect: !!opts.collect });
+  const finish = (err, canceled) => {
+    const result = texts && completed && !err && !canceled ? { text: texts.join(''), tool_calls: calls.toolCalls() } : null;
+    onFinish({ completionTokens: completionTokensOf(output, usage), usage, result }, err, canceled);
   };
-  const sendDelta = (delta, finishReason = null) => {
-    const choice = { index: 0, delta, finish_reason: finishReason };
-    sendChunk({
-      id,
-      object: 'chat.completion.chunk',
-      created: Math.floor(Date.now() / 1000),
-      model,
-      choices: [choice],
-    });
+  const sendRole = () => {
+    if (hasSentRole) return;
+    out.delta({ role: 'assistant' });
+    hasSentRole = true;
+  };
+  const sendToolCalls = (deltas) => {
+    if (deltas.length === 0) return;
+    markFirstToken(opts.trace);
+    sendRole();
+    hasToolCalls = true;
+    for (const d of deltas) {
+      if (d.function?.arguments) output.push(d.function.arguments);
+    }
+    out.delta({ tool_calls: deltas });
+  };
+  const end = () => {
+    sendToolCalls(calls.flush());
+    finish();
+    sendRole();
+    out.finish(hasToolCalls ? 'tool_calls' : 'stop');
   };
-  const reader = backendStream.getReader();
   (async () => {
     try {
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-        buffer += dec.decode(value, { stream: true });
-        const lines = buffer.split('\n');
-        buffer = lines.pop() || '';
-        for (const line of lines) {
-          if (!line.startsWith('data: ')) continue;
-          const data = line.slice(6);
-          if (data === '[DONE]') {
-            onFinish(completionChars);
-            sendDelta({}, 'stop');
-            res.write('data: [DONE]\n\n');
+      for await (const events of readSseEvents(backendStream, { types: TEXT_EVENTS })) {
+        for (const event of events) {
+          if (event === SSE_DONE) {
+            end();
             return;
           }
-          try {
-            const event = JSON.parse(data);
-            const type = event.type;
-            if (type === 'response.output_text.delta' && event.delta) {
-              completionChars += String(event.delta).length;
-              if (!hasSentRole) {
-                sendDelta({ role: 'assistant' });
-                hasSentRole = true;
-              }
-              sendDelta({ content: event.delta });
-            }
-          } catch (_) {}
+          if (event.type === 'response.completed') {
+            usage = event.response?.usage || null;
+            completed = true;
+            continue;
+          }
+          if (event.type === 'response.output_text.delta') {
+            if (!event.delta) continue;
+            markFirstToken(opts.trace);
+            output.push(event.delta);
+            texts?.push(event.delta);
+            sendRole();
+            out.content(event.delta);
+            continue;
+          }
+          sendToolCalls(calls.handle(event));
+        }
+        // 客户端读得慢时暂停读取后端，等写缓冲排空
+        const drained = out.ready();
+        if (drained) await drained;
+        // 客户端已断开：退出循环即取消后端读取
+        if (res.destroyed) {
+          finish(null, true);
+          return;
         }
       }
-      onFinish(completionChars);
-      if (!hasSentRole) sendDelta({ role: 'assistant' });
-      sendDelta({}, 'stop');
-      res.write('data: [DONE]\n\n');
+      end();
     } catch (e) {
-      onFinish(completionChars);
-      sendDelta({ content: `\n[Error: ${e.message}]` }, 'stop');
+      if (res.destroyed) {
+        finish(e, true);
+        return;
+      }
+      finish(e);
+      out.delta({ content: `\n[Error: ${e.message}]` }, 'stop');
       res.write('data: [DONE]\n\n');
     } finally {
       res.end();
@@ -223,9 +420,6 @@ function pipeStreamToOpenAI(backendStream, res, model, id, opts = {}) {
   })();
 }
 
-/**
- * 调用 Codex 后端（仅支持 Codex token，不支持纯 api_key 调此接口）
- */
 /**
  * 解析认证：authProvider 可为路径字符串、auth 对象、或 () => auth 的 getter
  */
@@ -235,12 +429,20 @@ function resolveAuth(authProvider) {
   return loadAuth(authProvider);
 }
 
-export async function callCodexBackend(openaiReq, authProvider = null) {
-  const auth = resolveAuth(authProvider);
+/**
+ * 调用 Codex 后端（仅支持 Codex token，不支持纯 api_key 调此接口）
+ */
+export async function callCodexBackend(openaiReq, authProvider = null, opts = {}) {
+  return postResponses(buildResponsesRequest(openaiReq), resolveAuth(authProvider), opts.signal);
+}
+
+/**
+ * 以指定账号把已构建好的 Responses 请求体发往后端
+ */
+async function postResponses(body, auth, signal) {
   if (auth.type !== 'codex') {
     throw new Error('ChatGPT/Codex 反代需要 access_token + account_id，请使用 Codex 登录后的 auth.json');
   }
-  const body = buildResponsesRequest(openaiReq);
   const sessionId = randomUUID();
   const headers = {
     ...BROWSER_HEADERS,
@@ -249,11 +451,19 @@ export async function callCodexBackend(openaiReq, authProvider = null) {
     'chatgpt-account-id': auth.accountId,
     'session_id': sessionId,
   };
-  const res = await fetch(BACKEND_URL, {
-    method: 'POST',
-    headers,
-    body: JSON.stringify(body),
-  });
+  let res;
+  try {
+    res = await backendFetch(BACKEND_URL, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify(body),
+      signal,
+    });
+  } catch (e) {
+    if (!signal?.aborted) recordBackendStatus(auth.accountId, body.model, 0);
+    throw e;
+  }
+  recordBackendStatus(auth.accountId, body.model, res.status);
   if (!res.ok) {
     const status = res.status;
     if (status === 401 || status === 403) {
@@ -261,92 +471,611 @@ export async function callCodexBackend(openaiReq, authProvider = null) {
       clearUsage(auth.accountId);
     }
     const text = await res.text();
-    throw new Error(`Codex 后端错误 ${status}: ${text.slice(0, 500)}`);
+    const err = new Error(`Codex 后端错误 ${status}: ${text.slice(0, 500)}`);
+    err.status = status;
+    throw err;
   }
   return { response: res, model: body.model, stream: body.stream, auth };
 }
 
+const HEDGE_TTFT_MS = Math.max(0, Number(process.env.CODEX_HEDGE_TTFT_MS) || 0);
+
+// 首个有效输出的标记：出现任一即视为“首 token 已到”
+const FIRST_TOKEN_MARKERS = [
+  'response.output_text.delta',
+  'response.function_call_arguments.delta',
+  'response.completed',
+  'response.incomplete',
+  'response.failed',
+].map((m) => Buffer.from(m));
+
+const MARKER_TAIL = Math.max(...FIRST_TOKEN_MARKERS.map((m) => m.length)) - 1;
+
 /**
- * 处理一次 Chat Completions 请求：流式或非流式，支持多账号故障切换（失败时自动尝试下一账号）
- * @param {object} openaiReq - 请求体
- * @param {object} res - Express res
- * @param {Function} authProvider - () => auth 或轮询 getter，失败时可多次调用取下一账号
- * @param {number} accountCount - 账号数量，用于故障切换最大重试次数
+ * 首 token 扫描器：逐块传入后端数据（fetch 返回 Uint8Array），返回是否已出现首 token 标记。
+ * 只在「上一块末尾 MARKER_TAIL 字节 + 新块」中查找：被拆在两块之间的标记也能识别，总开销与流长度成线性
+ */
+function createFirstTokenScanner() {
+  let tail = Buffer.alloc(0);
+  return (chunk) => {
+    const buf = Buffer.from(chunk.buffer, chunk.byteOffset, chunk.byteLength);
+    const window = tail.length ? Buffer.concat([tail, buf]) : buf;
+    if (FIRST_TOKEN_MARKERS.some((m) => window.includes(m))) return true;
+    // 复制末尾，避免引用整个数据块
+    tail = Buffer.from(window.subarray(Math.max(0, window.length - MARKER_TAIL)));
+    return false;
+  };
+}
+
+/**
+ * 把已读出的数据块放回流首，返回新的 ReadableStream
+ */
+function prependChunks(chunks, reader) {
+  let i = 0;
+  return new ReadableStream({
+    async pull(controller) {
+      if (i < chunks.length) {
+        controller.enqueue(chunks[i++]);
+        return;
+      }
+      const { done, value } = await reader.read();
+      if (done) controller.close();
+      else controller.enqueue(value);
+    },
+    cancel(reason) {
+      return reader.cancel(reason);
+    },
+  });
+}
+
+/**
+ * 对一个账号发起后端请求，读到首个有效输出后返回（body 已把读出的数据放回流首）
+ */
+async function openUntilFirstToken(body, auth, signal) {
+  const opened = await postResponses(body, auth, signal);
+  const reader = opened.response.body.getReader();
+  const hasFirstToken = createFirstTokenScanner();
+  const chunks = [];
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    chunks.push(value);
+    if (hasFirstToken(value)) break;
+  }
+  return { ...opened, body: prependChunks(chunks, reader) };
+}
+
+/**
+ * 打开后端流（含调度计数）。开启对冲（CODEX_HEDGE_TTFT_MS > 0）且有其他健康账号时：
+ * 主请求在预算内没有首 token，就在第二个账号上发出同样的请求，先出首 token 者胜出，另一个通过 AbortController 取消。
+ * 失败时已结束对应账号的调度计数并抛出错误；成功时由调用方结束胜出账号的计数。
+ * signal 为客户端断开信号：中止后端 fetch 与读取，账号计数按取消处理（不计入故障）。
+ */
+async function openBackend(body, auth, provider, tried, signal) {
+  const accountId = auth?.accountId || null;
+  if (!accountId || HEDGE_TTFT_MS <= 0 || typeof provider !== 'function') {
+    if (accountId) beginAccountRequest(accountId);
+    const startedAt = Date.now();
+    try {
+      const opened = await postResponses(body, auth || resolveAuth(provider), signal);
+      recordAccountLatency(accountId, Date.now() - startedAt);
+      return { ...opened, body: opened.response.body, accountId };
+    } catch (e) {
+      endAccountRequest(accountId, failureOutcome(e, signal));
+      throw e;
+    }
+  }
+
+  const attempts = [];
+  const end = (attempt, outcome) => {
+    if (attempt.ended) return;
+    attempt.ended = true;
+    endAccountRequest(attempt.auth.accountId, outcome);
+  };
+  const launch = (a) => {
+    const ac = new AbortController();
+    signal?.addEventListener('abort', () => ac.abort(), { once: true });
+    beginAccountRequest(a.accountId);
+    const attempt = { auth: a, ac, state: 'pending', opened: null, ended: false, startedAt: Date.now() };
+    attempt.promise = openUntilFirstToken(body, a, ac.signal).then(
+      (opened) => {
+        attempt.state = 'ok';
+        attempt.opened = opened;
+        return attempt;
+      },
+      (e) => {
+        attempt.state = 'failed';
+        end(attempt, failureOutcome(e, ac.signal));
+        throw e;
+      }
+    );
+    attempts.push(attempt);
+    return attempt;
+  };
+
+  const primary = launch(auth);
+  let timer;
+  const budget = new Promise((resolve) => {
+    timer = setTimeout(resolve, HEDGE_TTFT_MS);
+  });
+  let winner;
+  try {
+    winner = await Promise.race([primary.promise, budget]);
+  } finally {
+    clearTimeout(timer);
+  }
+  if (!winner) {
+    const backup = provider({ exclude: tried });
+    if (backup?.accountId && !tried.has(backup.accountId)) {
+      tried.add(backup.accountId);
+      recordAccountLatency(accountId, HEDGE_TTFT_MS);
+      launch(backup);
+    }
+    try {
+      winner = await Promise.any(attempts.map((a) => a.promise));
+    } catch (agg) {
+      throw agg.errors[0];
+    }
+  }
+  // 取消落败的请求：只释放并发计数，不计入故障
+  for (const a of attempts) {
+    if (a === winner || a.state === 'failed') continue;
+    end(a, { ok: false, canceled: true });
+    a.ac.abort();
+    if (a.opened) a.opened.body.cancel().catch(() => {});
+  }
+  const wonId = winner.auth.accountId;
+  recordAccountLatency(wonId, Date.now() - winner.startedAt);
+  return { ...winner.opened, accountId: wonId };
+}
+
+/**
+ * 失败时的账号调度结果：请求已被中止（客户端断开或对冲落败）时只算取消
+ */
+function failureOutcome(e, signal) {
+  return signal?.aborted ? { ok: false, canceled: true } : { ok: false, status: errorStatus(e) };
+}
+
+/**
+ * 从错误中取后端 HTTP 状态码，网络错误等返回 0
+ */
+function errorStatus(e) {
+  if (e?.status) return e.status;
+  const m = e?.message && /^\D*(\d{3})/.exec(e.message);
+  return m ? Number(m[1]) : 0;
+}
+
+const SSE_HEADERS = {
+  'Content-Type': 'text/event-stream',
+  'Cache-Control': 'no-cache',
+  'Connection': 'keep-alive',
+  'Access-Control-Allow-Origin': '*',
+};
+
+/**
+ * 所有可用账号的并发名额都已占满（调度器返回 null）
+ */
+function accountsBusyError() {
+  const err = new Error('所有账号的并发请求已满，请稍后重试');
+  err.status = 429;
+  err.retryAfter = 1;
+  err.accountsBusy = true;
+  return err;
+}
+
+/**
+ * 写代理错误响应（客户端已收到响应头时不再写）
+ */
+function sendProxyError(res, err) {
+  if (res.headersSent) return;
+  if (err?.accountsBusy) {
+    res.setHeader('Retry-After', String(err.retryAfter));
+    res.status(429).json({ error: { message: err.message, type: 'rate_limit_error', code: 'rate_limit_exceeded' } });
+    return;
+  }
+  let msg = err?.message ?? 'Proxy error';
+  if (msg === 'fetch failed' || /^fetch failed/i.test(msg)) {
+    msg = 'fetch failed: 无法连接 Codex 后端 (chatgpt.com)。请检查网络/VPN，并确认已添加至少一个 Codex 账号。详见配置页或 README。';
+  }
+  res.status(500).json({
+    error: {
+      message: msg,
+      type: 'proxy_error',
+      code: 'internal_error',
+    },
+  });
+}
+
+/**
+ * 多账号故障切换：依次取账号打开后端流，交给 deliver 输出；打开失败或输出前出错时换下一账号重试（4xx/5xx）。
+ * deliver(opened, who, finish) 负责在输出结束时调用 finish(outcome) 结束账号的调度计数（可重复调用，只生效一次）。
+ * opts.signal 中止（客户端断开）时不再重试，也不再写错误响应；opts.trace 记录故障切换次数与最终账号。
  * @returns {Promise<object|null>} 成功时返回本次使用的 auth，失败返回 null
  */
-export async function handleChatCompletions(openaiReq, res, authProvider = null, accountCount = 1) {
-  const stream = openaiReq.stream === true;
-  const model = openaiReq.model || 'gpt-5.3-codex';
-  const id = `chatcmpl-${randomUUID().replace(/-/g, '')}`;
+async function runWithFailover(body, res, authProvider, accountCount, opts, deliver) {
+  const { signal, trace } = opts;
   const maxTries = Math.max(1, Number(accountCount) || 1);
   let lastError = null;
 
+  const tried = new Set();
+
   for (let tryIndex = 0; tryIndex < maxTries; tryIndex++) {
+    let finish = () => {};
+    if (trace) trace.failovers = tryIndex;
     try {
-      const auth = typeof authProvider === 'function' ? authProvider() : null;
-      const provider = auth ? () => auth : authProvider;
-      const { response: backendRes, model: backendModel, auth: usedAuth } = await callCodexBackend(openaiReq, provider);
-      const who = usedAuth || auth;
-      const promptTokens = estimatePromptTokens(openaiReq);
-      if (stream) {
-        res.setHeader('Content-Type', 'text/event-stream');
-        res.setHeader('Cache-Control', 'no-cache');
-        res.setHeader('Connection', 'keep-alive');
-        res.setHeader('Access-Control-Allow-Origin', '*');
-        pipeStreamToOpenAI(backendRes.body, res, backendModel, id, {
-          onFinish: (completionChars) => {
-            if (who?.accountId) {
-              recordUsage(who.accountId, {
-                prompt_tokens: promptTokens,
-                completion_tokens: Math.ceil(completionChars / 4),
-              });
-            }
-          },
-        });
-        return who ?? null;
-      }
-      const text = await parseStreamToText(backendRes.body);
-      const completionTokens = Math.ceil(text.length / 4);
-      if (who?.accountId) {
-        recordUsage(who.accountId, { prompt_tokens: promptTokens, completion_tokens: completionTokens });
+      const auth = typeof authProvider === 'function' ? authProvider({ exclude: tried }) : null;
+      if (typeof authProvider === 'function' && !auth) {
+        // 剩余账号都已满载：已有失败时返回该失败，否则 429
+        lastError ||= accountsBusyError();
+        break;
       }
-      res.json({
-        id,
-        object: 'chat.completion',
-        created: Math.floor(Date.now() / 1000),
-        model: backendModel,
-        choices: [
-          {
-            index: 0,
-            message: { role: 'assistant', content: text },
-            finish_reason: 'stop',
-          },
-        ],
-        usage: { prompt_tokens: promptTokens, completion_tokens: completionTokens, total_tokens: promptTokens + completionTokens },
-      });
+      if (auth?.accountId) tried.add(auth.accountId);
+      const opened = await openBackend(body, auth, authProvider, tried, signal);
+      let ended = false;
+      finish = (outcome) => {
+        if (ended) return;
+        ended = true;
+        endAccountRequest(opened.accountId, outcome);
+      };
+      const who = opened.auth || auth;
+      if (trace) trace.accountId = who?.accountId || null;
+      await deliver(opened, who, finish);
       return who ?? null;
     } catch (e) {
+      if (signal?.aborted) {
+        finish({ ok: false, canceled: true });
+        return null;
+      }
       lastError = e;
+      const code = errorStatus(e);
+      finish({ ok: false, status: code });
       if (res.headersSent) throw e;
-      const status = e.message && /^\D*(\d{3})/.exec(e.message);
-      const code = status ? Number(status[1]) : 0;
       const isRetryable = code >= 400 && code < 600;
       if (!isRetryable || tryIndex >= maxTries - 1) break;
     }
   }
 
-  if (!res.headersSent) {
-    let msg = lastError?.message ?? 'Proxy error';
-    if (msg === 'fetch failed' || /^fetch failed/i.test(msg)) {
-      msg = 'fetch failed: 无法连接 Codex 后端 (chatgpt.com)。请检查网络/VPN，并确认已添加至少一个 Codex 账号。详见配置页或 README。';
+  sendProxyError(res, lastError);
+  return null;
+}
+
+/**
+ * 只负责打开后端流的故障切换（供合并请求使用，输出由各订阅者自行完成）
+ * @returns {Promise<object>} openBackend 的结果，附 who（本次使用的 auth）；全部失败时抛出最后一个错误
+ */
+async function openWithFailover(body, authProvider, accountCount, signal, trace) {
+  const maxTries = Math.max(1, Number(accountCount) || 1);
+  let lastError = null;
+  const tried = new Set();
+  for (let tryIndex = 0; tryIndex < maxTries; tryIndex++) {
+    if (trace) trace.failovers = tryIndex;
+    try {
+      const auth = typeof authProvider === 'function' ? authProvider({ exclude: tried }) : null;
+      if (typeof authProvider === 'function' && !auth) {
+        lastError ||= accountsBusyError();
+        break;
+      }
+      if (auth?.accountId) tried.add(auth.accountId);
+      const opened = await openBackend(body, auth, authProvider, tried, signal);
+      return { ...opened, who: opened.auth || auth };
+    } catch (e) {
+      if (signal?.aborted) throw e;
+      lastError = e;
+      const code = errorStatus(e);
+      if (!(code >= 400 && code < 600)) break;
+    }
+  }
+  throw lastError;
+}
+
+// 请求合并（默认关闭）：CODEX_COALESCE=1 时相同的并发请求共用一次后端调用
+const COALESCE_ENABLED = ['1', 'true'].includes(String(process.env.CODEX_COALESCE || '').toLowerCase());
+const FLIGHT_USAGE_EVENTS = ['response.output_text.delta', 'response.function_call_arguments.delta', 'response.completed'];
+
+/**
+ * 合并请求的账号调度与用量统计：在共享的后端流上只做一次，不随订阅者重复
+ */
+function flightAccounting(accountId, who, promptTokens) {
+  const parser = new SseParser({ types: FLIGHT_USAGE_EVENTS });
+  const output = [];
+  let usage = null;
+  const scan = (events) => {
+    for (const event of events) {
+      if (event.type === 'response.completed') usage = event.response?.usage || null;
+      else if (event.delta) output.push(event.delta);
+    }
+  };
+  return {
+    onChunk: (chunk) => scan(parser.push(chunk)),
+    onEnd: (err, canceled) => {
+      if (!err) scan(parser.end());
+      endAccountRequest(accountId, canceled ? { ok: false, canceled: true } : err ? { ok: false, status: errorStatus(err) } : { ok: true });
+      if (who?.accountId) recordUsage(who.accountId, toChatUsage(usage, promptTokens, completionTokensOf(output, usage)), { canceled });
+    },
+  };
+}
+
+/**
+ * 以合并方式处理请求：第一个请求打开后端流，同 key 的并发请求订阅同一条流；deliver(body, model, settle) 负责输出
+ */
+async function coalesce(key, body, res, authProvider, accountCount, opts, promptTokens, deliver) {
+  const { signal, trace } = opts;
+  const { flight, leader } = acquireFlight(key);
+  const release = flight.retain();
+  signal?.addEventListener('abort', release, { once: true });
+  if (leader) {
+    openWithFailover(body, authProvider, accountCount, flight.signal, trace).then(
+      (opened) => flight.start(opened.body, { model: opened.model, auth: opened.who }, flightAccounting(opened.accountId, opened.who, promptTokens)),
+      (e) => flight.fail(e)
+    );
+  } else {
+    res.setHeader('X-Codex-Coalesced', '1');
+  }
+  try {
+    const joined = await flight.join(release);
+    if (trace) trace.accountId = joined.auth?.accountId || null;
+    await deliver(joined.body, joined.model, () => {});
+    return joined.auth ?? null;
+  } catch (e) {
+    release();
+    if (!signal?.aborted) sendProxyError(res, e);
+    return null;
+  }
+}
+
+/**
+ * 处理一次 Chat Completions 请求：流式或非流式，支持多账号故障切换（失败时自动尝试下一账号）
+ * @param {object} openaiReq - 请求体
+ * @param {object} res - Express res
+ * @param {Function} authProvider - ({ exclude }) => auth 调度 getter，失败时可多次调用取下一账号（exclude 为本次已试过的 accountId）
+ * @param {number} accountCount - 账号数量，用于故障切换最大重试次数
+ * @param {object} [opts] - { signal, cache, trace } signal：客户端断开时中止，取消后端请求与流读取；cache 为 false 时跳过响应缓存与请求合并；
+ *   trace：metrics.createTrace() 的结果，记录模型、账号、首 token 与输出 token 数
+ * @returns {Promise<object|null>} 成功时返回本次使用的 auth，失败返回 null
+ */
+export async function handleChatCompletions(openaiReq, res, authProvider = null, accountCount = 1, opts = {}) {
+  const stream = openaiReq.stream === true;
+  const id = `chatcmpl-${randomUUID().replace(/-/g, '')}`;
+  const body = buildResponsesRequest(openaiReq);
+  const trace = opts.trace;
+  if (trace) trace.model = body.model;
+
+  // 响应缓存：opts.cache === false（客户端 Cache-Control: no-cache）时跳过
+  const cacheKey = RESPONSE_CACHE_ENABLED && opts.cache !== false ? responseCacheKey(body) : null;
+  if (cacheKey) {
+    const cached = await getCachedResponse(cacheKey);
+    if (cached) {
+      res.setHeader('X-Codex-Cache', 'HIT');
+      markFirstToken(trace);
+      traceUsage(trace, cached.usage);
+      if (stream) replayChatStream(res, id, cached);
+      else res.json(chatCompletionBody(id, cached));
+      return null;
+    }
+    res.setHeader('X-Codex-Cache', 'MISS');
+  }
+
+  const promptTokens = estimatePromptTokens(openaiReq);
+
+  /**
+   * 把后端流输出给客户端；settle(completionTokens, backendUsage, err, canceled) 在结束时做用量统计与调度计数
+   */
+  const deliver = async (backendBody, backendModel, settle) => {
+    if (stream) {
+      res.set(SSE_HEADERS);
+      pipeStreamToOpenAI(backendBody, res, backendModel, id, {
+        tools: openaiReq.tools,
+        trace,
+        collect: !!cacheKey,
+        onFinish: ({ completionTokens, usage, result }, err, canceled) => {
+          const chatUsage = toChatUsage(usage, promptTokens, completionTokens);
+          traceUsage(trace, chatUsage);
+          settle(completionTokens, usage, err, canceled);
+          // 流式请求正常完成后同样写入缓存，后续流式/非流式请求都可命中
+          if (result) setCachedResponse(cacheKey, { model: backendModel, ...result, usage: chatUsage });
+        },
+      });
+      return;
     }
-    res.status(500).json({
-      error: {
-        message: msg,
-        type: 'proxy_error',
-        code: 'internal_error',
+    const { text, tool_calls: toolCalls, usage: backendUsage } = await parseStreamToText(backendBody, { tools: openaiReq.tools, trace });
+    const completionTokens = completionTokensOf([text, ...toolCalls.map((tc) => tc.function.arguments)], backendUsage);
+    settle(completionTokens, backendUsage);
+    const result = { model: backendModel, text, tool_calls: toolCalls, usage: toChatUsage(backendUsage, promptTokens, completionTokens) };
+    traceUsage(trace, result.usage);
+    if (cacheKey) setCachedResponse(cacheKey, result);
+    res.json(chatCompletionBody(id, result));
+  };
+
+  if (COALESCE_ENABLED && opts.cache !== false) {
+    const key = cacheKey || responseCacheKey(body);
+    return coalesce(key, body, res, authProvider, accountCount, opts, promptTokens, deliver);
+  }
+
+  return runWithFailover(body, res, authProvider, accountCount, opts, (opened, who, finish) =>
+    deliver(opened.body, opened.model, (completionTokens, backendUsage, err, canceled) => {
+      finish(canceled ? { ok: false, canceled: true } : { ok: !err });
+      if (who?.accountId) {
+        recordUsage(who.accountId, toChatUsage(backendUsage, promptTokens, completionTokens), { canceled });
+      }
+    })
+  );
+}
+
+/**
+ * 把本次请求的 token 数记入请求追踪（指标与访问日志）
+ */
+function traceUsage(trace, usage) {
+  if (!trace) return;
+  trace.promptTokens = usage.prompt_tokens || 0;
+  trace.completionTokens = usage.completion_tokens || 0;
+}
+
+/**
+ * 非流式 chat.completion 响应体
+ * @param {{ model: string, text: string, tool_calls: object[], usage: object }} result
+ */
+function chatCompletionBody(id, { model, text, tool_calls: toolCalls, usage }) {
+  const message = toolCalls.length
+    ? { role: 'assistant', content: text || null, tool_calls: toolCalls }
+    : { role: 'assistant', content: text };
+  return {
+    id,
+    object: 'chat.completion',
+    created: Math.floor(Date.now() / 1000),
+    model,
+    choices: [
+      {
+        index: 0,
+        message,
+        finish_reason: toolCalls.length ? 'tool_calls' : 'stop',
       },
+    ],
+    usage,
+  };
+}
+
+/**
+ * 以合成 SSE 回放缓存的结果（流式客户端命中缓存时）
+ */
+function replayChatStream(res, id, { model, text, tool_calls: toolCalls }) {
+  res.set(SSE_HEADERS);
+  const out = createChunkWriter(res, model, id, { windowMs: 0 });
+  out.delta({ role: 'assistant' });
+  if (text) out.content(text);
+  if (toolCalls.length) {
+    out.delta({
+      tool_calls: toolCalls.map((tc, index) => ({ index, id: tc.id, type: 'function', function: tc.function })),
     });
   }
-  return null;
+  out.finish(toolCalls.length ? 'tool_calls' : 'stop');
+  res.end();
+}
+
+// 直通流只解析 response.completed（取 usage），其余事件不做 JSON.parse
+const PASSTHROUGH_EVENTS = ['response.completed'];
+const COLLECT_EVENTS = ['response.output_item.done', 'response.completed', 'response.incomplete', 'response.failed'];
+
+/**
+ * 等待写缓冲排空（或连接关闭）
+ */
+function waitDrain(res) {
+  return new Promise((resolve) => {
+    const done = () => {
+      res.off('drain', done);
+      res.off('close', done);
+      resolve();
+    };
+    res.on('drain', done);
+    res.on('close', done);
+  });
+}
+
+/**
+ * 流式直通：后端 SSE 字节原样写给客户端，仅旁路解析 response.completed 取 usage；
+ * 客户端断开后立即取消后端读取
+ * @param {object} [opts] - { trace, onFinish(usage, err, canceled) }
+ */
+function pipeResponsesPassthrough(backendStream, res, opts = {}) {
+  const onFinish = opts.onFinish || (() => {});
+  const parser = new SseParser({ types: PASSTHROUGH_EVENTS });
+  const reader = backendStream.getReader();
+  const hasFirstToken = opts.trace ? createFirstTokenScanner() : null;
+  let usage = null;
+  const scan = (events) => {
+    for (const event of events) {
+      if (event.type === 'response.completed') usage = event.response?.usage || null;
+    }
+  };
+  (async () => {
+    try {
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        scan(parser.push(value));
+        if (hasFirstToken && !opts.trace.firstTokenAt && hasFirstToken(value)) markFirstToken(opts.trace);
+        if (res.destroyed) break;
+        if (!res.write(value)) await waitDrain(res);
+        if (res.destroyed) break;
+      }
+      if (res.destroyed) {
+        reader.cancel().catch(() => {});
+        onFinish(usage, null, true);
+        return;
+      }
+      scan(parser.end());
+      onFinish(usage);
+    } catch (e) {
+      onFinish(usage, e, res.destroyed);
+      const error = { type: 'error', code: 'proxy_error', message: e.message };
+      if (!res.destroyed) res.write(`event: error\ndata: ${JSON.stringify(error)}\n\n`);
+    } finally {
+      res.end();
+    }
+  })();
+}
+
+/**
+ * 非流式：返回 response.completed（或 incomplete）中的 response 对象；
+ * 后端未在最终事件中带回 output 时，用逐条 output_item.done 补齐
+ */
+async function collectResponse(stream, trace) {
+  const items = [];
+  let final = null;
+  for await (const events of readSseEvents(stream, { types: COLLECT_EVENTS })) {
+    for (const event of events) {
+      if (event.type === 'response.output_item.done' && event.item) {
+        markFirstToken(trace);
+        items.push(event.item);
+      } else if (event.type === 'response.failed') {
+        const err = new Error(`Codex 后端错误: ${event.response?.error?.message || 'response.failed'}`);
+        err.status = 502;
+        throw err;
+      } else if (event.type === 'response.completed' || event.type === 'response.incomplete') {
+        final = event.response || null;
+      }
+    }
+  }
+  if (!final) {
+    const err = new Error('Codex 后端错误: 响应流在 response.completed 之前结束');
+    err.status = 502;
+    throw err;
+  }
+  if (!Array.isArray(final.output) || final.output.length === 0) final.output = items;
+  return final;
+}
+
+/**
+ * 处理一次 Responses API 请求（/v1/responses）：请求体直通后端，不经 Chat Completions 转换；
+ * 流式时原样转发后端 SSE，非流式时返回最终的 response 对象。同样支持多账号故障切换与客户端断开取消（opts.signal）。
+ */
+export async function handleResponses(req, res, authProvider = null, accountCount = 1, opts = {}) {
+  const stream = req.stream === true;
+  const body = buildPassthroughRequest(req);
+  const trace = opts.trace;
+  if (trace) trace.model = body.model;
+  // 后端未返回 usage 时，按 input 估算 prompt_tokens
+  const record = (who, usage, canceled = false) => {
+    const counted = usage ? toChatUsage(usage, 0, 0) : { prompt_tokens: countTokens(JSON.stringify(body.input)), completion_tokens: 0 };
+    traceUsage(trace, counted);
+    if (!who?.accountId) return;
+    recordUsage(who.accountId, counted, { canceled });
+  };
+
+  return runWithFailover(body, res, authProvider, accountCount, opts, async (opened, who, finish) => {
+    if (stream) {
+      res.set(SSE_HEADERS);
+      pipeResponsesPassthrough(opened.body, res, {
+        trace,
+        onFinish: (usage, err, canceled) => {
+          finish(canceled ? { ok: false, canceled: true } : { ok: !err });
+          record(who, usage, canceled);
+        },
+      });
+      return;
+    }
+    const response = await collectResponse(opened.body, trace);
+    finish({ ok: true });
+    record(who, response.usage);
+    res.json(response);
+  });
 }
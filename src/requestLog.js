@@ -0,0 +1,86 @@
+/**
+ * 请求日志环形缓冲：固定容量，写入 O(1)，写满后覆盖最旧的条目。
+ * 每条日志带单调递增的 id，用作分页游标（?since=）与 SSE 事件 id（断线重连时从 Last-Event-ID 续传）。
+ *
+ * 环境变量：CODEX_LOG_SIZE（保留条数，默认 200）
+ */
+
+const DEFAULT_CAPACITY = Math.max(1, Number(process.env.CODEX_LOG_SIZE) || 200);
+
+export class RequestLog {
+  constructor(capacity = DEFAULT_CAPACITY) {
+    this.capacity = capacity;
+    this.entries = new Array(capacity);
+    this.head = 0; // 下一个写入位置
+    this.length = 0;
+    this.lastId = 0;
+    this.subscribers = new Set();
+  }
+
+  /** 追加一条日志（补上 id），通知订阅者 */
+  push(entry) {
+    entry.id = ++this.lastId;
+    this.entries[this.head] = entry;
+    this.head = (this.head + 1) % this.capacity;
+    if (this.length < this.capacity) this.length++;
+    for (const fn of this.subscribers) fn(entry);
+    return entry;
+  }
+
+  /** 最新一条，不存在时返回 null */
+  latest() {
+    return this.length ? this.entries[(this.head - 1 + this.capacity) % this.capacity] : null;
+  }
+
+  /**
+   * 从新到旧返回 id > since 且匹配过滤条件的日志
+   * @param {object} [q] - { since, limit, level, path, account }；level 可为逗号分隔的多个级别
+   * @returns {{ logs: object[], cursor: number }} cursor 为当前最新 id，下次以 ?since=cursor 只取增量
+   */
+  query(q = {}) {
+    const since = Number(q.since) || 0;
+    const limit = Math.max(0, Number(q.limit) || 0) || this.capacity;
+    const match = logMatcher(q);
+    const logs = [];
+    for (let i = 1; i <= this.length && logs.length < limit; i++) {
+      const e = this.entries[(this.head - i + this.capacity) % this.capacity];
+      if (e.id <= since) break;
+      if (match(e)) logs.push(e);
+    }
+    return { logs, cursor: this.lastId };
+  }
+
+  clear() {
+    this.entries = new Array(this.capacity);
+    this.head = 0;
+    this.length = 0;
+    for (const fn of this.subscribers) fn(null);
+  }
+
+  /**
+   * 订阅新日志：fn(entry)，清空时 fn(null)；返回取消订阅函数
+   */
+  subscribe(fn) {
+    this.subscribers.add(fn);
+    return () => this.subscribers.delete(fn);
+  }
+
+  /** 通知订阅者结束（服务关闭时让 SSE 连接及时断开） */
+  closeSubscribers() {
+    for (const fn of this.subscribers) fn(undefined);
+    this.subscribers.clear();
+  }
+}
+
+/**
+ * 由查询条件生成过滤函数：level（逗号分隔，不区分大小写）、path、account 精确匹配
+ */
+export function logMatcher(q = {}) {
+  const levels = q.level ? String(q.level).toUpperCase().split(',').map((s) => s.trim()).filter(Boolean) : null;
+  const path = q.path ? String(q.path) : null;
+  const account = q.account ? String(q.account) : null;
+  return (e) =>
+    (!levels || levels.includes(String(e.level || '').toUpperCase()))
+    && (!path || e.path === path)
+    && (!account || e.account === account);
+}
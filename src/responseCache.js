@@ -0,0 +1,178 @@
+/**
+ * 精确匹配响应缓存（默认关闭）：同一后端请求体（model、input、tools、tool_choice 等）直接返回上次的完整结果，不再消耗账号额度。
+ * 适合 CI、评测等反复发送相同 prompt 的场景。
+ *
+ * - key：buildResponsesRequest 结果的规范化 JSON（键排序）的 SHA-256
+ * - 内存层：按字节数上限的 LRU + TTL
+ * - 磁盘层（可选）：data/response-cache/<key>.json，内存未命中时读取，按总字节数淘汰最旧文件，进程重启后仍可命中
+ *
+ * 环境变量：CODEX_RESPONSE_CACHE（memory 开启内存层，disk 同时开启磁盘层；默认关闭）、
+ * CODEX_RESPONSE_CACHE_MB（内存上限，默认 64）、CODEX_RESPONSE_CACHE_DISK_MB（磁盘上限，默认 512）、
+ * CODEX_RESPONSE_CACHE_TTL_MS（有效期，默认 3600000）
+ */
+import { createHash } from 'crypto';
+import { readFile, writeFile, rename, unlink, readdir, stat, mkdir } from 'fs/promises';
+import { join, dirname } from 'path';
+import { fileURLToPath } from 'url';
+import { LruCache } from './lru.js';
+
+const __dirname = dirname(fileURLToPath(import.meta.url));
+const dataDir = process.env.CODEX_DATA_DIR || join(__dirname, '..', 'data');
+const CACHE_DIR = join(dataDir, 'response-cache');
+
+const MODE = String(process.env.CODEX_RESPONSE_CACHE || '').toLowerCase();
+export const RESPONSE_CACHE_ENABLED = MODE === 'memory' || MODE === 'disk' || MODE === '1' || MODE === 'true';
+const DISK_ENABLED = MODE === 'disk';
+const MAX_BYTES = Math.max(1, Number(process.env.CODEX_RESPONSE_CACHE_MB) || 64) * 1024 * 1024;
+const DISK_MAX_BYTES = Math.max(1, Number(process.env.CODEX_RESPONSE_CACHE_DISK_MB) || 512) * 1024 * 1024;
+const TTL_MS = Math.max(1000, Number(process.env.CODEX_RESPONSE_CACHE_TTL_MS) || 3_600_000);
+
+const memory = new LruCache({ maxEntries: Infinity, maxBytes: MAX_BYTES, ttlMs: TTL_MS, sizeOf: (v) => v.bytes });
+const counters = { hits: 0, diskHits: 0, misses: 0, stores: 0, diskErrors: 0 };
+
+// 磁盘层索引：key -> { size, mtimeMs }，Map 插入顺序即新旧顺序；首次使用时扫描目录建立
+let diskIndex = null;
+let diskBytes = 0;
+let tmpSeq = 0;
+
+/**
+ * 规范化 JSON：对象键排序，保证字段顺序不同的相同请求得到同一 key
+ */
+function canonicalJson(value) {
+  if (value === null || typeof value !== 'object') return JSON.stringify(value) ?? 'null';
+  if (Array.isArray(value)) return `[${value.map(canonicalJson).join(',')}]`;
+  const keys = Object.keys(value).filter((k) => value[k] !== undefined).sort();
+  return `{${keys.map((k) => `${JSON.stringify(k)}:${canonicalJson(value[k])}`).join(',')}}`;
+}
+
+/**
+ * 由后端请求体计算缓存 key
+ */
+export function responseCacheKey(body) {
+  return createHash('sha256').update(canonicalJson(body)).digest('hex');
+}
+
+async function loadDiskIndex() {
+  if (diskIndex) return diskIndex;
+  diskIndex = new Map();
+  diskBytes = 0;
+  let names = [];
+  try {
+    names = await readdir(CACHE_DIR);
+  } catch {
+    return diskIndex;
+  }
+  const files = [];
+  for (const name of names) {
+    if (!name.endsWith('.json')) continue;
+    try {
+      const st = await stat(join(CACHE_DIR, name));
+      files.push({ key: name.slice(0, -5), size: st.size, mtimeMs: st.mtimeMs });
+    } catch (_) {}
+  }
+  files.sort((a, b) => a.mtimeMs - b.mtimeMs);
+  for (const f of files) {
+    diskIndex.set(f.key, f);
+    diskBytes += f.size;
+  }
+  return diskIndex;
+}
+
+async function removeDiskEntry(key) {
+  const entry = diskIndex?.get(key);
+  if (!entry) return;
+  diskIndex.delete(key);
+  diskBytes -= entry.size;
+  await unlink(join(CACHE_DIR, `${key}.json`)).catch(() => {});
+}
+
+async function readDisk(key) {
+  const index = await loadDiskIndex();
+  if (!index.has(key)) return undefined;
+  try {
+    const { expiresAt, value } = JSON.parse(await readFile(join(CACHE_DIR, `${key}.json`), 'utf8'));
+    if (expiresAt <= Date.now()) {
+      await removeDiskEntry(key);
+      return undefined;
+    }
+    return value;
+  } catch {
+    counters.diskErrors++;
+    await removeDiskEntry(key);
+    return undefined;
+  }
+}
+
+async function writeDisk(key, value) {
+  const index = await loadDiskIndex();
+  const json = JSON.stringify({ expiresAt: Date.now() + TTL_MS, value });
+  const file = join(CACHE_DIR, `${key}.json`);
+  // 临时文件名按进程与序号区分：集群 worker 或同一进程内并发写同一 key 时互不覆盖
+  const tmp = `${file}.${process.pid}.${++tmpSeq}.tmp`;
+  try {
+    await mkdir(CACHE_DIR, { recursive: true });
+    await writeFile(tmp, json, 'utf8');
+    await rename(tmp, file);
+  } catch {
+    counters.diskErrors++;
+    await unlink(tmp).catch(() => {});
+    return;
+  }
+  const size = Buffer.byteLength(json);
+  if (index.has(key)) {
+    diskBytes -= index.get(key).size;
+    index.delete(key);
+  }
+  index.set(key, { key, size, mtimeMs: Date.now() });
+  diskBytes += size;
+  while (diskBytes > DISK_MAX_BYTES && index.size > 1) {
+    await removeDiskEntry(index.keys().next().value);
+  }
+}
+
+/**
+ * 查询缓存：先内存后磁盘，磁盘命中回填内存
+ * @returns {Promise<object|undefined>} { model, text, tool_calls, usage }
+ */
+export async function getCachedResponse(key) {
+  const hit = memory.get(key);
+  if (hit) {
+    counters.hits++;
+    return hit.value;
+  }
+  if (DISK_ENABLED) {
+    const value = await readDisk(key);
+    if (value) {
+      counters.hits++;
+      counters.diskHits++;
+      memory.set(key, { value, bytes: JSON.stringify(value).length * 2 });
+      return value;
+    }
+  }
+  counters.misses++;
+  return undefined;
+}
+
+/**
+ * 写入缓存（磁盘层异步写入，不阻塞响应）
+ */
+export function setCachedResponse(key, value) {
+  counters.stores++;
+  memory.set(key, { value, bytes: JSON.stringify(value).length * 2 });
+  if (DISK_ENABLED) writeDisk(key, value).catch(() => {});
+}
+
+export function getResponseCacheStats() {
+  const m = memory.stats();
+  return {
+    enabled: RESPONSE_CACHE_ENABLED,
+    disk: DISK_ENABLED,
+    ttlMs: TTL_MS,
+    entries: m.entries,
+    bytes: m.bytes,
+    maxBytes: MAX_BYTES,
+    diskEntries: diskIndex ? diskIndex.size : null,
+    diskBytes: diskIndex ? diskBytes : null,
+    ...counters,
+  };
+}
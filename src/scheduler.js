@@ -0,0 +1,253 @@
+/**
+ * 账号调度：在多个 Codex 账号间选择下一次请求使用的账号。
+ * 跳过已知不可用（401/403）或处于冷却期（429/5xx/网络错误）的账号，冷却结束后放行一次探测请求。
+ *
+ * 策略（CODEX_SCHEDULER）：
+ * - round-robin        轮询（默认）
+ * - least-outstanding  进行中请求最少
+ * - quota              按剩余额度加权随机
+ * - p2c                随机取两个，选进行中请求较少者（power of two choices）
+ * - ewma               按首包延迟 EWMA ×（进行中请求 + 1）最小
+ *
+ * 每个账号的进行中请求数不超过 CODEX_ACCOUNT_MAX_INFLIGHT（默认 4，0 为不限）：满载账号不参与调度，
+ * 所有候选账号都满载时返回 null（由调用方返回 429），不会把请求压到已满的账号上。
+ * 准入队列的容量应按 countSchedulableAccounts() × ACCOUNT_SLOTS 计算，请求在准入队列中等待空位。
+ *
+ * 其他环境变量：CODEX_ACCOUNT_COOLDOWN_MS（临时故障冷却基数，默认 30000，按连续失败次数指数退避，上限 10 分钟）、
+ * CODEX_UNAVAILABLE_RETRY_MS（401/403 账号重新探测间隔，默认 600000）
+ *
+ * 集群模式（CODEX_WORKER_COUNT 由主进程在 fork 时设置）：每个 worker 只使用单账号上限的一份
+ * （ACCOUNT_SLOTS = floor(上限 / worker 数)，至少 1），这是硬上限；此外各 worker 的进行中请求数经主进程汇总
+ * （setSchedulerListener / applyRemote*），合计达到上限的账号也视为满载。汇总是异步广播的，
+ * 只有 worker 数大于单账号上限时才可能短暂超出。
+ */
+import { isAccountUnavailable, getAccountUnavailableSince, markAccountUnavailable, markAccountAvailable } from './accountStatus.js';
+import { getRemainingPct } from './usageTracker.js';
+
+export const STRATEGIES = ['round-robin', 'least-outstanding', 'quota', 'p2c', 'ewma'];
+
+const DEFAULT_STRATEGY = STRATEGIES.includes(process.env.CODEX_SCHEDULER) ? process.env.CODEX_SCHEDULER : 'round-robin';
+const COOLDOWN_MS = Math.max(1000, Number(process.env.CODEX_ACCOUNT_COOLDOWN_MS) || 30_000);
+const MAX_COOLDOWN_MS = 10 * 60 * 1000;
+const UNAVAILABLE_RETRY_MS = Math.max(1000, Number(process.env.CODEX_UNAVAILABLE_RETRY_MS) || 600_000);
+const EWMA_ALPHA = 0.3;
+export const ACCOUNT_MAX_INFLIGHT = Math.max(0, Number(process.env.CODEX_ACCOUNT_MAX_INFLIGHT ?? 4) || 0);
+export const WORKER_COUNT = Math.max(1, Math.floor(Number(process.env.CODEX_WORKER_COUNT)) || 1);
+// 本进程每个账号可用的并发名额（0 为不限）
+export const ACCOUNT_SLOTS = ACCOUNT_MAX_INFLIGHT > 0 ? Math.max(1, Math.floor(ACCOUNT_MAX_INFLIGHT / WORKER_COUNT)) : 0;
+
+// accountId -> { outstanding, remote, ewmaMs, failures, cooldownUntil }；remote 为其他进程的进行中请求数
+const accountStats = new Map();
+let listener = null;
+
+function statsFor(accountId) {
+  const id = String(accountId);
+  let s = accountStats.get(id);
+  if (!s) {
+    s = { outstanding: 0, remote: 0, ewmaMs: 0, failures: 0, cooldownUntil: 0 };
+    accountStats.set(id, s);
+  }
+  return s;
+}
+
+/**
+ * 账号当前是否可调度；不可用账号在重试间隔过后视为可探测
+ */
+function isHealthy(auth, now) {
+  const s = statsFor(auth.accountId);
+  if (s.cooldownUntil > now) return false;
+  if (isAccountUnavailable(auth.accountId)) {
+    return now - getAccountUnavailableSince(auth.accountId) >= UNAVAILABLE_RETRY_MS;
+  }
+  return true;
+}
+
+/**
+ * 账号下次可调度的时间点，用于全部不健康时挑选最早恢复者
+ */
+function retryAt(auth) {
+  const s = statsFor(auth.accountId);
+  const since = getAccountUnavailableSince(auth.accountId);
+  return Math.max(s.cooldownUntil, since ? since + UNAVAILABLE_RETRY_MS : 0);
+}
+
+function outstandingOf(auth) {
+  const s = statsFor(auth.accountId);
+  return s.outstanding + s.remote;
+}
+
+function isFull(auth) {
+  if (ACCOUNT_MAX_INFLIGHT === 0) return false;
+  const s = statsFor(auth.accountId);
+  return s.outstanding >= ACCOUNT_SLOTS || s.outstanding + s.remote >= ACCOUNT_MAX_INFLIGHT;
+}
+
+/**
+ * 当前可调度（未冷却、未标记不可用或已到探测时间）的账号数，用于计算准入队列容量
+ */
+export function countSchedulableAccounts(auths) {
+  const now = Date.now();
+  let n = 0;
+  for (const a of auths) if (isHealthy(a, now)) n++;
+  return n;
+}
+
+const pickers = {
+  'round-robin': (candidates) => candidates[0],
+  'least-outstanding': (candidates) => {
+    let best = candidates[0];
+    for (const a of candidates) if (outstandingOf(a) < outstandingOf(best)) best = a;
+    return best;
+  },
+  quota: (candidates) => {
+    const weights = candidates.map((a) => Math.max(1, getRemainingPct(a.accountId)));
+    let r = Math.random() * weights.reduce((x, y) => x + y, 0);
+    for (let i = 0; i < candidates.length; i++) {
+      r -= weights[i];
+      if (r < 0) return candidates[i];
+    }
+    return candidates[candidates.length - 1];
+  },
+  p2c: (candidates) => {
+    if (candidates.length === 1) return candidates[0];
+    const i = Math.floor(Math.random() * candidates.length);
+    let j = Math.floor(Math.random() * (candidates.length - 1));
+    if (j >= i) j++;
+    const a = candidates[i];
+    const b = candidates[j];
+    return outstandingOf(b) < outstandingOf(a) ? b : a;
+  },
+  ewma: (candidates) => {
+    let best = candidates[0];
+    let bestCost = Infinity;
+    for (const a of candidates) {
+      const s = statsFor(a.accountId);
+      const cost = s.ewmaMs * (s.outstanding + s.remote + 1);
+      if (cost < bestCost) {
+        best = a;
+        bestCost = cost;
+      }
+    }
+    return best;
+  },
+};
+
+/**
+ * 创建调度 getter：每次调用返回下一个账号，可传 { exclude: Set<accountId> } 排除本次请求已试过的账号。
+ * 签名与 createRoundRobinProvider 兼容。没有未满载的账号时返回 null；
+ * 调用方须在同一事件循环内 beginAccountRequest，占用的名额才会被下一次调度看到。
+ */
+export function createScheduler(auths, strategy = DEFAULT_STRATEGY) {
+  const pick = pickers[strategy] || pickers['round-robin'];
+  let index = 0;
+  return (opts = {}) => {
+    const exclude = opts.exclude;
+    const now = Date.now();
+    // 从轮询游标处开始排列，保证各策略在同分时仍然轮转
+    const start = index++ % auths.length;
+    const candidates = [];
+    let healthy = 0;
+    let fallback = null;
+    for (let k = 0; k < auths.length; k++) {
+      const a = auths[(start + k) % auths.length];
+      if (exclude?.has(a.accountId)) continue;
+      if (!isHealthy(a, now)) {
+        if (!isFull(a) && (!fallback || retryAt(a) < retryAt(fallback))) fallback = a;
+      } else {
+        healthy++;
+        if (!isFull(a)) candidates.push(a);
+      }
+    }
+    if (candidates.length === 0) {
+      // 有健康账号但都已满载：不超额占用，返回 null；全部不健康时返回最早恢复的账号，让请求有机会成功
+      return healthy > 0 ? null : fallback;
+    }
+    const chosen = pick(candidates);
+    // 对不可用账号的探测：刷新标记时间，冷却期内只放行这一个请求
+    if (isAccountUnavailable(chosen.accountId)) markAccountUnavailable(chosen.accountId);
+    return chosen;
+  };
+}
+
+/**
+ * 请求发往后端前调用
+ */
+export function beginAccountRequest(accountId) {
+  if (!accountId) return;
+  statsFor(accountId).outstanding++;
+  listener?.('load', String(accountId), { delta: 1 });
+}
+
+/**
+ * 记录首包（响应头）延迟，用于 EWMA 策略
+ */
+export function recordAccountLatency(accountId, ms) {
+  if (!accountId) return;
+  const s = statsFor(accountId);
+  s.ewmaMs = s.ewmaMs === 0 ? ms : s.ewmaMs + EWMA_ALPHA * (ms - s.ewmaMs);
+}
+
+/**
+ * 请求结束后调用：成功时清除故障状态；429/5xx/网络错误进入冷却（指数退避）；canceled 只释放计数
+ * @param {{ ok: boolean, status?: number, canceled?: boolean }} outcome
+ */
+export function endAccountRequest(accountId, { ok, status = 0, canceled = false }) {
+  if (!accountId) return;
+  const s = statsFor(accountId);
+  if (s.outstanding > 0) {
+    s.outstanding--;
+    listener?.('load', String(accountId), { delta: -1 });
+  }
+  if (canceled) return;
+  if (ok) {
+    const wasFailing = s.failures > 0 || s.cooldownUntil > 0;
+    s.failures = 0;
+    s.cooldownUntil = 0;
+    if (wasFailing) listener?.('cooldown', String(accountId), { until: 0, failures: 0 });
+    markAccountAvailable(accountId);
+    return;
+  }
+  if (status === 401 || status === 403) return; // 由 accountStatus 处理
+  if (status === 0 || status === 429 || status >= 500) {
+    s.failures++;
+    s.cooldownUntil = Date.now() + Math.min(MAX_COOLDOWN_MS, COOLDOWN_MS * 2 ** (s.failures - 1));
+    listener?.('cooldown', String(accountId), { until: s.cooldownUntil, failures: s.failures });
+  }
+}
+
+/**
+ * 设置本地变更回调 (type, accountId, data)：type 为 load（{ delta }）或 cooldown（{ until, failures }）
+ */
+export function setSchedulerListener(fn) {
+  listener = fn;
+}
+
+/** 应用其他进程的进行中请求总数 */
+export function applyRemoteLoad(accountId, remote) {
+  statsFor(accountId).remote = Math.max(0, Number(remote) || 0);
+}
+
+/** 应用其他进程记录的冷却状态 */
+export function applyRemoteCooldown(accountId, until, failures) {
+  const s = statsFor(accountId);
+  s.cooldownUntil = Number(until) || 0;
+  s.failures = Number(failures) || 0;
+}
+
+/**
+ * 调度统计：每个账号的进行中请求数、EWMA 延迟、冷却剩余时间
+ */
+export function getSchedulerStats() {
+  const now = Date.now();
+  const accounts = {};
+  for (const [id, s] of accountStats) {
+    accounts[`${id.slice(0, 8)}…`] = {
+      outstanding: s.outstanding,
+      remote: s.remote,
+      ewmaMs: Math.round(s.ewmaMs),
+      failures: s.failures,
+      cooldownMs: Math.max(0, s.cooldownUntil - now),
+    };
+  }
+  return { strategy: DEFAULT_STRATEGY, accounts };
+}
@@ -0,0 +1,148 @@
+/**
+ * 请求合并（singleflight）：同一时刻多个相同请求只向后端发一次，后端 SSE 字节流分发给所有订阅者。
+ *
+ * - 已收到的数据块保存在共享日志中，每个订阅者有自己的读取游标，按各自速度拉取（慢客户端不拖慢其他订阅者，也不会复制数据）
+ * - 订阅者全部离开（客户端断开）后才取消后端请求
+ * - 后端流结束后从登记表移除，之后的相同请求会发起新的后端请求
+ */
+
+const flights = new Map(); // key -> Flight
+const counters = { flights: 0, coalesced: 0, aborted: 0 };
+
+export class Flight {
+  constructor() {
+    this.chunks = [];
+    this.meta = null;
+    this.done = false;
+    this.error = null;
+    this.refs = 0;
+    this.ac = new AbortController();
+    this.reader = null;
+    this.waiters = [];
+    this.ready = new Promise((resolve, reject) => {
+      this.resolveReady = resolve;
+      this.rejectReady = reject;
+    });
+    this.ready.catch(() => {});
+    this.settled = new Promise((resolve) => {
+      this.resolveSettled = resolve;
+    });
+  }
+
+  /** 后端请求的中止信号：所有订阅者离开时触发 */
+  get signal() {
+    return this.ac.signal;
+  }
+
+  /**
+   * 登记一个订阅者，返回 release()（可重复调用，只生效一次）
+   */
+  retain() {
+    this.refs++;
+    let released = false;
+    return () => {
+      if (released) return;
+      released = true;
+      if (--this.refs === 0 && !this.done) this.abort();
+    };
+  }
+
+  abort() {
+    if (this.ac.signal.aborted) return;
+    counters.aborted++;
+    this.ac.abort();
+    this.reader?.cancel().catch(() => {});
+  }
+
+  notify() {
+    const waiters = this.waiters;
+    this.waiters = [];
+    for (const wake of waiters) wake();
+  }
+
+  changed() {
+    return new Promise((resolve) => this.waiters.push(resolve));
+  }
+
+  /**
+   * 领头请求打开后端流后调用：开始读取并分发
+   * @param {ReadableStream} body - 后端响应体
+   * @param {object} meta - 订阅者可见的信息（model、auth 等）
+   * @param {{ onChunk?: (chunk) => void, onEnd?: (err, canceled) => void }} [hooks] - 用量统计与账号调度（只执行一次）
+   */
+  async start(body, meta, hooks = {}) {
+    this.meta = meta;
+    this.resolveReady();
+    this.reader = body.getReader();
+    if (this.ac.signal.aborted) this.reader.cancel().catch(() => {});
+    try {
+      while (true) {
+        const { done, value } = await this.reader.read();
+        if (done) break;
+        this.chunks.push(value);
+        hooks.onChunk?.(value);
+        this.notify();
+      }
+    } catch (e) {
+      this.error = e;
+    }
+    this.done = true;
+    this.notify();
+    this.resolveSettled();
+    hooks.onEnd?.(this.error, this.ac.signal.aborted);
+  }
+
+  /** 领头请求打开失败：等待中的订阅者收到同样的错误 */
+  fail(err) {
+    this.error = err;
+    this.done = true;
+    this.rejectReady(err);
+    this.resolveSettled();
+  }
+
+  /**
+   * 等待后端流打开后返回 { ...meta, body }，body 为从日志开头读取的独立 ReadableStream；读完或取消时调用 release
+   */
+  async join(release) {
+    await this.ready;
+    let cursor = 0;
+    const body = new ReadableStream({
+      pull: async (controller) => {
+        while (cursor >= this.chunks.length) {
+          if (this.done) {
+            release();
+            if (this.error) controller.error(this.error);
+            else controller.close();
+            return;
+          }
+          await this.changed();
+        }
+        controller.enqueue(this.chunks[cursor++]);
+      },
+      cancel: () => release(),
+    });
+    return { ...this.meta, body };
+  }
+}
+
+/**
+ * 取得 key 对应的进行中请求；不存在时新建，leader 为 true 表示调用方负责打开后端流
+ */
+export function acquireFlight(key) {
+  const existing = flights.get(key);
+  if (existing && !existing.done && !existing.ac.signal.aborted) {
+    counters.coalesced++;
+    return { flight: existing, leader: false };
+  }
+  const flight = new Flight();
+  flights.set(key, flight);
+  counters.flights++;
+  flight.settled.then(() => {
+    if (flights.get(key) === flight) flights.delete(key);
+  });
+  return { flight, leader: true };
+}
+
+export function getSingleflightStats() {
+  return { inflight: flights.size, ...counters };
+}
@@ -0,0 +1,163 @@
+/**
+ * 增量 SSE 解析器：在字节块上定位行边界，每块只解码一次完整行，半行以字节片段暂存，
+ * 不再对整个缓冲区反复拼接与 split；支持多行 data 与 event 名称，并可在 JSON.parse 前按事件类型过滤。
+ */
+
+const LF = 0x0a;
+
+// 只认对象开头的顶层 type；嵌套对象里的 type 可能先于顶层出现，匹配不到时解析后再判断
+const TYPE_SNIFF = /^\s*\{\s*"type"\s*:\s*"([^"]+)"/;
+
+/** 后端发送 data: [DONE] 时产出的哨兵事件 */
+export const SSE_DONE = Object.freeze({ type: '[DONE]' });
+
+export class SseParser {
+  /**
+   * @param {object} [opts]
+   * @param {Iterable<string>} [opts.types] - 只解析这些事件类型，其余在 JSON.parse 前丢弃；不传则全部解析
+   */
+  constructor(opts = {}) {
+    this.types = opts.types ? new Set(opts.types) : null;
+    this.pending = []; // 跨块的半行字节片段
+    this.pendingBytes = 0;
+    this.eventName = '';
+    this.data = null;
+    this.skip = false;
+    this.skipped = 0;
+  }
+
+  /**
+   * 喂入一个字节块，返回本块内完成的事件（已 JSON.parse 的对象，或 SSE_DONE）。
+   * 在字节上定位最后一个 LF，只把完整行解码一次；不足一行的尾部以字节片段暂存，不做字符串拼接。
+   */
+  push(chunk) {
+    if (!Buffer.isBuffer(chunk)) chunk = Buffer.from(chunk.buffer, chunk.byteOffset, chunk.byteLength);
+    const out = [];
+    const last = chunk.lastIndexOf(LF);
+    if (last === -1) {
+      this.hold(chunk);
+      return out;
+    }
+    let head = chunk.subarray(0, last);
+    if (this.pending.length) {
+      this.pending.push(head);
+      head = Buffer.concat(this.pending, this.pendingBytes + last);
+      this.pending.length = 0;
+      this.pendingBytes = 0;
+    }
+    this.lines(head.toString('utf8'), out);
+    if (last + 1 < chunk.length) this.hold(chunk.subarray(last + 1));
+    return out;
+  }
+
+  /**
+   * 流结束：处理末尾未以空行结束的事件
+   */
+  end() {
+    const out = [];
+    if (this.pending.length) {
+      const tail = Buffer.concat(this.pending, this.pendingBytes);
+      this.pending.length = 0;
+      this.pendingBytes = 0;
+      this.lines(tail.toString('utf8'), out);
+    }
+    this.dispatch(out);
+    return out;
+  }
+
+  hold(bytes) {
+    this.pending.push(bytes);
+    this.pendingBytes += bytes.length;
+  }
+
+  lines(text, out) {
+    let pos = 0;
+    const len = text.length;
+    while (pos <= len) {
+      let nl = text.indexOf('\n', pos);
+      if (nl === -1) nl = len;
+      this.line(text, pos, text.charCodeAt(nl - 1) === 13 && nl > pos ? nl - 1 : nl, out);
+      pos = nl + 1;
+    }
+  }
+
+  line(text, start, end, out) {
+    if (end === start) {
+      this.dispatch(out);
+      return;
+    }
+    if (text.startsWith('data:', start)) {
+      if (this.skip) return;
+      const v = text.charCodeAt(start + 5) === 32 ? start + 6 : start + 5;
+      const value = text.slice(v, end);
+      this.data = this.data === null ? value : `${this.data}\n${value}`;
+    } else if (text.startsWith('event:', start)) {
+      const v = text.charCodeAt(start + 6) === 32 ? start + 7 : start + 6;
+      this.eventName = text.slice(v, end);
+      // 已知事件名不在关注列表中时，后续 data 行不再累积
+      if (this.types && this.eventName && !this.types.has(this.eventName)) this.skip = true;
+    }
+  }
+
+  dispatch(out) {
+    const data = this.data;
+    const name = this.eventName;
+    const skip = this.skip;
+    this.data = null;
+    this.eventName = '';
+    this.skip = false;
+    if (skip) {
+      this.skipped++;
+      return;
+    }
+    if (data === null) return;
+    if (data === '[DONE]') {
+      out.push(SSE_DONE);
+      return;
+    }
+    let sniffed = false;
+    if (this.types && !name) {
+      const type = TYPE_SNIFF.exec(data)?.[1];
+      if (type && !this.types.has(type)) {
+        this.skipped++;
+        return;
+      }
+      sniffed = !!type;
+    }
+    let event;
+    try {
+      event = JSON.parse(data);
+    } catch (_) {
+      return;
+    }
+    if (this.types && !name && !sniffed && typeof event?.type === 'string' && !this.types.has(event.type)) {
+      this.skipped++;
+      return;
+    }
+    out.push(event);
+  }
+}
+
+/**
+ * 逐块读取 ReadableStream 并产出事件批次（每个字节块一批），供各流读取循环复用
+ */
+export async function* readSseEvents(stream, opts = {}) {
+  const reader = stream.getReader();
+  const parser = new SseParser(opts);
+  let finished = false;
+  try {
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      const events = parser.push(value);
+      if (events.length) yield events;
+    }
+    finished = true;
+    const rest = parser.end();
+    if (rest.length) yield rest;
+  } finally {
+    // 调用方提前退出时取消上游，避免继续占用后端连接
+    if (finished) reader.releaseLock();
+    else reader.cancel().catch(() => {});
+  }
+}
@@ -0,0 +1,209 @@
+/**
+ * Token 计数：o200k 风格的字节级 BPE，用于估算 prompt/completion token（后端返回 usage 时以后端为准）。
+ *
+ * 词表为 tiktoken 格式（每行 "base64 rank"），启动时异步加载（loadTokenizer），加载完成前与词表不存在时都用估算：
+ * CODEX_TOKENIZER_FILE 指定路径，默认 data/o200k_base.tiktoken
+ * （可从 https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken 下载）。
+ * 估算规则：CJK 字符约 1 token/字，其余约 4 字符 = 1 token。
+ *
+ * 词表以紧凑的 TypedArray 存储（拼接的字节 + 偏移 + 开放寻址哈希表），
+ * 已计数的文本片段（重复的 system prompt、tools schema 等）进入 LRU 缓存，多轮对话中不重复计算。
+ */
+import { existsSync } from 'fs';
+import { readFile } from 'fs/promises';
+import { join, dirname } from 'path';
+import { fileURLToPath } from 'url';
+import { LruCache } from './lru.js';
+
+const __dirname = dirname(fileURLToPath(import.meta.url));
+const dataDir = process.env.CODEX_DATA_DIR || join(__dirname, '..', 'data');
+const RANKS_FILE = process.env.CODEX_TOKENIZER_FILE || join(dataDir, 'o200k_base.tiktoken');
+
+// o200k_base 预分词规则（(?i:...) 在 JS 中展开为字符类）
+const CONTRACTION = "(?:'[sS]|'[tT]|'[rR][eE]|'[vV][eE]|'[mM]|'[lL][lL]|'[dD])?";
+const PRETOKENIZE = new RegExp([
+  `[^\\r\\n\\p{L}\\p{N}]?[\\p{Lu}\\p{Lt}\\p{Lm}\\p{Lo}\\p{M}]*[\\p{Ll}\\p{Lm}\\p{Lo}\\p{M}]+${CONTRACTION}`,
+  `[^\\r\\n\\p{L}\\p{N}]?[\\p{Lu}\\p{Lt}\\p{Lm}\\p{Lo}\\p{M}]+[\\p{Ll}\\p{Lm}\\p{Lo}\\p{M}]*${CONTRACTION}`,
+  '\\p{N}{1,3}',
+  ' ?[^\\s\\p{L}\\p{N}]+[\\r\\n/]*',
+  '\\s*[\\r\\n]+',
+  '\\s+(?!\\S)',
+  '\\s+',
+].join('|'), 'gu');
+
+// 超长片段（如无空格的 base64）按此长度切块后再合并，避免 O(n²) 合并
+const MAX_PIECE_BYTES = 256;
+const CACHE_MIN_CHARS = 32;
+
+const segmentCache = new LruCache({ maxEntries: 4096, maxBytes: 16 * 1024 * 1024, sizeOf: (_v, key) => key.length * 2 });
+
+let ranks; // undefined：未加载；null：词表不可用或加载中
+let loading = null;
+// 解析词表时每处理这么多行让出一次事件循环，避免阻塞进行中的请求
+const PARSE_BATCH_LINES = 16384;
+
+class BpeRanks {
+  constructor(bytes, offsets, rankOf) {
+    this.bytes = bytes; // 所有 token 字节拼接
+    this.offsets = offsets; // token i 的字节区间为 [offsets[i], offsets[i + 1])
+    this.rankOf = rankOf; // token i 的 rank
+    let size = 1;
+    while (size < rankOf.length * 2) size <<= 1;
+    this.mask = size - 1;
+    this.table = new Int32Array(size).fill(-1);
+    for (let i = 0; i < rankOf.length; i++) {
+      let slot = hashBytes(bytes, offsets[i], offsets[i + 1]) & this.mask;
+      while (this.table[slot] !== -1) slot = (slot + 1) & this.mask;
+      this.table[slot] = i;
+    }
+  }
+
+  /** 返回字节区间对应的 rank，不在词表中返回 -1 */
+  rank(buf, start, end) {
+    const len = end - start;
+    let slot = hashBytes(buf, start, end) & this.mask;
+    while (true) {
+      const i = this.table[slot];
+      if (i === -1) return -1;
+      const off = this.offsets[i];
+      if (this.offsets[i + 1] - off === len) {
+        let same = true;
+        for (let k = 0; k < len; k++) {
+          if (this.bytes[off + k] !== buf[start + k]) {
+            same = false;
+            break;
+          }
+        }
+        if (same) return this.rankOf[i];
+      }
+      slot = (slot + 1) & this.mask;
+    }
+  }
+}
+
+function hashBytes(buf, start, end) {
+  let h = 0x811c9dc5;
+  for (let i = start; i < end; i++) {
+    h ^= buf[i];
+    h = Math.imul(h, 0x01000193);
+  }
+  return h >>> 0;
+}
+
+/**
+ * 异步加载词表（只加载一次）；启动时调用，词表缺失时提示一次。加载完成前 countTokens 使用估算
+ * @returns {Promise<boolean>} 是否加载成功
+ */
+export function loadTokenizer() {
+  if (loading) return loading;
+  ranks = null;
+  loading = (async () => {
+    if (!existsSync(RANKS_FILE)) {
+      console.warn('[WARN] 未找到 tokenizer 词表 ' + RANKS_FILE + '，token 计数改用估算（下载方法见 README，或设置 CODEX_TOKENIZER_FILE）');
+      return false;
+    }
+    try {
+      const lines = (await readFile(RANKS_FILE, 'utf8')).split('\n').filter(Boolean);
+      const tokens = [];
+      for (let i = 0; i < lines.length; i++) {
+        const sp = lines[i].indexOf(' ');
+        tokens.push({ bytes: Buffer.from(lines[i].slice(0, sp), 'base64'), rank: Number(lines[i].slice(sp + 1)) });
+        if ((i + 1) % PARSE_BATCH_LINES === 0) await new Promise((resolve) => setImmediate(resolve));
+      }
+      const total = tokens.reduce((n, t) => n + t.bytes.length, 0);
+      const bytes = new Uint8Array(total);
+      const offsets = new Uint32Array(tokens.length + 1);
+      const rankOf = new Uint32Array(tokens.length);
+      let off = 0;
+      tokens.forEach((t, i) => {
+        offsets[i] = off;
+        bytes.set(t.bytes, off);
+        off += t.bytes.length;
+        rankOf[i] = t.rank;
+      });
+      offsets[tokens.length] = off;
+      ranks = new BpeRanks(bytes, offsets, rankOf);
+      segmentCache.clear(); // 丢弃加载前缓存的估算值
+      return true;
+    } catch (e) {
+      console.warn('[WARN] 加载 tokenizer 词表失败，改用估算:', e.message);
+      return false;
+    }
+  })();
+  return loading;
+}
+
+/**
+ * 对一个预分词片段做 BPE 合并，返回 token 数
+ */
+function bpeCount(r, buf, start, end) {
+  if (end - start <= 1 || r.rank(buf, start, end) !== -1) return 1;
+  const parts = [];
+  for (let i = start; i <= end; i++) parts.push(i);
+  while (parts.length > 2) {
+    let best = -1;
+    let bestRank = Infinity;
+    for (let i = 0; i + 2 < parts.length; i++) {
+      const rk = r.rank(buf, parts[i], parts[i + 2]);
+      if (rk !== -1 && rk < bestRank) {
+        bestRank = rk;
+        best = i;
+      }
+    }
+    if (best === -1) break;
+    parts.splice(best + 1, 1);
+  }
+  return parts.length - 1;
+}
+
+function isCjk(c) {
+  return (c >= 0x3040 && c <= 0x30ff) || (c >= 0x3400 && c <= 0x4dbf) || (c >= 0x4e00 && c <= 0x9fff)
+    || (c >= 0xac00 && c <= 0xd7af) || (c >= 0xf900 && c <= 0xfaff) || (c >= 0xff00 && c <= 0xffef);
+}
+
+/**
+ * 无词表时的估算：CJK 字符按 1 token/字，其余按 4 字符 = 1 token
+ */
+function estimateTokens(text) {
+  let cjk = 0;
+  for (let i = 0; i < text.length; i++) {
+    if (isCjk(text.charCodeAt(i))) cjk++;
+  }
+  return cjk + Math.ceil((text.length - cjk) / 4);
+}
+
+function encodeCount(r, text) {
+  let n = 0;
+  for (const m of text.matchAll(PRETOKENIZE)) {
+    const buf = Buffer.from(m[0], 'utf8');
+    for (let s = 0; s < buf.length; ) {
+      let e = Math.min(buf.length, s + MAX_PIECE_BYTES);
+      // 回退到 UTF-8 字符边界（不在续字节 10xxxxxx 处切开多字节字符）
+      while (e < buf.length && e > s + 1 && (buf[e] & 0xc0) === 0x80) e--;
+      n += bpeCount(r, buf, s, e);
+      s = e;
+    }
+  }
+  return n;
+}
+
+/**
+ * 计算文本的 token 数；较长片段走 LRU 缓存（opts.cache=false 时跳过，用于不会重复出现的文本，如模型输出）
+ */
+export function countTokens(text, opts = {}) {
+  if (!text) return 0;
+  text = String(text);
+  const cacheable = opts.cache !== false && text.length >= CACHE_MIN_CHARS;
+  if (cacheable) {
+    const hit = segmentCache.get(text);
+    if (hit !== undefined) return hit;
+  }
+  if (!loading) loadTokenizer().catch(() => {});
+  const n = ranks ? encodeCount(ranks, text) : estimateTokens(text);
+  if (cacheable) segmentCache.set(text, n);
+  return n;
+}
+
+export function getTokenizerStats() {
+  return { exact: !!ranks, file: RANKS_FILE, cache: segmentCache.stats() };
+}
@@ -0,0 +1,191 @@
+/**
+ * 工具调用：Chat Completions 与 Responses API 格式互转，以及后端 SSE 中函数调用事件的增量组装。
+ *
+ * 后端事件（按 item_id 关联）：
+ * - response.output_item.added（item.type 为 function_call）/ response.content_part.added：开始一个调用
+ * - response.function_call_arguments.delta：参数增量
+ * - response.function_call_arguments.done / response.output_item.done：参数完整值，调用结束
+ * 组装器只为进行中的调用保存状态，调用结束即释放；每个事件返回可直接写给客户端的 tool_calls delta。
+ */
+
+// 组装器关心的后端事件
+export const TOOL_CALL_EVENTS = [
+  'response.output_item.added',
+  'response.content_part.added',
+  'response.function_call_arguments.delta',
+  'response.function_call_arguments.done',
+  'response.output_item.done',
+];
+
+const FUNCTION_CALL_TYPES = ['function_call', 'function', 'tool_use', 'tool_call'];
+
+function isFunctionCallPart(part) {
+  return !!part && FUNCTION_CALL_TYPES.includes(part.type);
+}
+
+function getFunctionName(obj) {
+  return obj?.name || obj?.function_name || obj?.tool_name || obj?.function?.name || obj?.call_name || '';
+}
+
+function getFunctionCallId(obj, fallback) {
+  return obj?.call_id || obj?.id || obj?.function?.id || fallback;
+}
+
+/**
+ * 后端始终不带函数名时按请求中的 tools 推断：按序号取，只有一个工具时取该工具
+ */
+function getToolNameFromRequest(tools, index) {
+  if (!Array.isArray(tools) || tools.length === 0) return '';
+  const t = tools[index] || (tools.length === 1 ? tools[0] : null);
+  return getFunctionName(t);
+}
+
+/**
+ * Chat Completions tools → Responses API tools（{ type:'function', function:{...} } 展平为 { type:'function', name, ... }）
+ */
+export function toResponsesTools(tools) {
+  if (!Array.isArray(tools)) return [];
+  return tools.map((t) => {
+    if (t?.type !== 'function' || !t.function) return t;
+    const { name, description, parameters, strict } = t.function;
+    const out = { type: 'function', name };
+    if (description != null) out.description = description;
+    if (parameters != null) out.parameters = parameters;
+    if (strict != null) out.strict = strict;
+    return out;
+  });
+}
+
+/**
+ * Chat Completions tool_choice → Responses API tool_choice
+ */
+export function toResponsesToolChoice(choice) {
+  if (choice == null) return 'auto';
+  if (typeof choice === 'object' && choice.type === 'function' && choice.function?.name) {
+    return { type: 'function', name: choice.function.name };
+  }
+  return choice;
+}
+
+export class ToolCallAssembler {
+  /**
+   * @param {object} [opts]
+   * @param {object[]} [opts.tools] - 请求中的 tools，用于推断缺失的函数名
+   * @param {boolean} [opts.collect] - 是否保留已完成的调用（非流式需要，流式不需要）
+   */
+  constructor(opts = {}) {
+    this.tools = opts.tools;
+    this.collect = !!opts.collect;
+    this.active = new Map(); // item_id -> { index, id, name, arguments, announced }
+    this.count = 0;
+    this.finished = new Set(); // 已结束、尚未收到 output_item.done 的 item_id，忽略其后重复的 done 事件
+    this.completed = [];
+  }
+
+  start(itemId, info = {}) {
+    let call = this.active.get(itemId);
+    if (!call) {
+      const index = this.count++;
+      call = {
+        index,
+        id: getFunctionCallId(info, `call_${itemId}`),
+        name: getFunctionName(info),
+        arguments: '',
+        announced: false,
+      };
+      this.active.set(itemId, call);
+    } else {
+      if (!call.name) call.name = getFunctionName(info);
+      if (info.call_id && !call.announced) call.id = info.call_id;
+    }
+    return call;
+  }
+
+  /**
+   * 追加参数文本，返回 tool_calls delta；首个 delta 带 id/type/name
+   */
+  emit(call, args) {
+    if (!call.announced) {
+      if (!call.name) call.name = getToolNameFromRequest(this.tools, call.index);
+      call.announced = true;
+      call.arguments += args;
+      return { index: call.index, id: call.id, type: 'function', function: { name: call.name, arguments: args } };
+    }
+    if (!args) return null;
+    call.arguments += args;
+    return { index: call.index, function: { arguments: args } };
+  }
+
+  /**
+   * 以完整参数收尾：补发尚未发出的部分并释放状态
+   */
+  finish(itemId, info, fullArgs) {
+    const call = this.start(itemId, info);
+    let rest = '';
+    if (typeof fullArgs === 'string' && fullArgs.length > call.arguments.length && fullArgs.startsWith(call.arguments)) {
+      rest = fullArgs.slice(call.arguments.length);
+    }
+    const delta = this.emit(call, rest);
+    this.active.delete(itemId);
+    this.finished.add(itemId);
+    if (this.collect) {
+      this.completed.push({ id: call.id, type: 'function', function: { name: call.name, arguments: call.arguments } });
+    }
+    return delta;
+  }
+
+  /**
+   * 处理一个后端事件，返回要发给客户端的 tool_calls delta 数组（可能为空）
+   */
+  handle(event) {
+    const out = [];
+    const push = (d) => {
+      if (d) out.push(d);
+    };
+    switch (event.type) {
+      case 'response.output_item.added':
+        if (isFunctionCallPart(event.item)) {
+          const call = this.start(event.item.id, event.item);
+          if (call.name) push(this.emit(call, event.item.arguments || ''));
+        }
+        break;
+      case 'response.content_part.added':
+        if (isFunctionCallPart(event.part)) this.start(event.item_id, event.part);
+        break;
+      case 'response.function_call_arguments.delta':
+        if (event.delta) push(this.emit(this.start(event.item_id, event), String(event.delta)));
+        break;
+      case 'response.function_call_arguments.done':
+        if (!this.finished.has(event.item_id)) push(this.finish(event.item_id, event, event.arguments));
+        break;
+      case 'response.output_item.done':
+        // 也覆盖没有任何前置事件、只在 done 中给出完整调用的情况
+        if (isFunctionCallPart(event.item) && !this.finished.has(event.item.id)) {
+          push(this.finish(event.item.id, event.item, event.item.arguments || ''));
+        }
+        // output_item.done 是该 item 的最后一个事件，之后不再需要去重
+        this.finished.delete(event.item?.id);
+        break;
+      default:
+        break;
+    }
+    return out;
+  }
+
+  /**
+   * 结束时收尾仍在进行中的调用
+   */
+  flush() {
+    const out = [];
+    for (const itemId of [...this.active.keys()]) {
+      const d = this.finish(itemId, {}, null);
+      if (d) out.push(d);
+    }
+    return out;
+  }
+
+  /** 已完成的调用（OpenAI message.tool_calls 格式），需 collect */
+  toolCalls() {
+    return this.completed;
+  }
+}
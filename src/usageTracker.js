@@ -1,36 +1,173 @@
 /**
  * 按官方标准（token 计量）统计用量，持久化到 data/usage.json；账号不可用时清零该账号用量。
- * Token 估算：与 OpenAI 一致，约 4 字符 = 1 token。
+ * Token 计数：优先使用后端返回的 usage，否则由 tokenizer.js 本地计数。
+ *
+ * 用量常驻内存，请求路径上不做磁盘 I/O：
+ * - 每次变更追加到待写队列，定时（CODEX_USAGE_FLUSH_MS，默认 2000）异步追加到 usage.json.journal
+ * - 日志条目超过阈值或进程退出时压缩：写临时文件后 rename 覆盖 usage.json，再清空日志
+ * - 启动时加载快照并重放 seq 大于快照的日志条目，崩溃最多丢失一个刷新周期
+ *
+ * 集群模式下 worker 为副本（setUsageReplica）：不读写磁盘，变更交给主进程持久化并广播给其他 worker
  */
-import { readFileSync, writeFileSync, mkdirSync, existsSync } from 'fs';
+import { readFileSync, writeFileSync, appendFileSync, renameSync, mkdirSync, existsSync } from 'fs';
+import { appendFile, writeFile, rename, mkdir } from 'fs/promises';
 import { join, dirname } from 'path';
 import { fileURLToPath } from 'url';
 
 const __dirname = dirname(fileURLToPath(import.meta.url));
 const dataDir = process.env.CODEX_DATA_DIR || join(__dirname, '..', 'data');
 const USAGE_FILE = join(dataDir, 'usage.json');
+const JOURNAL_FILE = `${USAGE_FILE}.journal`;
 
 const DEFAULT_QUOTA_TOKENS = 1_000_000;
 const QUOTA = Number(process.env.USAGE_QUOTA_TOKENS) || DEFAULT_QUOTA_TOKENS;
+const FLUSH_MS = Math.max(100, Number(process.env.CODEX_USAGE_FLUSH_MS) || 2000);
+const COMPACT_EVERY = 1000;
 
-function load() {
-  if (!existsSync(USAGE_FILE)) return { byAccount: {} };
+let state = null;
+let seq = 0;
+let pending = [];
+let journalEntries = 0;
+let flushTimer = null;
+let flushing = null;
+let replicaListener = null;
+const stats = { flushes: 0, compactions: 0, lastFlushMs: 0, maxFlushMs: 0, lastError: null, canceledStreams: 0 };
+
+function readSnapshot() {
+  if (!existsSync(USAGE_FILE)) return { byAccount: {}, seq: 0 };
   try {
     const raw = readFileSync(USAGE_FILE, 'utf8');
     const data = JSON.parse(raw);
     return typeof data === 'object' && data !== null && Array.isArray(data.byAccount) === false
-      ? { byAccount: data.byAccount || {} }
-      : { byAccount: {} };
+      ? { byAccount: data.byAccount || {}, seq: Number(data.seq) || 0 }
+      : { byAccount: {}, seq: 0 };
   } catch {
-    return { byAccount: {} };
+    return { byAccount: {}, seq: 0 };
+  }
+}
+
+function applyEntry(s, entry) {
+  if (entry.clear) {
+    s.byAccount[entry.id] = { prompt_tokens: 0, completion_tokens: 0 };
+    return;
+  }
+  const acc = ensureAccount(s, entry.id);
+  acc.prompt_tokens += entry.p || 0;
+  acc.completion_tokens += entry.c || 0;
+  if (entry.x) acc.canceled = (acc.canceled || 0) + 1;
+}
+
+function load() {
+  if (state) return state;
+  const snap = readSnapshot();
+  state = { byAccount: snap.byAccount };
+  seq = snap.seq;
+  if (existsSync(JOURNAL_FILE)) {
+    let raw = '';
+    try {
+      raw = readFileSync(JOURNAL_FILE, 'utf8');
+    } catch (_) {}
+    for (const line of raw.split('\n')) {
+      if (!line) continue;
+      let entry;
+      try {
+        entry = JSON.parse(line);
+      } catch {
+        continue; // 崩溃时写了一半的最后一行
+      }
+      journalEntries++;
+      if (!(entry.s > snap.seq)) continue;
+      applyEntry(state, entry);
+      if (entry.s > seq) seq = entry.s;
+    }
+  }
+  process.once('exit', flushUsageSync);
+  return state;
+}
+
+function snapshotJson() {
+  return JSON.stringify({ seq, byAccount: state.byAccount }, null, 2);
+}
+
+function scheduleFlush() {
+  if (flushTimer) return;
+  flushTimer = setTimeout(() => {
+    flushTimer = null;
+    flushUsage().catch(() => {});
+  }, FLUSH_MS);
+  flushTimer.unref?.();
+}
+
+function push(entry) {
+  if (replicaListener) {
+    applyEntry(state, entry);
+    replicaListener(entry);
+    return;
   }
+  entry.s = ++seq;
+  applyEntry(state, entry);
+  pending.push(entry);
+  scheduleFlush();
+}
+
+/**
+ * 异步刷盘：追加日志，必要时压缩为快照（临时文件 + rename）。串行执行，可随时调用。
+ */
+export async function flushUsage() {
+  while (flushing) await flushing;
+  if (!state || (pending.length === 0 && journalEntries < COMPACT_EVERY)) return;
+  flushing = (async () => {
+    const batch = pending;
+    pending = [];
+    const t0 = Date.now();
+    try {
+      await mkdir(dirname(USAGE_FILE), { recursive: true });
+      if (batch.length) {
+        await appendFile(JOURNAL_FILE, batch.map((e) => JSON.stringify(e)).join('\n') + '\n', 'utf8');
+        journalEntries += batch.length;
+      }
+      if (journalEntries >= COMPACT_EVERY) {
+        // 快照包含内存中全部变更（含尚未写入日志的），其 seq 之前的日志条目重放时会被跳过
+        const tmp = `${USAGE_FILE}.tmp`;
+        await writeFile(tmp, snapshotJson(), 'utf8');
+        await rename(tmp, USAGE_FILE);
+        await writeFile(JOURNAL_FILE, '', 'utf8');
+        journalEntries = 0;
+        stats.compactions++;
+      }
+      stats.lastError = null;
+    } catch (e) {
+      pending = batch.concat(pending);
+      stats.lastError = e.message;
+      console.error('usageTracker save failed:', e.message);
+    } finally {
+      const ms = Date.now() - t0;
+      stats.flushes++;
+      stats.lastFlushMs = ms;
+      if (ms > stats.maxFlushMs) stats.maxFlushMs = ms;
+      flushing = null;
+    }
+  })();
+  await flushing;
 }
 
-function save(state) {
+/**
+ * 同步写快照并清空日志，用于进程退出
+ */
+export function flushUsageSync() {
+  if (!state) return;
   try {
     const dir = dirname(USAGE_FILE);
     if (!existsSync(dir)) mkdirSync(dir, { recursive: true });
-    writeFileSync(USAGE_FILE, JSON.stringify(state, null, 2), 'utf8');
+    if (pending.length) {
+      appendFileSync(JOURNAL_FILE, pending.map((e) => JSON.stringify(e)).join('\n') + '\n', 'utf8');
+      pending = [];
+    }
+    const tmp = `${USAGE_FILE}.tmp`;
+    writeFileSync(tmp, snapshotJson(), 'utf8');
+    renameSync(tmp, USAGE_FILE);
+    writeFileSync(JOURNAL_FILE, '', 'utf8');
+    journalEntries = 0;
   } catch (e) {
     console.error('usageTracker save failed:', e.message);
   }
@@ -46,14 +183,17 @@ function ensureAccount(state, accountId) {
 
 /**
  * 记录本次请求的 token 用量（与 OpenAI 标准一致：prompt_tokens + completion_tokens）
+ * canceled：客户端中途断开的流，token 照常计入，另在该账号的 canceled 计数中单独统计
  */
-export function recordUsage(accountId, { prompt_tokens = 0, completion_tokens = 0 }) {
+export function recordUsage(accountId, { prompt_tokens = 0, completion_tokens = 0 }, { canceled = false } = {}) {
   if (!accountId) return;
-  const state = load();
-  const acc = ensureAccount(state, accountId);
-  acc.prompt_tokens += Number(prompt_tokens) || 0;
-  acc.completion_tokens += Number(completion_tokens) || 0;
-  save(state);
+  load();
+  const entry = { id: String(accountId), p: Number(prompt_tokens) || 0, c: Number(completion_tokens) || 0 };
+  if (canceled) {
+    entry.x = 1;
+    stats.canceledStreams++;
+  }
+  push(entry);
 }
 
 /**
@@ -61,17 +201,15 @@ export function recordUsage(accountId, { prompt_tokens = 0, completion_tokens =
  */
 export function clearUsage(accountId) {
   if (!accountId) return;
-  const state = load();
-  state.byAccount[String(accountId)] = { prompt_tokens: 0, completion_tokens: 0 };
-  save(state);
+  load();
+  push({ id: String(accountId), clear: 1 });
 }
 
 /**
  * 返回该账号已用 token 数（prompt + completion）
  */
 export function getUsedTokens(accountId) {
-  const state = load();
-  const acc = state.byAccount[String(accountId)];
+  const acc = load().byAccount[String(accountId)];
   return acc ? (acc.prompt_tokens + acc.completion_tokens) : 0;
 }
 
@@ -84,4 +222,38 @@ export function getRemainingPct(accountId) {
   return Math.min(100, Math.round(((QUOTA - used) / QUOTA) * 100));
 }
 
+/**
+ * 持久化计数：待写变更数、刷盘耗时等
+ */
+export function getUsageStats() {
+  return { pendingDeltas: pending.length, journalEntries, flushIntervalMs: FLUSH_MS, replica: !!replicaListener, ...stats };
+}
+
+/**
+ * 切换为副本模式（集群 worker）：之后的本地变更只作用于内存并交给 listener(entry) 转发
+ */
+export function setUsageReplica(listener) {
+  replicaListener = listener;
+  state = { byAccount: {} };
+}
+
+/**
+ * 应用来自其他进程的变更：主进程上持久化，副本上只更新内存
+ */
+export function applyUsageEntry(entry) {
+  load();
+  if (replicaListener) applyEntry(state, entry);
+  else push({ id: entry.id, p: entry.p, c: entry.c, x: entry.x, clear: entry.clear });
+}
+
+/** 当前全部账号用量，用于给新 worker 下发快照 */
+export function getUsageSnapshot() {
+  return load().byAccount;
+}
+
+/** 副本加载主进程下发的快照 */
+export function loadUsageSnapshot(byAccount) {
+  state = { byAccount: structuredClone(byAccount || {}) };
+}
+
 export { QUOTA };
@@ -0,0 +1,76 @@
+import { test } from 'node:test';
+import assert from 'node:assert/strict';
+
+process.env.CODEX_ACCOUNT_MAX_INFLIGHT = '4';
+const { AdmissionQueue, admissionCapacity } = await import('../src/admission.js');
+const { beginAccountRequest, endAccountRequest } = await import('../src/scheduler.js');
+
+test('admits up to capacity, queues the rest and drains on release', async () => {
+  const q = new AdmissionQueue(() => 2, { maxQueue: 10, timeoutMs: 1000 });
+  const r1 = await q.acquire('a');
+  await q.acquire('a');
+  let admitted = false;
+  const pending = q.acquire('b').then((release) => {
+    admitted = true;
+    return release;
+  });
+  await Promise.resolve();
+  assert.equal(admitted, false);
+  assert.equal(q.stats().depth, 1);
+  r1();
+  (await pending)();
+  assert.equal(admitted, true);
+  assert.equal(q.stats().inflight, 1);
+});
+
+test('rejects with 429 when the queue is full or the wait times out', async () => {
+  const q = new AdmissionQueue(() => 1, { maxQueue: 1, timeoutMs: 50 });
+  await q.acquire('a');
+  const waiting = q.acquire('a');
+  await assert.rejects(q.acquire('a'), (e) => e.status === 429 && e.retryAfter >= 1);
+  await assert.rejects(waiting, (e) => e.status === 429);
+  assert.equal(q.stats().rejected, 1);
+  assert.equal(q.stats().timedOut, 1);
+});
+
+test('dequeues fairly across clients', async () => {
+  const q = new AdmissionQueue(() => 1, { maxQueue: 10, timeoutMs: 1000 });
+  const order = [];
+  const releases = [await q.acquire('x')];
+  const waiters = ['a1', 'a2', 'a3', 'b1'].map((label) =>
+    q.acquire(label[0]).then((release) => {
+      order.push(label);
+      releases.push(release);
+    })
+  );
+  for (let i = 0; i < waiters.length; i++) {
+    releases[i]();
+    await new Promise((resolve) => setImmediate(resolve));
+  }
+  await Promise.all(waiters);
+  assert.deepEqual(order, ['a1', 'b1', 'a2', 'a3']);
+});
+
+test('a canceled waiter leaves the queue', async () => {
+  const q = new AdmissionQueue(() => 1, { maxQueue: 10, timeoutMs: 1000 });
+  await q.acquire('a');
+  const ac = new AbortController();
+  const waiting = q.acquire('a', ac.signal);
+  ac.abort();
+  await assert.rejects(waiting, /client closed/);
+  assert.equal(q.stats().depth, 0);
+});
+
+test('capacity counts only schedulable accounts', () => {
+  const auths = ['ok', 'cool-1', 'cool-2'].map((id) => ({ type: 'codex', accessToken: 'x', accountId: `adm-${id}` }));
+  assert.equal(admissionCapacity(auths), 12);
+  for (const a of auths.slice(1)) {
+    beginAccountRequest(a.accountId);
+    endAccountRequest(a.accountId, { ok: false, status: 429 });
+  }
+  assert.equal(admissionCapacity(auths), 4);
+  beginAccountRequest(auths[0].accountId);
+  endAccountRequest(auths[0].accountId, { ok: false, status: 429 });
+  // 全部冷却：保留一个账号的名额用于探测
+  assert.equal(admissionCapacity(auths), 4);
+});
@@ -0,0 +1,48 @@
+import { test } from 'node:test';
+import assert from 'node:assert/strict';
+import { mkdtempSync } from 'fs';
+import { tmpdir } from 'os';
+import { join } from 'path';
+
+process.env.CODEX_DATA_DIR = mkdtempSync(join(tmpdir(), 'codex-prefix-'));
+const { messagesToInput, getPrefixCacheStats } = await import('../src/proxy.js');
+
+// 每轮请求都是新解析的 JSON，与真实客户端一致
+const clone = (v) => JSON.parse(JSON.stringify(v));
+const hashed = () => getPrefixCacheStats().keysHashed;
+
+function conversation(tag, turns) {
+  const messages = [{ role: 'system', content: 'You are terse.' }];
+  for (let i = 0; i < turns; i++) {
+    messages.push({ role: 'user', content: `${tag} question ${i}` }, { role: 'assistant', content: `${tag} answer ${i}` });
+  }
+  return messages;
+}
+
+test('only new messages are hashed on later turns', () => {
+  for (let turns = 1; turns <= 5; turns++) {
+    const messages = clone(conversation('a', turns));
+    const before = hashed();
+    messagesToInput(messages);
+    // 前两条消息（对话起点）每次都要哈希，其余只哈希新增的两条
+    assert.equal(hashed() - before, turns === 1 ? 3 : 4);
+  }
+});
+
+test('a cached prefix gives the same input as a cold conversion', () => {
+  const messages = conversation('b', 4);
+  for (let turns = 1; turns < 4; turns++) messagesToInput(clone(conversation('b', turns)));
+  const warm = messagesToInput(clone(messages));
+  const cold = messagesToInput(clone([{ role: 'system', content: 'cold' }, ...messages]));
+  assert.equal(warm[0].content[0].text, cold[0].content[0].text.replace('System: cold\n', ''));
+});
+
+test('an edited earlier message is not served from the previous turn', () => {
+  const messages = clone(conversation('c', 3));
+  messagesToInput(clone(messages));
+  messages[2].content = 'c answer 0 (edited)';
+  const before = hashed();
+  const input = messagesToInput(clone(messages));
+  assert.ok(input[0].content[0].text.includes('c answer 0 (edited)'));
+  assert.equal(hashed() - before, messages.length);
+});
@@ -0,0 +1,84 @@
+import { test } from 'node:test';
+import assert from 'node:assert/strict';
+
+process.env.CODEX_ACCOUNT_MAX_INFLIGHT = '2';
+process.env.CODEX_SCHEDULER = 'least-outstanding';
+const {
+  createScheduler,
+  beginAccountRequest,
+  endAccountRequest,
+  applyRemoteLoad,
+  countSchedulableAccounts,
+  ACCOUNT_SLOTS,
+} = await import('../src/scheduler.js');
+
+let seq = 0;
+function makeAuths(n) {
+  const prefix = `t${seq++}`;
+  return Array.from({ length: n }, (_, i) => ({ type: 'codex', accessToken: 'x', accountId: `${prefix}-${i}` }));
+}
+
+/** 调度并立即占用名额（与 proxy.js 在同一事件循环内 beginAccountRequest 的用法一致） */
+function take(scheduler, opts) {
+  const auth = scheduler(opts);
+  if (auth) beginAccountRequest(auth.accountId);
+  return auth;
+}
+
+test('never returns an account that is at its concurrency limit', () => {
+  const auths = makeAuths(2);
+  const scheduler = createScheduler(auths);
+  const taken = [take(scheduler), take(scheduler), take(scheduler), take(scheduler)];
+  assert.ok(taken.every(Boolean));
+  for (const a of auths) assert.equal(taken.filter((t) => t === a).length, ACCOUNT_SLOTS);
+  assert.equal(scheduler(), null);
+  endAccountRequest(taken[0].accountId, { ok: true });
+  assert.equal(take(scheduler), taken[0]);
+  assert.equal(scheduler(), null);
+});
+
+test('does not pile requests onto the only healthy account', () => {
+  const auths = makeAuths(3);
+  const scheduler = createScheduler(auths);
+  // 两个账号进入冷却
+  for (const a of auths.slice(1)) {
+    beginAccountRequest(a.accountId);
+    endAccountRequest(a.accountId, { ok: false, status: 429 });
+  }
+  assert.equal(countSchedulableAccounts(auths), 1);
+  assert.equal(take(scheduler), auths[0]);
+  assert.equal(take(scheduler), auths[0]);
+  assert.equal(scheduler(), null);
+});
+
+test('returns the earliest recovering account only when none is healthy', () => {
+  const auths = makeAuths(2);
+  const scheduler = createScheduler(auths);
+  for (const a of auths) {
+    beginAccountRequest(a.accountId);
+    endAccountRequest(a.accountId, { ok: false, status: 503 });
+  }
+  assert.equal(countSchedulableAccounts(auths), 0);
+  const probe = scheduler();
+  assert.ok(auths.includes(probe));
+});
+
+test('respects excluded accounts during failover', () => {
+  const auths = makeAuths(2);
+  const scheduler = createScheduler(auths);
+  const first = take(scheduler);
+  const second = take(scheduler, { exclude: new Set([first.accountId]) });
+  assert.notEqual(second, first);
+  take(scheduler, { exclude: new Set([first.accountId]) });
+  assert.equal(scheduler({ exclude: new Set([first.accountId]) }), null);
+});
+
+test('load reported by other workers counts towards the limit', () => {
+  const auths = makeAuths(1);
+  const scheduler = createScheduler(auths);
+  applyRemoteLoad(auths[0].accountId, 2);
+  assert.equal(scheduler(), null);
+  applyRemoteLoad(auths[0].accountId, 1);
+  assert.equal(take(scheduler), auths[0]);
+  assert.equal(scheduler(), null);
+});
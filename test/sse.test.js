@@ -0,0 +1,27 @@
+import { test } from 'node:test';
+import assert from 'node:assert/strict';
+import { SseParser, SSE_DONE } from '../src/sse.js';
+
+const enc = (s) => new TextEncoder().encode(s);
+
+test('filters by the top-level type, not a nested one serialized first', () => {
+  const parser = new SseParser({ types: ['response.completed'] });
+  const events = parser.push(enc([
+    'data: {"item":{"type":"response.completed"},"type":"response.output_item.done"}\n\n',
+    'data: {"response":{"type":"x"},"type":"response.completed"}\n\n',
+    'data: {"type":"response.output_text.delta","delta":"hi"}\n\n',
+    'data: [DONE]\n\n',
+  ].join('')));
+  assert.deepEqual(events, [{ response: { type: 'x' }, type: 'response.completed' }, SSE_DONE]);
+  assert.equal(parser.skipped, 2);
+});
+
+test('reassembles events split across chunks and keeps untyped payloads', () => {
+  const parser = new SseParser({ types: ['response.output_text.delta'] });
+  const text = 'event: response.output_text.delta\ndata: {"type":"response.output_text.delta","delta":"中"}\n\ndata: {"ok":true}\n\n';
+  const bytes = enc(text);
+  const out = [];
+  for (let i = 0; i < bytes.length; i += 7) out.push(...parser.push(bytes.subarray(i, i + 7)));
+  out.push(...parser.end());
+  assert.deepEqual(out, [{ type: 'response.output_text.delta', delta: '中' }, { ok: true }]);
+});
@@ -0,0 +1,30 @@
+import { test } from 'node:test';
+import assert from 'node:assert/strict';
+import { mkdtempSync, writeFileSync } from 'fs';
+import { tmpdir } from 'os';
+import { join } from 'path';
+
+// 最小词表：256 个单字节 + 「中」的两级合并（e4 b8 → e4 b8 ad）
+const dir = mkdtempSync(join(tmpdir(), 'codex-tokenizer-'));
+const file = join(dir, 'vocab.tiktoken');
+const entries = Array.from({ length: 256 }, (_, i) => Buffer.from([i]));
+entries.push(Buffer.from([0xe4, 0xb8]), Buffer.from('中'));
+writeFileSync(file, entries.map((b, rank) => `${b.toString('base64')} ${rank}`).join('\n'));
+process.env.CODEX_TOKENIZER_FILE = file;
+
+const { countTokens, loadTokenizer, getTokenizerStats } = await import('../src/tokenizer.js');
+
+test('estimates until the vocabulary has loaded, then counts exactly', async () => {
+  const text = 'abcdefgh'.repeat(8);
+  assert.equal(countTokens(text), 16);
+  assert.equal(await loadTokenizer(), true);
+  assert.equal(getTokenizerStats().exact, true);
+  // 词表中没有多字节合并，每个 ASCII 字节一个 token；加载前缓存的估算值不再使用
+  assert.equal(countTokens(text), 64);
+});
+
+test('long pieces are split on UTF-8 character boundaries', async () => {
+  await loadTokenizer();
+  // 300 字节的单个预分词片段，按 256 字节硬切会把一个字符拆成两半
+  assert.equal(countTokens('中'.repeat(100), { cache: false }), 100);
+});
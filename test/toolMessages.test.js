@@ -0,0 +1,41 @@
+import { test } from 'node:test';
+import assert from 'node:assert/strict';
+import { mkdtempSync } from 'fs';
+import { tmpdir } from 'os';
+import { join } from 'path';
+
+process.env.CODEX_DATA_DIR = mkdtempSync(join(tmpdir(), 'codex-tools-'));
+const { messagesToInput } = await import('../src/proxy.js');
+
+test('assistant tool_calls and tool results become function_call items in order', () => {
+  const input = messagesToInput([
+    { role: 'system', content: 'Use tools.' },
+    { role: 'user', content: 'Weather in Paris?' },
+    {
+      role: 'assistant',
+      content: 'Checking.',
+      tool_calls: [{ id: 'call_1', type: 'function', function: { name: 'get_weather', arguments: '{"city":"Paris"}' } }],
+    },
+    { role: 'tool', tool_call_id: 'call_1', content: '18°C, sunny' },
+    { role: 'user', content: 'Thanks' },
+  ]);
+  assert.deepEqual(input, [
+    {
+      type: 'message',
+      role: 'user',
+      content: [{ type: 'input_text', text: 'System: Use tools.\n\nUser: Weather in Paris?\nAssistant: Checking.' }],
+    },
+    { type: 'function_call', call_id: 'call_1', name: 'get_weather', arguments: '{"city":"Paris"}' },
+    { type: 'function_call_output', call_id: 'call_1', output: '18°C, sunny' },
+    { type: 'message', role: 'user', content: [{ type: 'input_text', text: 'User: Thanks' }] },
+  ]);
+});
+
+test('object arguments are serialized and conversations without tools keep one message', () => {
+  const [call] = messagesToInput([
+    { role: 'assistant', content: null, tool_calls: [{ id: 'c', function: { name: 'f', arguments: { a: 1 } } }] },
+  ]);
+  assert.equal(call.arguments, '{"a":1}');
+  const plain = messagesToInput([{ role: 'user', content: 'hi' }, { role: 'assistant', content: 'hello' }]);
+  assert.deepEqual(plain, [{ type: 'message', role: 'user', content: [{ type: 'input_text', text: 'User: hi\nAssistant: hello' }] }]);
+});